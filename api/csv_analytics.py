@@ -1,109 +1,507 @@
 from fastapi import APIRouter, UploadFile, File, Form, Query
 from fastapi.responses import JSONResponse
-from io import StringIO
+import numpy as np
 import pandas as pd
 import json
-import traceback
+import os
 
-from models.models import AnalyzeCsvRequest, FiltersResponse, UploadResponse
-from services.csv_parser import clean_dataframe
-from usecases.csv_analyze_deals import apply_filters, compute_summary, find_column
-from services.file_cache import store_dataframe, get_dataframe
+from api.uploads import spool_upload
+from models.models import (
+    AnalyzeCsvBatchRequest, AnalyzeCsvRequest, ExportCsvRequest, FiltersResponse, TrendCsvRequest,
+    UploadResponse, UpsertResponse
+)
+from services.csv_parser import parse_and_clean_csv
+from usecases.aggregation import requested
+from usecases.csv_analyze_deals import (
+    SUMMARY_METRICS, apply_filters, canonical_filters, compute_summary, filter_mask, resolve_summary_region_col,
+    validate_metrics
+)
+from usecases.csv_upsert import ID_COLUMN, apply_rows, upsert_delta, upsert_rows
+from usecases.filter_metadata import build_csv_metadata, update_csv_metadata
+from usecases.olap_cube import (
+    DATE_DIMENSION, build_cube, can_answer, describe_cube, split_metrics, summary_from_cube, update_cube
+)
+from usecases.trend import compute_trend, trend_from_cube, validate_bucket
+from services.file_cache import (
+    store_dataframe, get_dataframe, get_file_version, get_metadata, store_metadata, get_cube, store_cube,
+    entry_lock, find_by_content, register_content, remove_aliases, open_table, segment_table, store_segment, table_rows
+)
+from services.result_cache import CACHE_HEADER, make_key, result_cache
+from services.executor import ExecutorRejected, executor
+from services.log import get_logger
+from services.metrics import record_rows, stage
+from services.row_export import (
+    VersionChanged, check_version, decode_cursor, encode_cursor, export_response, open_and_select, select_rows,
+    validate_export
+)
 
 router = APIRouter()
+log = get_logger("csv")
+
+MAX_BATCH_ITEMS = 50
+
+def run_upload_csv(path: str) -> tuple[str, dict]:
+    # Выполняется в процессе пула
+    conversion: dict = {}
+    df = parse_and_clean_csv(path, conversion)
+    file_id = store_dataframe(df)
+    with stage("build_metadata"):
+        meta = build_csv_metadata(df)
+    meta["conversion"] = conversion
+    with stage("build_cube"):
+        cube = build_cube(df)
+    store_cube(file_id, cube)
+    meta["cube"] = describe_cube(cube)
+    store_metadata(file_id, meta)
+    log.info("upload.csv", file_id=file_id, rows=len(df), cube_rows=len(cube))
+    return file_id, conversion
 
 @router.post("/upload_csv")
 async def upload_csv(file: UploadFile = File(...)):
+    path = None
     try:
-        content = (await file.read()).decode("utf-8")
-        df = pd.read_csv(
-            StringIO(content),
-            sep=";",
-            encoding="utf-8",
-            quotechar='"',
-            escapechar='\\',
-            doublequote=False,
-            engine="python",
-            on_bad_lines="warn"
-        )
-        df.columns = df.columns.str.strip()
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].str.replace(r'\\"', '"', regex=True)
-                df[col] = df[col].str.replace(r'\\', '', regex=True)
-
-        df = clean_dataframe(df)
-        file_id = store_dataframe(df)
-        print(f"[UPLOAD] CSV загружен, строк: {len(df)}, file_id: {file_id}")
+        path, digest = await spool_upload(file, ".csv")
+
+        # Тот же файл уже загружали — отдаём готовую запись, не разбирая заново
+        file_id = find_by_content("csv", digest)
+        if file_id is not None:
+            log.info("upload.csv_deduplicated", file_id=file_id)
+            meta = get_metadata(file_id) or {}
+            return UploadResponse(status="ok", file_id=file_id, conversion=meta.get("conversion"))
+
+        file_id, conversion = await executor.run(run_upload_csv, path)
+        register_content("csv", digest, file_id)
         
-        return UploadResponse(status="ok", file_id=file_id)
+        return UploadResponse(status="ok", file_id=file_id, conversion=conversion)
 
+    except ExecutorRejected:
+        # Ответ 429/503 формирует обработчик в main.py
+        raise
     except Exception as e:
-        print(f"[UPLOAD] Ошибка: {str(e)}")
+        log.exception("upload.csv_failed", error=str(e))
         return JSONResponse(content={"error": str(e)}, status_code=500)
+    finally:
+        if path:
+            os.remove(path)
 
-@router.get("/filters_csv", response_model=FiltersResponse)
-def get_available_filters(file_id: str, region_col: str = Query(None)):
+def run_upsert_csv(file_id: str, path: str) -> dict:
+    # Выполняется в процессе пула. Таблица не загружается: из неё читаются
+    # колонка ID и заменяемые строки, изменения дописываются сегментом —
+    # O(размер дельты); метаданные обновляются по изменённым строкам, куб —
+    # слиянием с их вкладом (O(размер куба)). Если колонкам нужен более общий
+    # тип, таблица перезаписывается целиком
+    with entry_lock(file_id):
+        opened = open_table(file_id)
+        if opened is None:
+            raise FileNotFoundError("file_id не найден")
+        table, _ = opened
+
+        conversion: dict = {}
+        delta = parse_and_clean_csv(path, conversion)
+        with stage("upsert_rows"):
+            changes = upsert_delta(
+                table_rows(table, []),
+                lambda: table.column(ID_COLUMN).to_pandas(),
+                lambda rows: table_rows(table, rows),
+                delta,
+            )
+            segment = segment_table(file_id, changes[1]) if changes is not None else None
+            if segment is not None:
+                removed, added = changes
+                load = lambda columns: apply_rows(
+                    get_dataframe(file_id, columns=columns), added if columns is None else added[columns]
+                )
+            else:
+                df, removed, added = upsert_rows(get_dataframe(file_id), delta)
+                load = lambda columns: df if columns is None else df[columns]
+        record_rows("upsert_delta", len(delta))
+
+        meta = load_csv_metadata(file_id)
+        with stage("update_metadata"):
+            meta = update_csv_metadata(meta, removed, added, load)
+        cube = get_cube(file_id)
+        with stage("update_cube"):
+            cube = update_cube(cube, removed, added, load) if cube is not None else build_cube(load(None))
+
+        # Куб — раньше таблицы: ответ по новому кубу не попадёт в кэш под старой версией таблицы
+        store_cube(file_id, cube)
+        if segment is not None:
+            store_segment(file_id, segment)
+        else:
+            store_dataframe(df, file_id=file_id)
+        meta["cube"] = describe_cube(cube)
+        store_metadata(file_id, meta)
+        # Содержимое больше не совпадает с исходной загрузкой
+        remove_aliases(file_id)
+
+    inserted = len(added) - len(removed)
+    rows = table.num_rows + inserted
+    log.info("upsert.csv", file_id=file_id, rows=rows, inserted=inserted, updated=len(removed), rewritten=segment is None)
+    return {"rows": rows, "inserted": inserted, "updated": len(removed), "conversion": conversion}
+
+@router.post("/upsert_csv", response_model=UpsertResponse)
+async def upsert_csv(file_id: str = Form(...), file: UploadFile = File(...)):
+    """Обновляет загруженный CSV дельтой: строки с известным ID заменяются, новые — добавляются.
+
+    Изменённые строки дописываются к таблице сегментом, метаданные фильтров и
+    куб обновляются по ним же; целиком таблица перезаписывается, только если
+    колонкам нужен более общий тип.
+    """
+    path = None
     try:
+        path, _ = await spool_upload(file, ".csv")
+        result = await executor.run(run_upsert_csv, file_id, path)
+        return UpsertResponse(status="ok", file_id=file_id, **result)
+
+    except ExecutorRejected:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except Exception as e:
+        log.exception("upsert.csv_failed", file_id=file_id, error=str(e))
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+    finally:
+        if path:
+            os.remove(path)
+
+def load_csv_metadata(file_id: str) -> dict | None:
+    meta = get_metadata(file_id)
+    if meta is None:
+        # Файлы, загруженные до появления метаданных, индексируем при первом обращении
         df = get_dataframe(file_id)
-        print(f"[FILTERS] Получен запрос на фильтры для file_id: {file_id}")
         if df is None:
-            return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
+            return None
+        meta = build_csv_metadata(df)
+        store_metadata(file_id, meta)
+    return meta
 
-        print(f"[FILTERS] Строк: {len(df)}")
+def column_values(file_id: str, meta: dict, column: str | None) -> list:
+    if not column:
+        return []
+    if column in meta["filters"]:
+        return meta["filters"][column].get("values", [])
+    # Колонки вне индекса читаем с диска по одной
+    df = get_dataframe(file_id, columns=[column])
+    if df is None or column not in df.columns:
+        return []
+    return sorted(df[column].dropna().unique().tolist())
 
-        region_columns = [col for col in df.columns if "Регион" in col]
-        selected_col = region_col if region_col in df.columns else find_column(df, "Регион")
-        deal_type_col = next((col for col in df.columns if col.strip() == "Тип сделки"), None)
+@router.get("/filters_csv", response_model=FiltersResponse)
+def get_available_filters(file_id: str, region_col: str = Query(None)):
+    try:
+        with stage("load_metadata"):
+            meta = load_csv_metadata(file_id)
+        if meta is None:
+            return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
+
+        columns = meta["columns"]
+        region_columns = [col for col in columns if "Регион" in col]
+        selected_col = region_col if region_col in columns else next((c for c in columns if c.strip().startswith("Регион")), None)
+        deal_type_col = next((col for col in columns if col.strip() == "Тип сделки"), None)
 
-        print("[FILTERS] Выбранная колонка региона:", selected_col)
+        log.info("filters.csv", file_id=file_id, rows=meta["rows"], region_col=selected_col)
 
         result = FiltersResponse(
-            regions=sorted(df[selected_col].dropna().unique().tolist()) if selected_col else [],
+            regions=column_values(file_id, meta, selected_col),
             region_columns=region_columns,
-            statuses=sorted(df["Текущий статус"].dropna().unique().tolist()) if "Текущий статус" in df else [],
-            stages=sorted(df["Стадия сделки"].dropna().unique().tolist()) if "Стадия сделки" in df else [],
-            responsibles=sorted(df["Ответственный"].dropna().unique().tolist()) if "Ответственный" in df else [],
-            funnels=sorted(df["Воронка"].dropna().unique().tolist()) if "Воронка" in df else [],
-            deals_type=sorted(df[deal_type_col].dropna().unique().tolist()) if deal_type_col else [],
+            statuses=column_values(file_id, meta, "Текущий статус" if "Текущий статус" in columns else None),
+            stages=column_values(file_id, meta, "Стадия сделки" if "Стадия сделки" in columns else None),
+            responsibles=column_values(file_id, meta, "Ответственный" if "Ответственный" in columns else None),
+            funnels=column_values(file_id, meta, "Воронка" if "Воронка" in columns else None),
+            deals_type=column_values(file_id, meta, deal_type_col),
         )
 
         return result
     except Exception as e:
-        print(f"[FILTERS] Ошибка: {e}")
+        log.exception("filters.csv_failed", file_id=file_id, error=str(e))
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @router.get("/regions_csv")
 def get_regions_csv(file_id: str, region_col: str = Query(...)):
-    df = get_dataframe(file_id)
-    if df is None or region_col not in df.columns:
+    meta = load_csv_metadata(file_id)
+    if meta is None or region_col not in meta["columns"]:
         return JSONResponse(content={"regions": []}, status_code=200)
-    regions = sorted(df[region_col].dropna().unique().tolist())
-    return {"regions": regions}
+    return {"regions": column_values(file_id, meta, region_col)}
+
+def run_cube_summary(file_id: str, filters: dict, metrics: list | None) -> tuple[dict, list] | None:
+    # Метрики, которые считаются по кубу, и список остальных — их считают по
+    # строкам (merge_summary); None — по кубу не считается ничего
+    meta = get_metadata(file_id)
+    if not meta or "cube" not in meta:
+        return None
+    from_cube, rest = split_metrics(meta["cube"], meta["columns"], filters, metrics)
+    if not from_cube:
+        return None
+    cube = get_cube(file_id)
+    if cube is None:
+        return None
+
+    with stage("cube_summary"):
+        summary = summary_from_cube(cube, filters, from_cube)
+    record_rows("cube", len(cube))
+    log.info("analyze.csv_cube", file_id=file_id, cube_rows=len(cube), metrics=from_cube, rest=rest)
+    with stage("encode_json"):
+        return json.loads(json.dumps(summary, allow_nan=False)), rest
+
+def merge_summary(cube_part: dict, rows_part: dict, metrics: list | None) -> dict:
+    # Порядок метрик — как в compute_summary
+    merged = {**cube_part, **rows_part}
+    return {name: merged[name] for name in requested(SUMMARY_METRICS, metrics)}
+
+def summarize_frame(
+    df: pd.DataFrame,
+    filters: dict,
+    metrics: list | None,
+    columns: list | None = None,
+    memo: dict | None = None
+) -> dict:
+    filters_dict = filters
+    rows_total = len(df)
+
+    with stage("filter"):
+        df = apply_filters(df, filters_dict, memo)
+    record_rows("filtered", len(df))
+    log.info("analyze.csv", filters=filters_dict, rows=rows_total, rows_filtered=len(df))
+
+    with stage("aggregate"):
+        region_col = resolve_summary_region_col(df, filters_dict)
+        summary = compute_summary(df, filters_dict, region_col, metrics, columns)
+    with stage("encode_json"):
+        return json.loads(json.dumps(summary, allow_nan=False))
+
+def run_analyze_csv(file_id: str, filters: dict, metrics: list | None = None, columns: list | None = None) -> dict | None:
+    # Выполняется в процессе пула; таблица берётся из кэша этого процесса
+    with stage("load_frame"):
+        df = get_dataframe(file_id)
+    if df is None:
+        return None
+    return summarize_frame(df, filters, metrics, columns)
+
+def run_analyze_csv_batch(file_id: str, items: list[tuple[dict, list | None, list | None]]) -> list[dict] | None:
+    # Таблица загружается один раз; маски одинаковых фильтров (регион, период...)
+    # общие для всех наборов. Ошибка одного набора не прерывает остальные
+    with stage("load_frame"):
+        df = get_dataframe(file_id)
+    if df is None:
+        return None
+
+    memo: dict = {}
+    results = []
+    for filters, metrics, columns in items:
+        try:
+            results.append({"status": "ok", "result": summarize_frame(df, filters, metrics, columns, memo)})
+        except Exception as e:
+            log.warning("analyze.csv_batch_item_failed", filters=filters, error=str(e))
+            results.append({"status": "error", "error": str(e)})
+    return results
+
+def analyze_csv_cache_key(
+    file_id: str,
+    version: tuple | None,
+    filters: dict,
+    metrics: list | None,
+    columns: list | None = None
+) -> tuple | None:
+    if not version:
+        return None
+    params = [canonical_filters(filters), sorted(set(metrics)) if metrics is not None else None, columns or None]
+    return make_key("analyze_csv", file_id, version, params)
 
 @router.post("/analyze_csv")
 async def analyze_csv(payload: AnalyzeCsvRequest):
     file_id = payload.file_id
     filters = payload.filters
+    metrics = payload.metrics
+    columns = payload.columns
+    try:
+        validate_metrics(metrics)
+
+        # Одинаковые запросы к неизменившемуся файлу отдаём из кэша результатов
+        cache_key = analyze_csv_cache_key(file_id, get_file_version(file_id), filters, metrics, columns)
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return JSONResponse(content=cached, status_code=200, headers={CACHE_HEADER: "HIT"})
+
+        # Куб маленький — считаем по нему прямо здесь, без пула процессов
+        # (статистики колонок по кубу не посчитать); в пул уходят только
+        # метрики, которых по кубу не посчитать
+        cube_part, rest = (run_cube_summary(file_id, filters, metrics) if not columns else None) or (None, metrics)
+        content = cube_part
+        if cube_part is None or rest:
+            content = await executor.run(run_analyze_csv, file_id, filters, rest, columns)
+            if content is not None and cube_part is not None:
+                content = merge_summary(cube_part, content, metrics)
+        if content is None:
+            return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
+
+        if cache_key:
+            result_cache.put(cache_key, content)
+        return JSONResponse(content=content, status_code=200, headers={CACHE_HEADER: "MISS"})
+
+    except ExecutorRejected:
+        raise
+    except Exception as e:
+        log.exception("analyze.csv_failed", file_id=file_id, error=str(e))
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+@router.post("/analyze_csv_batch")
+async def analyze_csv_batch(payload: AnalyzeCsvBatchRequest):
+    file_id = payload.file_id
+    if len(payload.items) > MAX_BATCH_ITEMS:
+        return JSONResponse(content={"error": f"Не больше {MAX_BATCH_ITEMS} наборов фильтров за запрос"}, status_code=400)
+
     try:
+        version = get_file_version(file_id)
+        results: list[dict | None] = [None] * len(payload.items)
+        cache_keys: list[tuple | None] = [None] * len(payload.items)
+        # Наборы, которые досчитываются по строкам: метрики для пула и уже посчитанное по кубу
+        pending: dict[int, tuple[list | None, dict | None]] = {}
+
+        # Сначала всё, что отвечается без таблицы: кэш результатов и куб
+        for i, item in enumerate(payload.items):
+            try:
+                validate_metrics(item.metrics)
+                cache_keys[i] = analyze_csv_cache_key(file_id, version, item.filters, item.metrics, item.columns)
+                content = result_cache.get(cache_keys[i]) if cache_keys[i] else None
+                if content is not None:
+                    results[i] = {"status": "ok", "result": content}
+                    continue
+                cube_part, rest = (
+                    run_cube_summary(file_id, item.filters, item.metrics) if not item.columns else None
+                ) or (None, item.metrics)
+                if cube_part is not None and not rest:
+                    results[i] = {"status": "ok", "result": cube_part}
+                else:
+                    pending[i] = (rest, cube_part)
+            except Exception as e:
+                results[i] = {"status": "error", "error": str(e)}
+
+        # Остальные наборы считаются одной задачей пула по одной загрузке таблицы
+        if pending:
+            items = [(payload.items[i].filters, rest, payload.items[i].columns) for i, (rest, _) in pending.items()]
+            computed = await executor.run(run_analyze_csv_batch, file_id, items)
+            if computed is None:
+                return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
+            for (i, (_, cube_part)), result in zip(pending.items(), computed):
+                if result["status"] == "ok" and cube_part is not None:
+                    result = {"status": "ok", "result": merge_summary(cube_part, result["result"], payload.items[i].metrics)}
+                results[i] = result
+
+        for key, result in zip(cache_keys, results):
+            if key and result["status"] == "ok":
+                result_cache.put(key, result["result"])
+
+        return JSONResponse(content={"results": results}, status_code=200)
+
+    except ExecutorRejected:
+        raise
+    except Exception as e:
+        log.exception("analyze.csv_batch_failed", file_id=file_id, error=str(e))
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+
+def run_cube_trend(file_id: str, filters: dict, bucket: str) -> dict | None:
+    # Помесячная динамика по кубу; None — нужен расчёт по строкам
+    meta = get_metadata(file_id)
+    if bucket != "month" or not meta or "cube" not in meta or DATE_DIMENSION not in meta["cube"]["dimensions"]:
+        return None
+    if not can_answer(meta["cube"], meta["columns"], filters, ["total_deals", "total_amount"]):
+        return None
+    cube = get_cube(file_id)
+    if cube is None:
+        return None
+
+    with stage("cube_trend"):
+        trend = trend_from_cube(cube, filters)
+    record_rows("cube", len(cube))
+    log.info("trend.csv_cube", file_id=file_id, cube_rows=len(cube), points=len(trend["points"]))
+    return trend
+
+def run_trend_csv(file_id: str, filters: dict, bucket: str) -> dict | None:
+    # Выполняется в процессе пула; индекс даты строится один раз на таблицу из кэша
+    with stage("load_frame"):
         df = get_dataframe(file_id)
-        if df is None:
+    if df is None:
+        return None
+    with stage("trend"):
+        trend = compute_trend(df, filters, bucket)
+    log.info("trend.csv", file_id=file_id, rows=len(df), bucket=bucket, points=len(trend["points"]))
+    with stage("encode_json"):
+        return json.loads(json.dumps(trend, allow_nan=False))
+
+@router.post("/trend_csv")
+async def trend_csv(payload: TrendCsvRequest):
+    """Число сделок и сумма по дням, неделям или месяцам даты создания."""
+    file_id = payload.file_id
+    try:
+        validate_bucket(payload.bucket)
+
+        version = get_file_version(file_id)
+        cache_key = make_key("trend_csv", file_id, version, [canonical_filters(payload.filters), payload.bucket]) if version else None
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return JSONResponse(content=cached, status_code=200, headers={CACHE_HEADER: "HIT"})
+
+        content = run_cube_trend(file_id, payload.filters, payload.bucket)
+        if content is None:
+            content = await executor.run(run_trend_csv, file_id, payload.filters, payload.bucket)
+        if content is None:
             return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
 
-        filters_dict = filters
-        print(f"[ANALYZE CSV] filters: {filters_dict}")
+        if cache_key:
+            result_cache.put(cache_key, content)
+        return JSONResponse(content=content, status_code=200, headers={CACHE_HEADER: "MISS"})
+
+    except ExecutorRejected:
+        raise
+    except Exception as e:
+        log.exception("trend.csv_failed", file_id=file_id, error=str(e))
+        return JSONResponse(content={"error": str(e)}, status_code=400)
 
-        df = apply_filters(df, filters_dict)
-        print(f"[ANALYZE CSV] строк после фильтрации: {len(df)}")
+def run_export_csv_rows(
+    file_id: str, filters: dict, cursor: int | None, limit: int | None, version: tuple[int, int]
+) -> tuple[np.ndarray, int | None] | None:
+    # Выполняется в процессе пула; возвращает только номера строк страницы,
+    # сами строки читает из уже открытой таблицы обработчик запроса
+    with stage("load_frame"):
+        df = get_dataframe(file_id)
+    if df is None:
+        return None
+    # Номера строк должны относиться к версии, открытой обработчиком
+    check_version(version, get_file_version(file_id))
+    with stage("filter"):
+        mask = filter_mask(df, filters)
+    rows, next_cursor = select_rows(mask, cursor, limit)
+    log.info("export.csv", file_id=file_id, rows=len(df), rows_selected=len(rows), cursor=cursor)
+    return rows, next_cursor
 
-        region_col = filters_dict.get("region_col")
-        if not region_col or region_col not in df.columns or df[region_col].isna().all():
-            region_col = "Регион (гарантирование)" if "Регион (гарантирование)" in df.columns else None
+@router.post("/export_csv")
+async def export_csv(payload: ExportCsvRequest):
+    """Строки, прошедшие фильтры /analyze_csv, потоком в CSV или NDJSON."""
+    file_id = payload.file_id
+    try:
+        meta = load_csv_metadata(file_id)
+        if meta is None:
+            return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
+        start, cursor_version = decode_cursor(payload.cursor)
+        validate_export(payload.format, payload.columns, meta["columns"], start, payload.limit)
 
-        summary = compute_summary(df, filters_dict, region_col)
-        return JSONResponse(content=json.loads(json.dumps(summary, allow_nan=False)), status_code=200)
+        selected = await open_and_select(
+            lambda: open_table(file_id, columns=payload.columns),
+            lambda version: executor.run(run_export_csv_rows, file_id, payload.filters, start, payload.limit, version),
+            cursor_version,
+        )
+        if selected is None or selected[2] is None:
+            return JSONResponse(content={"error": "file_id не найден"}, status_code=400)
 
+    except ExecutorRejected:
+        raise
+    except VersionChanged as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
     except Exception as e:
-        print("[ANALYZE CSV] Ошибка:")
-        traceback.print_exc()
+        log.exception("export.csv_failed", file_id=file_id, error=str(e))
         return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    table, version, (rows, next_cursor) = selected
+    next_cursor = encode_cursor(next_cursor, version) if next_cursor is not None else None
+    return export_response(table, rows, payload.format, next_cursor, file_id)
@@ -1,114 +1,285 @@
-from io import BytesIO
-from fastapi import APIRouter, UploadFile
+from fastapi import APIRouter, Response, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from typing import List
-import pandas as pd
+import asyncio
+import numpy as np
+import os
 
+from api.uploads import spool_upload
 from services.excel_parser import (
-    get_valid_excel_sheets,
-    parse_excel_sheet_with_filters,
-    read_excel_sheet
+    build_excel_sheet,
+    canonical_excel_filters,
+    get_excel_sheet,
+    excel_filter_mask,
+    get_valid_excel_sheets
 )
 from services.file_cache import (
-    store_raw_excel,
-    get_raw_excel_bytes
+    store_raw_excel_file, get_file_version, get_metadata, get_raw_excel_path, store_metadata,
+    find_by_content, register_content, open_table, delete_entry
 )
-from models.models import ExcelFilterRequest, AnalyzeExcelRequest
+from services.executor import ExecutorRejected, executor
+from services.result_cache import CACHE_HEADER, make_key, result_cache
+from services.log import get_logger
+from services.metrics import record_rows, stage
+from services.row_export import (
+    VersionChanged, check_version, decode_cursor, encode_cursor, export_response, open_and_select, select_rows,
+    validate_export
+)
+from usecases.aggregation import validate_columns
+from usecases.excel_analyze_deals import (
+    compute_summary, finalize_summary, merge_partials, partial_summary, summary_source_columns, validate_metrics
+)
+from usecases.filter_metadata import build_excel_filters, build_excel_sheet_metadata
+from models.models import ExcelFilterRequest, AnalyzeExcelRequest, AnalyzeWorkbookRequest, ExportExcelRequest
 
 router = APIRouter()
+log = get_logger("excel")
+
+def run_build_excel_sheet(file_id: str, sheet_name: str) -> dict:
+    # Выполняется в процессе пула: каждый лист разбирается отдельной задачей
+    conversion: dict = {}
+    df = build_excel_sheet(file_id, sheet_name, conversion)
+    with stage("build_metadata"):
+        return build_excel_sheet_metadata(df, sheet_name, conversion)
 
 @router.post("/list_excel_sheets")
-def list_excel_sheets(file: UploadFile):
-    content = file.file.read()
-    file_id = store_raw_excel(content)
+async def list_excel_sheets(file: UploadFile):
+    path, digest = await spool_upload(file, ".xlsx")
+    try:
+        # Та же книга уже загружена и разобрана — отвечаем по её метаданным
+        file_id = find_by_content("excel", digest)
+        meta = get_metadata(file_id) if file_id else None
+        if meta is not None:
+            log.info("upload.excel_deduplicated", file_id=file_id)
+            sheets = meta["sheets"]
+            return {
+                "file_id": file_id,
+                "sheets": list(sheets),
+                "conversion": {sheet: meta.get("conversion") for sheet, meta in sheets.items()},
+            }
+        file_id = store_raw_excel_file(path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
 
-    buffer = BytesIO(content)
-    excel = pd.ExcelFile(buffer)
-    sheet_names = get_valid_excel_sheets(excel)
+    # Имена листов — из метаданных книги; сами листы разбираются параллельно,
+    # один раз здесь, дальше фильтры и анализ читают кэш
+    jobs = []
+    try:
+        sheet_names = get_valid_excel_sheets(get_raw_excel_path(file_id))
+        jobs = [asyncio.ensure_future(executor.run(run_build_excel_sheet, file_id, sheet)) for sheet in sheet_names]
+        sheets_meta = await asyncio.gather(*jobs)
+    except BaseException:
+        # Лист не разобран (пул отклонил задачу, таймаут, ошибка разбора) — запись
+        # без метаданных не нужна. Остальные листы дожидаемся: задача, уже
+        # выполняемая в пуле, иначе записала бы лист после удаления записи
+        await asyncio.gather(*jobs, return_exceptions=True)
+        delete_entry(file_id)
+        log.warning("upload.excel_failed", file_id=file_id)
+        raise
+    store_metadata(file_id, {"sheets": dict(zip(sheet_names, sheets_meta))})
+    register_content("excel", digest, file_id)
 
     return {
         "file_id": file_id,
         "sheets": sheet_names,
+        "conversion": {sheet: meta["conversion"] for sheet, meta in zip(sheet_names, sheets_meta)},
     }
 
 @router.post("/get_excel_filters")
 def get_excel_filters(req: ExcelFilterRequest):
-    buffer = get_raw_excel_bytes(req.file_id)
-    sheet_df = read_excel_sheet(buffer, req.sheet_name)
-
-    if sheet_df.empty:
-        return {"error": "Пустой лист"}
-
-    filters = {}
-
-    # Регион или Область
-    if req.sheet_name in ["Действующие", "Завершенные"]:
-        region_col = "Регион"
-    elif req.sheet_name in ["На модерации", "Отозванные"]:
-        region_col = "Область"
-    else:
-        region_col = None
-
-    if region_col and region_col in sheet_df.columns:
-        raw_values = sheet_df[region_col].dropna().unique().tolist()
-        filters["region"] = {
-            "type": "select",
-            "values": sorted([str(v) for v in raw_values])
-        }
-
-    # Застройщик
-    if "Застройщик" in sheet_df.columns:
-        devs = sheet_df["Застройщик"].dropna().unique().tolist()
-        filters["developer"] = {
-            "type": "select",
-            "values": sorted(devs)
-        }
-
-    # Площадь
-    area_col = None
-    if req.sheet_name in ["Действующие", "Завершенные"]:
-        area_col = "Площадь, кв.м по Проекту"
-    elif req.sheet_name in ["На модерации", "Отозванные"]:
-        area_col = "Площадь"
-
-    if area_col and area_col in sheet_df.columns:
-        area_vals = pd.to_numeric(sheet_df[area_col], errors="coerce").dropna()
-        if not area_vals.empty:
-            filters["area"] = {
-                "type": "range",
-                "min": float(area_vals.min()),
-                "max": float(area_vals.max())
-            }
+    meta = get_metadata(req.file_id)
+    if meta is not None and req.sheet_name in meta["sheets"]:
+        return meta["sheets"][req.sheet_name]["filters"]
+
+    # Метаданных нет (старая загрузка или лист вне VALID_SHEETS) — считаем по листу
+    sheet_df = get_excel_sheet(req.file_id, req.sheet_name, columns="used")
+    return build_excel_filters(sheet_df, req.sheet_name)
+
+def run_analyze_excel(
+    file_id: str,
+    sheet_name: str,
+    filters: dict,
+    metrics: list | None = None,
+    columns: list | None = None
+) -> dict:
+    # Выполняется в процессе пула: с диска читаются только колонки фильтров,
+    # сводки и запрошенные для column_stats
+    with stage("load_frame"):
+        df_sheet = get_excel_sheet(file_id, sheet_name, columns="used", extra=columns)
+    validate_columns(columns, list(df_sheet.columns))
+
+    with stage("filter"):
+        mask = excel_filter_mask(df_sheet, sheet_name, filters)
+        # Из выборки берём только колонки, которые читают запрошенные метрики
+        df_filtered = df_sheet.loc[mask, summary_source_columns(list(df_sheet.columns), metrics, columns)]
+    record_rows("filtered", len(df_filtered))
+    log.info("analyze.excel", file_id=file_id, sheet=sheet_name, rows=len(df_sheet), rows_filtered=len(df_filtered))
+
+    with stage("aggregate"):
+        summary = compute_summary(df_filtered, metrics, columns)
+    with stage("encode_json"):
+        return jsonable_encoder({
+            "rows_total": len(df_sheet),
+            "rows_filtered": len(df_filtered),
+            "summary": summary
+        })
+
+@router.post("/analyze_excel")
+async def analyze_excel(req: AnalyzeExcelRequest, response: Response):
+    try:
+        validate_metrics(req.metrics)
+        version = get_file_version(req.file_id, req.sheet_name)
+        params = [
+            canonical_excel_filters(req.filters),
+            sorted(set(req.metrics)) if req.metrics is not None else None,
+            req.columns or None,
+        ]
+        cache_key = make_key("analyze_excel", req.file_id, (req.sheet_name, version), params) if version else None
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            response.headers[CACHE_HEADER] = "HIT"
+            return cached
+
+        result = await executor.run(
+            run_analyze_excel, req.file_id, req.sheet_name, req.filters, req.metrics, req.columns
+        )
+    except ExecutorRejected:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
 
-    # Период (только для Действующие и Завершённые)
-    if req.sheet_name in ["Действующие", "Завершенные"]:
-        date_start_col = "Дата начала строительства"
-        date_end_col = "Дата завершения 2"
+    if cache_key:
+        result_cache.put(cache_key, result)
+    response.headers[CACHE_HEADER] = "MISS"
+    return result
 
-        if date_start_col in sheet_df.columns and date_end_col in sheet_df.columns:
-            date_start = pd.to_datetime(sheet_df[date_start_col], errors="coerce")
-            date_end = pd.to_datetime(sheet_df[date_end_col], errors="coerce")
+def run_analyze_workbook_sheet(file_id: str, sheet_name: str, filters: dict, metrics: list | None) -> dict:
+    # Выполняется в процессе пула, по задаче на лист. Возвращает частичные
+    # агрегаты листа, а не строки: листы не склеиваются и не копируются
+    with stage("load_frame"):
+        df_sheet = get_excel_sheet(file_id, sheet_name, columns="used")
 
-            valid_start = date_start.dropna()
-            valid_end = date_end.dropna()
+    with stage("filter"):
+        mask = excel_filter_mask(df_sheet, sheet_name, filters)
+        df_filtered = df_sheet.loc[mask, summary_source_columns(list(df_sheet.columns), metrics)]
+    record_rows("filtered", len(df_filtered))
 
-            if not valid_start.empty and not valid_end.empty:
-                filters["period"] = {
-                    "type": "date_range",
-                    "min": str(valid_start.min().date()),
-                    "max": str(valid_end.max().date())
+    with stage("aggregate"):
+        partial = partial_summary(df_filtered, metrics, sheet_name)
+    return {"rows_total": len(df_sheet), "rows_filtered": len(df_filtered), "partial": partial}
+
+def workbook_sheets(file_id: str) -> list[str]:
+    meta = get_metadata(file_id)
+    if meta is not None:
+        return list(meta["sheets"])
+    return get_valid_excel_sheets(get_raw_excel_path(file_id))
+
+@router.post("/analyze_excel_workbook")
+async def analyze_excel_workbook(req: AnalyzeWorkbookRequest, response: Response):
+    """Сводка по всем листам книги сразу и разбивка по листам."""
+    try:
+        validate_metrics(req.metrics)
+        available = workbook_sheets(req.file_id)
+        sheets = available if req.sheets is None else req.sheets
+        missing = [sheet for sheet in sheets if sheet not in available]
+        if missing:
+            raise ValueError(f"Нет листов: {', '.join(missing)}")
+
+        versions = [get_file_version(req.file_id, sheet) for sheet in sheets]
+        params = [canonical_excel_filters(req.filters), sorted(set(req.metrics)) if req.metrics is not None else None]
+        cache_key = make_key(
+            "analyze_excel_workbook", req.file_id, tuple(zip(sheets, versions)), params
+        ) if all(versions) else None
+        cached = result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            response.headers[CACHE_HEADER] = "HIT"
+            return cached
+
+        # Листы фильтруются и агрегируются параллельно, по задаче пула на лист
+        results = await asyncio.gather(*(
+            executor.run(run_analyze_workbook_sheet, req.file_id, sheet, req.filters, req.metrics)
+            for sheet in sheets
+        ))
+    except ExecutorRejected:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    with stage("merge"):
+        merged = merge_partials([r["partial"] for r in results])
+        result = jsonable_encoder({
+            "rows_total": sum(r["rows_total"] for r in results),
+            "rows_filtered": sum(r["rows_filtered"] for r in results),
+            "summary": finalize_summary(merged, req.metrics),
+            "sheets": {
+                sheet: {
+                    "rows_total": r["rows_total"],
+                    "rows_filtered": r["rows_filtered"],
+                    "summary": finalize_summary(r["partial"], req.metrics),
                 }
+                for sheet, r in zip(sheets, results)
+            },
+        })
+    log.info("analyze.excel_workbook", file_id=req.file_id, sheets=len(sheets), rows_filtered=result["rows_filtered"])
 
-    return filters
+    if cache_key:
+        result_cache.put(cache_key, result)
+    response.headers[CACHE_HEADER] = "MISS"
+    return result
 
-@router.post("/analyze_excel")
-def analyze_excel(req: AnalyzeExcelRequest):
-    buffer = get_raw_excel_bytes(req.file_id)
-    df_sheet = read_excel_sheet(buffer, req.sheet_name)
+def run_prepare_excel_sheet(file_id: str, sheet_name: str) -> None:
+    # Выполняется в процессе пула: собирает лист в кэш, если его там нет
+    with stage("load_frame"):
+        get_excel_sheet(file_id, sheet_name, columns="used")
 
-    df_filtered = parse_excel_sheet_with_filters(df_sheet, req.sheet_name, req.filters)
+def run_export_excel_rows(
+    file_id: str, sheet_name: str, filters: dict, cursor: int | None, limit: int | None, version: tuple[int, int]
+) -> tuple[np.ndarray, int | None]:
+    # Выполняется в процессе пула; номера строк — той версии листа, что открыл
+    # обработчик. Для фильтра хватает колонок фильтров, строки выгружаются целиком
+    with stage("load_frame"):
+        df_sheet = get_excel_sheet(file_id, sheet_name, columns="used")
+    check_version(version, get_file_version(file_id, sheet_name))
 
-    return {
-        "rows_total": len(df_sheet),
-        "rows_filtered": len(df_filtered),
-        "summary": df_filtered.describe(include="all").to_dict()
-    }
+    with stage("filter"):
+        mask = excel_filter_mask(df_sheet, sheet_name, filters)
+    rows, next_cursor = select_rows(mask, cursor, limit)
+    log.info("export.excel", file_id=file_id, sheet=sheet_name, rows=len(df_sheet), rows_selected=len(rows), cursor=cursor)
+    return rows, next_cursor
+
+@router.post("/export_excel")
+async def export_excel(req: ExportExcelRequest):
+    """Строки листа, прошедшие фильтры /analyze_excel, потоком в CSV или NDJSON."""
+    try:
+        start, cursor_version = decode_cursor(req.cursor)
+        validate_export(req.format, None, [], start, req.limit)
+        if get_file_version(req.file_id, req.sheet_name) is None:
+            await executor.run(run_prepare_excel_sheet, req.file_id, req.sheet_name)
+
+        # Выгружаются только листы, сохранённые в кэше (VALID_SHEETS)
+        selected = await open_and_select(
+            lambda: open_table(req.file_id, req.sheet_name),
+            lambda version: executor.run(
+                run_export_excel_rows, req.file_id, req.sheet_name, req.filters, start, req.limit, version
+            ),
+            cursor_version,
+        )
+        if selected is None:
+            return JSONResponse(content={"error": f"Лист '{req.sheet_name}' недоступен для выгрузки"}, status_code=400)
+        table, version, (rows, next_cursor) = selected
+        validate_export(req.format, req.columns, table.column_names, start, req.limit)
+
+    except ExecutorRejected:
+        raise
+    except VersionChanged as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
+    except Exception as e:
+        log.exception("export.excel_failed", file_id=req.file_id, sheet=req.sheet_name, error=str(e))
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    if req.columns is not None:
+        table = table.select(req.columns)
+    next_cursor = encode_cursor(next_cursor, version) if next_cursor is not None else None
+    return export_response(table, rows, req.format, next_cursor, f"{req.file_id}_{req.sheet_name}")
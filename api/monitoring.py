@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.cache_lifecycle import cache_usage
+from services.frame_cache import frame_cache
+from services.metrics import REGISTRY
+from services.result_cache import result_cache
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Текстовый формат Prometheus
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/cache_stats")
+def get_cache_stats():
+    # Каталог кэша на диске и кэши в памяти этого процесса
+    return {
+        "disk": cache_usage(),
+        "frames": frame_cache.stats(),
+        "results": result_cache.stats(),
+    }
@@ -0,0 +1,18 @@
+import hashlib
+import tempfile
+from fastapi import UploadFile
+
+from services.metrics import stage
+
+UPLOAD_READ_SIZE = 1024 * 1024
+
+async def spool_upload(file: UploadFile, suffix: str) -> tuple[str, str]:
+    """Пишет загрузку во временный файл; возвращает путь и sha256 содержимого."""
+    # Загрузку пишем на диск блоками, не держа весь файл в памяти;
+    # хэш считаем по тем же блокам — по нему находятся повторные загрузки
+    digest = hashlib.sha256()
+    with stage("upload_spool"), tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        while block := await file.read(UPLOAD_READ_SIZE):
+            tmp.write(block)
+            digest.update(block)
+        return tmp.name, digest.hexdigest()
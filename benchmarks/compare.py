@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+# Сравнение двух прогонов benchmarks.run или benchmarks.loadtest:
+#   python -m benchmarks.compare results/old.json results/new.json
+#   python -m benchmarks.compare results/load-old.json results/load-new.json --metric p95
+# Код возврата 1, если какой-то замер стал медленнее порога.
+
+
+def _load(path: str) -> tuple[dict, dict]:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    entries = {(r["benchmark"], r["rows"], r["case"]): r for r in report["results"]}
+    return report, entries
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимое замедление, доля")
+    parser.add_argument("--metric", default="best", help="какое время сравнивать: best, median или p95/p99 нагрузочного прогона")
+    args = parser.parse_args(argv)
+
+    base_report, base = _load(args.baseline)
+    new_report, new = _load(args.candidate)
+    print(f"{str(base_report.get('commit'))[:10]} -> {str(new_report.get('commit'))[:10]}")
+
+    regressions = 0
+    for key in sorted(base.keys() & new.keys(), key=lambda k: (k[1], k[0], k[2])):
+        old, cur = base[key], new[key]
+        if args.metric not in old or args.metric not in cur:
+            print(f"{key[0]:<32} {key[1]:>9} {key[2]:<18} нет {args.metric}")
+            continue
+        ratio = cur[args.metric] / old[args.metric] if old[args.metric] else float("inf")
+        memory = cur["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else float("inf")
+        flag = "REGRESSION" if ratio > 1 + args.threshold else ""
+        regressions += bool(flag)
+        print(
+            f"{key[0]:<32} {key[1]:>9} {key[2]:<18} "
+            f"{old[args.metric]:.4f}s -> {cur[args.metric]:.4f}s  x{ratio:.2f}  mem x{memory:.2f}  {flag}"
+        )
+
+    for key in sorted(base.keys() ^ new.keys(), key=str):
+        print(f"{key[0]:<32} {key[1]:>9} {key[2]:<18} есть только в {'baseline' if key in base else 'candidate'}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from services.excel_parser import EXCLUDED_SHEETS, HEADER_MAP, VALID_SHEETS
+
+# Детерминированные синтетические данные для бенчмарков: одинаковые seed и
+# число строк всегда дают один и тот же файл.
+
+CHUNK_ROWS = 100_000
+
+# Лимит строк на листе Excel
+EXCEL_MAX_ROWS = 1_048_576
+
+REGIONS = [
+    "Алматы", "Астана", "Шымкент", "Алматинская область", "Акмолинская область",
+    "Актюбинская область", "Атырауская область", "Восточно-Казахстанская область",
+    "Жамбылская область", "Западно-Казахстанская область", "Карагандинская область",
+    "Костанайская область", "Кызылординская область", "Мангистауская область",
+    "Павлодарская область", "Северо-Казахстанская область", "Туркестанская область",
+]
+STAGES = ["Новая", "Подготовка документов", "Проверка", "Согласование", "Сделка успешна", "Сделка провалена"]
+STATUSES = ["Новая", "В работе", "На паузе", "Закрыта"]
+FUNNELS = ["Основная", "Гарантирование", "Субсидирование"]
+DEAL_TYPES = ["Продажа", "Гарантия", "Субсидия", "Консультация"]
+COMPANY_FORMS = ["ТОО", "АО", "ИП"]
+COMMENTS = [
+    "",
+    "Клиент просит перезвонить",
+    'Документы по проекту "Жилой квартал" приняты',
+    "Ожидаем решение кредитного комитета; срок — до конца месяца",
+    'Повторный запрос по ЖК "Нурлы Жол"',
+]
+
+CSV_COLUMNS = [
+    "ID", "Название сделки", "Стадия сделки", "Воронка", "Текущий статус", "Ответственный",
+    "Компания", "Сумма", "Валюта", "Дата создания", "Дата изменения", "Дата начала",
+    "Предполагаемая дата закрытия", "Дата завершения", "Регион", "Регион (гарантирование)",
+    "Тип сделки", "Повторная сделка", "Повторное обращение",
+    "Дата регистрации заявления (субсидирование)",
+    "Стоимость незавершенного строительства (гарантирование)",
+    "Площадь ЗУ, га (гарантирование)",
+    "Цена реализации 1 кв.м жилья в тыс.тенге/1 м2 (гарантирование)",
+    "Комментарий",
+]
+
+EXCEL_COLUMNS = {
+    "Действующие": [
+        "№", "Регион", "Застройщик", "Наименование ЖК", "Площадь, кв.м по Проекту", "Стоимость",
+        "Дата начала строительства", "Дата завершения 2", "Дата завершения 2/Дата по АПОЭ",
+    ],
+    "Завершенные": [
+        "№", "Регион", "Застройщик", "Наименование ЖК", "Площадь, кв.м по Проекту", "Стоимость",
+        "Дата начала строительства", "Дата завершения 2", "Дата завершения 2/Дата по АПОЭ",
+    ],
+    "На модерации": ["№", "Область", "Застройщик", "Наименование ЖК", "Площадь", "Стоимость", "Дата подачи"],
+    "Отозванные": ["№", "Область", "Застройщик", "Наименование ЖК", "Площадь", "Стоимость", "Дата отзыва"],
+}
+
+# Доля строк книги на каждом листе
+EXCEL_SHEET_SHARE = {"Действующие": 0.4, "Завершенные": 0.3, "На модерации": 0.2, "Отозванные": 0.1}
+
+
+def _companies(rng: np.random.Generator, n: int) -> np.ndarray:
+    names = [f'{COMPANY_FORMS[i % 3]} "Компания {i + 1}"' for i in range(n)]
+    return np.array(names, dtype=object)
+
+def _zipf_choice(rng: np.random.Generator, values: np.ndarray, size: int) -> np.ndarray:
+    # Немногие крупные клиенты дают большую часть сделок
+    ranks = np.minimum(rng.zipf(1.3, size), len(values)) - 1
+    return values[ranks]
+
+def _dates(rng: np.random.Generator, size: int, start: str, days: int, empty: float) -> pd.Series:
+    seconds = rng.integers(0, days * 86400, size)
+    values = pd.Series(pd.Timestamp(start) + pd.to_timedelta(seconds, unit="s"))
+    return values.mask(rng.random(size) < empty)
+
+def _bitrix_dates(rng: np.random.Generator, dates: pd.Series) -> pd.Series:
+    # Битрикс выгружает дату со временем, но часть значений — только дата
+    with_time = dates.dt.strftime("%d.%m.%Y %H:%M:%S")
+    date_only = dates.dt.strftime("%d.%m.%Y")
+    return with_time.where(rng.random(len(dates)) < 0.85, date_only)
+
+def _flags(rng: np.random.Generator, size: int, share: float) -> np.ndarray:
+    return np.where(rng.random(size) < share, "Y", "N")
+
+def _numbers(rng: np.random.Generator, size: int, mean: float, sigma: float, empty: float) -> np.ndarray:
+    values = rng.lognormal(np.log(mean), sigma, size).round(2)
+    values[rng.random(size) < empty] = np.nan
+    return values
+
+def csv_chunk(start: int, rows: int, seed: int, companies: np.ndarray) -> pd.DataFrame:
+    rng = np.random.default_rng([seed, start])
+    ids = np.arange(start + 1, start + rows + 1)
+    region = rng.choice(REGIONS, rows)
+    # Регион гарантирования обычно совпадает с регионом сделки, но заполнен не всегда
+    guarantee_region = np.where(rng.random(rows) < 0.6, region, "")
+    created = _dates(rng, rows, "2022-01-01", 3 * 365, 0.0)
+    closed = (created + pd.to_timedelta(rng.integers(1, 180, rows), unit="D")).mask(rng.random(rows) < 0.4)
+
+    return pd.DataFrame({
+        "ID": ids,
+        "Название сделки": [f'Сделка №{i} по проекту "ЖК {i % 997}"' for i in ids],
+        "Стадия сделки": rng.choice(STAGES, rows, p=[0.2, 0.25, 0.2, 0.15, 0.12, 0.08]),
+        "Воронка": rng.choice(FUNNELS, rows, p=[0.5, 0.3, 0.2]),
+        "Текущий статус": rng.choice(STATUSES, rows),
+        "Ответственный": rng.choice([f"Менеджер {i}" for i in range(1, 41)], rows),
+        "Компания": _zipf_choice(rng, companies, rows),
+        "Сумма": _numbers(rng, rows, 5_000_000, 1.2, 0.05),
+        "Валюта": "KZT",
+        "Дата создания": _bitrix_dates(rng, created),
+        "Дата изменения": _bitrix_dates(rng, created + pd.to_timedelta(rng.integers(0, 30, rows), unit="D")),
+        "Дата начала": _bitrix_dates(rng, created),
+        "Предполагаемая дата закрытия": _bitrix_dates(rng, closed),
+        "Дата завершения": closed.dt.strftime("%d.%m.%Y"),
+        "Регион": region,
+        "Регион (гарантирование)": guarantee_region,
+        "Тип сделки": rng.choice(DEAL_TYPES, rows),
+        "Повторная сделка": _flags(rng, rows, 0.15),
+        "Повторное обращение": _flags(rng, rows, 0.25),
+        "Дата регистрации заявления (субсидирование)": _bitrix_dates(rng, _dates(rng, rows, "2022-01-01", 3 * 365, 0.7)),
+        "Стоимость незавершенного строительства (гарантирование)": _numbers(rng, rows, 300_000_000, 1.0, 0.6),
+        "Площадь ЗУ, га (гарантирование)": _numbers(rng, rows, 2.5, 0.8, 0.6),
+        "Цена реализации 1 кв.м жилья в тыс.тенге/1 м2 (гарантирование)": _numbers(rng, rows, 450, 0.3, 0.6),
+        "Комментарий": rng.choice(COMMENTS, rows),
+    }, columns=CSV_COLUMNS)
+
+def _csv_text(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk = chunk.copy()
+    for col in chunk.columns:
+        if chunk[col].dtype.kind == "f":
+            chunk[col] = chunk[col].map(lambda v: "" if v != v else f"{v:.2f}")
+    return chunk.fillna("")
+
+def generate_csv(path: str, rows: int, seed: int = 42) -> str:
+    """Выгрузка сделок в формате Битрикс: разделитель ';', кавычки экранированы '\\'."""
+    rng = np.random.default_rng(seed)
+    companies = _companies(rng, max(rows // 5, 10))
+    tmp_path = f"{path}.tmp"
+    # csv.writer, а не to_csv: pandas в режиме QUOTE_NONE не экранирует кавычки
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";", quoting=csv.QUOTE_NONE, escapechar="\\", doublequote=False)
+        writer.writerow(CSV_COLUMNS)
+        for start in range(0, rows, CHUNK_ROWS):
+            chunk = csv_chunk(start, min(CHUNK_ROWS, rows - start), seed, companies)
+            writer.writerows(_csv_text(chunk).itertuples(index=False, name=None))
+    os.replace(tmp_path, path)
+    return path
+
+def excel_sheet_rows(rows: int) -> dict[str, int]:
+    """Распределение строк по листам с учётом лимита строк Excel."""
+    result = {}
+    for sheet in VALID_SHEETS:
+        limit = EXCEL_MAX_ROWS - HEADER_MAP.get(sheet, 0) - 1
+        result[sheet] = min(int(rows * EXCEL_SHEET_SHARE[sheet]), limit)
+    return result
+
+def _excel_rows(sheet: str, rows: int, seed: int, developers: np.ndarray):
+    rng = np.random.default_rng([seed, VALID_SHEETS.index(sheet)])
+    for start in range(0, rows, CHUNK_ROWS):
+        size = min(CHUNK_ROWS, rows - start)
+        region = rng.choice(REGIONS, size).tolist()
+        developer = _zipf_choice(rng, developers, size).tolist()
+        area = _numbers(rng, size, 12_000, 0.7, 0.03).tolist()
+        cost = _numbers(rng, size, 4_000_000_000, 0.9, 0.03).tolist()
+        begin = _dates(rng, size, "2018-01-01", 6 * 365, 0.05).dt.normalize()
+        end = (begin + pd.to_timedelta(rng.integers(180, 1500, size), unit="D"))
+        begin = begin.astype(object).tolist()
+        end = end.astype(object).tolist()
+
+        for i in range(size):
+            number = start + i + 1
+            name = f'ЖК "Квартал {number % 5000}"'
+            area_value = None if area[i] != area[i] else area[i]
+            cost_value = None if cost[i] != cost[i] else cost[i]
+            begin_value = None if begin[i] is pd.NaT else begin[i]
+            end_value = None if end[i] is pd.NaT else end[i]
+            if sheet in ("Действующие", "Завершенные"):
+                yield [number, region[i], developer[i], name, area_value, cost_value, begin_value, end_value, end_value]
+            else:
+                yield [number, region[i], developer[i], name, area_value, cost_value, begin_value]
+
+def generate_excel(path: str, rows: int, seed: int = 42) -> str:
+    """Книга с четырьмя рабочими листами; заголовок каждого — в строке из HEADER_MAP."""
+    rng = np.random.default_rng(seed)
+    developers = _companies(rng, max(rows // 50, 10))
+    workbook = Workbook(write_only=True)
+
+    for sheet, sheet_rows in excel_sheet_rows(rows).items():
+        ws = workbook.create_sheet(sheet)
+        # Над заголовком — шапка отчёта, как в исходных выгрузках
+        preamble = [["Реестр объектов жилищного строительства"], [f"Лист: {sheet}"], [f"Сформирован: {datetime(2024, 6, 1):%d.%m.%Y}"]]
+        for i in range(HEADER_MAP.get(sheet, 0)):
+            ws.append(preamble[i] if i < len(preamble) else [])
+        ws.append(EXCEL_COLUMNS[sheet])
+        for row in _excel_rows(sheet, sheet_rows, seed, developers):
+            ws.append(row)
+
+    # Исключённый лист тоже присутствует в реальных книгах
+    for sheet in EXCLUDED_SHEETS:
+        ws = workbook.create_sheet(sheet)
+        ws.append(EXCEL_COLUMNS["На модерации"])
+
+    tmp_path = f"{path}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    return path
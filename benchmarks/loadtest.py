@@ -0,0 +1,417 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.generators import generate_csv, generate_excel
+from benchmarks.run import CSV_FILTERS, DEFAULT_DATA_DIR, DEFAULT_RESULTS_DIR, ensure_file, git_commit
+
+# Нагрузочный прогон всего приложения: поднимает main:app под uvicorn,
+# загружает синтетические CSV и Excel и гоняет смесь запросов из многих
+# параллельных клиентов. В отличие от benchmarks.run здесь видны блокировки
+# цикла событий, очередь пула процессов и то, как загрузки мешают аналитике.
+#   python -m benchmarks.loadtest --clients 32 --duration 60
+#   python -m benchmarks.loadtest --mix analyze_csv=3,upload_csv=1
+# Результат — JSON в формате benchmarks.run (по записи на эндпоинт, время
+# в секундах), так что два прогона сравнивает
+#   python -m benchmarks.compare old.json new.json --metric p95
+# В отчёте также RSS сервера и его процессов пула по времени.
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Доли запросов по умолчанию: в основном чтение, немного загрузок
+DEFAULT_MIX = {
+    "upload_csv": 1,
+    "filters_csv": 4,
+    "analyze_csv": 6,
+    "get_excel_filters": 3,
+    "analyze_excel": 6,
+}
+
+# Фильтры Excel в том виде, в каком их принимает API (даты периода — строками — модель не пропускает)
+EXCEL_FILTERS = {
+    "none": {},
+    "region_developer": {"region": ["Алматы", "Астана", "Шымкент"], "developer": ['ТОО "Компания 1"', 'АО "Компания 2"']},
+    "area": {"area": {"min": 5000, "max": 50000}},
+}
+
+CSV_METRICS = [None, ["total_deals", "total_amount", "deals_by_stage"], ["avg_amount", "top_regions_by_sum"]]
+
+# Настройки сервера, которые попадают в отчёт: от них зависят результаты
+SERVER_ENV_PREFIXES = ("ANALYTICS_", "SHARED_FRAMES", "FRAME_CACHE_", "RESULT_CACHE_", "CACHE_")
+
+
+def parse_mix(text: str | None) -> dict[str, int]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Неизвестный эндпоинт в --mix: {name} (есть: {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise SystemExit("В --mix нет запросов с ненулевой долей")
+    return mix
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_bytes(pid: int) -> int | None:
+    # Linux: VmRSS из /proc; на других системах RSS не меряем
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def _children(pid: int) -> list[int]:
+    """Все потомки процесса (процессы пула и их вспомогательные процессы)."""
+    parents: dict[int, list[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="ascii") as f:
+                # Имя процесса в скобках может содержать пробелы — PPID ищем после него
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+
+    result, pending = [], [pid]
+    while pending:
+        for child in parents.get(pending.pop(), []):
+            result.append(child)
+            pending.append(child)
+    return result
+
+def rss_sample(pid: int, started: float) -> dict[str, Any]:
+    children = [rss for rss in map(_rss_bytes, _children(pid)) if rss is not None]
+    server = _rss_bytes(pid)
+    return {
+        "t": round(time.perf_counter() - started, 2),
+        "server_bytes": server,
+        "workers_bytes": sum(children),
+        "processes": len(children) + 1,
+        "total_bytes": (server or 0) + sum(children) if server is not None else None,
+    }
+
+async def sample_rss(pid: int | None, started: float, interval: float, samples: list, stop: asyncio.Event) -> None:
+    if pid is None:
+        return
+    while not stop.is_set():
+        samples.append(await asyncio.to_thread(rss_sample, pid, started))
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_server(port: int, log_path: str | None) -> subprocess.Popen:
+    log = open(log_path, "ab") if log_path else subprocess.DEVNULL
+    try:
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=REPO_DIR,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    finally:
+        if log_path:
+            log.close()
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+async def wait_ready(client: httpx.AsyncClient, server: subprocess.Popen | None, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server is not None and server.poll() is not None:
+            raise SystemExit(f"Сервер завершился с кодом {server.returncode}")
+        try:
+            if (await client.get("/cache_stats")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"Сервер не ответил за {timeout:.0f}s")
+
+
+def _check(response: httpx.Response) -> dict:
+    if response.status_code != 200:
+        raise SystemExit(f"{response.request.url.path}: {response.status_code} {response.text[:500]}")
+    return response.json()
+
+async def upload(client: httpx.AsyncClient, endpoint: str, path: str, content_type: str) -> dict:
+    with open(path, "rb") as f:
+        files = {"file": (os.path.basename(path), f.read(), content_type)}
+    return _check(await client.post(endpoint, files=files, timeout=None))
+
+async def prepare(client: httpx.AsyncClient, csv_path: str, excel_path: str) -> dict[str, Any]:
+    """Загрузки до начала замера: id файлов и листы, по которым пойдут запросы."""
+    start = time.perf_counter()
+    csv_id = (await upload(client, "/upload_csv", csv_path, "text/csv"))["file_id"]
+    csv_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    book = await upload(client, "/list_excel_sheets", excel_path, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    excel_seconds = time.perf_counter() - start
+    print(f"[LOAD] CSV загружен за {csv_seconds:.1f}s, Excel — за {excel_seconds:.1f}s")
+    return {
+        "csv_id": csv_id,
+        "excel_id": book["file_id"],
+        "sheets": book["sheets"],
+        "csv_upload_seconds": csv_seconds,
+        "excel_upload_seconds": excel_seconds,
+    }
+
+
+def build_request(endpoint: str, state: dict[str, Any], rng: random.Random) -> dict[str, Any]:
+    """Аргументы httpx для очередного запроса к endpoint."""
+    if endpoint == "upload_csv":
+        path = rng.choice(state["upload_files"])
+        return {"method": "POST", "url": "/upload_csv", "files": {"file": (os.path.basename(path), state["payloads"][path], "text/csv")}}
+    if endpoint == "filters_csv":
+        return {"method": "GET", "url": "/filters_csv", "params": {"file_id": state["csv_id"]}}
+    if endpoint == "analyze_csv":
+        body = {"file_id": state["csv_id"], "filters": CSV_FILTERS[rng.choice(list(CSV_FILTERS))], "metrics": rng.choice(CSV_METRICS)}
+        return {"method": "POST", "url": "/analyze_csv", "json": body}
+    sheet = rng.choice(state["sheets"])
+    if endpoint == "get_excel_filters":
+        return {"method": "POST", "url": "/get_excel_filters", "json": {"file_id": state["excel_id"], "sheet_name": sheet}}
+    body = {"file_id": state["excel_id"], "sheet_name": sheet, "filters": EXCEL_FILTERS[rng.choice(list(EXCEL_FILTERS))]}
+    return {"method": "POST", "url": "/analyze_excel", "json": body}
+
+async def client_loop(
+    client: httpx.AsyncClient,
+    state: dict[str, Any],
+    mix: dict[str, int],
+    rng: random.Random,
+    started: float,
+    deadline: float,
+    budget: list[int],
+    records: list,
+) -> None:
+    endpoints, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline and budget[0] != 0:
+        budget[0] -= 1
+        endpoint = rng.choices(endpoints, weights)[0]
+        request = build_request(endpoint, state, rng)
+        start = time.perf_counter()
+        try:
+            response = await client.request(**request)
+            # Ответ дочитываем целиком — время включает передачу тела
+            await response.aread()
+            status, error = response.status_code, None
+        except httpx.HTTPError as exc:
+            status, error = None, type(exc).__name__
+        records.append((endpoint, start - started, time.perf_counter() - start, status, error))
+
+
+def _percentile(values: np.ndarray, q: float) -> float:
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+def summarize(records: list, elapsed: float, rows: int, case: str, peak_rss: int | None) -> list[dict[str, Any]]:
+    """Записи отчёта по эндпоинтам и по всем запросам вместе (benchmark "load:all")."""
+    groups: dict[str, list] = {}
+    for record in records:
+        groups.setdefault(record[0], []).append(record)
+    groups["all"] = records
+
+    results = []
+    for endpoint, items in groups.items():
+        seconds = np.array([item[2] for item in items])
+        ok = seconds[[item[3] == 200 for item in items]]
+        statuses: dict[str, int] = {}
+        for item in items:
+            key = str(item[3]) if item[3] is not None else item[4]
+            statuses[key] = statuses.get(key, 0) + 1
+        errors = len(items) - len(ok)
+        results.append({
+            "benchmark": f"load:{endpoint}",
+            "rows": rows,
+            "case": case,
+            # Время — по успешным ответам; ошибки считаются отдельно
+            "best": float(ok.min()) if len(ok) else 0.0,
+            "median": _percentile(ok, 50),
+            "p95": _percentile(ok, 95),
+            "p99": _percentile(ok, 99),
+            "mean": float(ok.mean()) if len(ok) else 0.0,
+            "max": float(ok.max()) if len(ok) else 0.0,
+            "peak_bytes": peak_rss or 0,
+            "requests": len(items),
+            "errors": errors,
+            "error_rate": errors / len(items) if items else 0.0,
+            "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+            "statuses": statuses,
+        })
+    return sorted(results, key=lambda r: r["benchmark"])
+
+def print_results(results: list[dict[str, Any]]) -> None:
+    for r in results:
+        print(
+            f"[LOAD] {r['benchmark']:<24} {r['requests']:>7} req  {r['throughput_rps']:>8.1f} rps  "
+            f"p50 {r['median'] * 1000:>8.1f}ms  p95 {r['p95'] * 1000:>8.1f}ms  p99 {r['p99'] * 1000:>8.1f}ms  "
+            f"errors {r['error_rate']:.1%}"
+        )
+
+
+async def run_load(args: argparse.Namespace, mix: dict[str, int], csv_path: str, excel_path: str, upload_files: list[str]) -> dict[str, Any]:
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = args.port or free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.server_log)
+        print(f"[LOAD] сервер pid {server.pid} на {base_url}")
+
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            await wait_ready(client, server, args.startup_timeout)
+            state = await prepare(client, csv_path, excel_path)
+            state["upload_files"] = upload_files
+            state["payloads"] = {}
+            for path in upload_files:
+                with open(path, "rb") as f:
+                    state["payloads"][path] = f.read()
+
+            records: list = []
+            samples: list = []
+            stop = asyncio.Event()
+            started = time.perf_counter()
+            sampler = asyncio.create_task(
+                sample_rss(server.pid if server else None, started, args.rss_interval, samples, stop)
+            )
+            # Бюджет запросов общий для всех клиентов; -1 — без ограничения, только по времени
+            budget = [args.requests or -1]
+            deadline = started + args.duration if args.duration else float("inf")
+            clients = [
+                client_loop(client, state, mix, random.Random(args.seed * 1000 + i), started, deadline, budget, records)
+                for i in range(args.clients)
+            ]
+            await asyncio.gather(*clients)
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await sampler
+            if server is not None:
+                samples.append(await asyncio.to_thread(rss_sample, server.pid, started))
+
+            cache_stats = (await client.get("/cache_stats")).json()
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    return {"state": state, "records": records, "elapsed": elapsed, "rss": samples, "cache_stats": cache_stats}
+
+def main(argv: list[str] | None = None) -> str:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон API аналитики")
+    parser.add_argument("--clients", type=int, default=16, help="число параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность замера, секунды (0 — до исчерпания --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="общее число запросов (0 — без ограничения)")
+    parser.add_argument("--mix", help="доли запросов, например analyze_csv=6,filters_csv=4,upload_csv=1")
+    parser.add_argument("--csv-rows", type=int, default=100_000)
+    parser.add_argument("--excel-rows", type=int, default=20_000)
+    parser.add_argument("--upload-rows", type=int, default=10_000, help="строк в CSV, загружаемых во время замера")
+    parser.add_argument("--upload-files", type=int, default=4, help="разных CSV для загрузок во время замера (повторы отдаются из кэша по содержимому)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120.0, help="таймаут одного запроса, секунды")
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="период замера RSS сервера, секунды")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="адрес уже запущенного сервера (тогда RSS не меряется)")
+    parser.add_argument("--port", type=int, help="порт для запускаемого сервера (по умолчанию свободный)")
+    parser.add_argument("--server-log", help="файл для логов запускаемого сервера")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    args = parser.parse_args(argv)
+    if not args.duration and not args.requests:
+        parser.error("нужно задать --duration или --requests")
+
+    mix = parse_mix(args.mix)
+    os.makedirs(args.data_dir, exist_ok=True)
+    csv_path = ensure_file(os.path.join(args.data_dir, f"deals_{args.csv_rows}_{args.seed}.csv"), generate_csv, args.csv_rows, args.seed)
+    excel_path = ensure_file(os.path.join(args.data_dir, f"objects_{args.excel_rows}_{args.seed}.xlsx"), generate_excel, args.excel_rows, args.seed)
+    upload_files = [
+        ensure_file(os.path.join(args.data_dir, f"deals_{args.upload_rows}_{seed}.csv"), generate_csv, args.upload_rows, seed)
+        for seed in range(args.seed + 1, args.seed + 1 + args.upload_files)
+    ] if mix.get("upload_csv") else []
+
+    run = asyncio.run(run_load(args, mix, csv_path, excel_path, upload_files))
+    peak_rss = max((s["total_bytes"] or 0 for s in run["rss"]), default=None) or None
+    case = f"c{args.clients}"
+    results = summarize(run["records"], run["elapsed"], args.csv_rows, case, peak_rss)
+    print_results(results)
+    if peak_rss:
+        print(f"[LOAD] пиковый RSS сервера с пулом: {peak_rss / 2**20:.1f} MiB")
+
+    report = {
+        **git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "httpx": httpx.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "load": {
+            "clients": args.clients,
+            "duration": args.duration,
+            "requests": args.requests,
+            "elapsed": run["elapsed"],
+            "mix": mix,
+            "csv_rows": args.csv_rows,
+            "excel_rows": args.excel_rows,
+            "upload_rows": args.upload_rows,
+            "upload_files": args.upload_files,
+            "external_server": args.url is not None,
+            "server_env": {k: v for k, v in os.environ.items() if k.startswith(SERVER_ENV_PREFIXES)},
+            "csv_upload_seconds": run["state"]["csv_upload_seconds"],
+            "excel_upload_seconds": run["state"]["excel_upload_seconds"],
+        },
+        "results": results,
+        "rss": run["rss"],
+        "cache_stats": run["cache_stats"],
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"load-{stamp}-{(report['commit'] or 'nogit')[:10]}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[LOAD] результаты: {output}")
+    return output
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.generators import generate_csv, generate_excel
+from services.csv_parser import clean_dataframe, load_csv, parse_and_clean_csv
+from services.excel_parser import coerce_excel_sheet, parse_excel_sheet_with_filters, read_excel_sheet
+from usecases.csv_analyze_deals import apply_filters, compute_summary, resolve_summary_region_col
+
+# Замеры ключевых функций разбора и аналитики на синтетических данных.
+#   python -m benchmarks.run --sizes 10000,100000
+# Результат — JSON с коммитом, окружением и временем/пиковой памятью каждого замера;
+# два таких файла сравнивает benchmarks.compare.
+
+BASE_DIR = os.path.dirname(__file__)
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+DEFAULT_DATA_DIR = os.path.join(BASE_DIR, "data")
+DEFAULT_RESULTS_DIR = os.path.join(BASE_DIR, "results")
+
+CSV_FILTERS = {
+    "none": {},
+    "region_status": {"region_col": "Регион", "region": ["Алматы", "Астана"], "status": "В работе"},
+    "date_window": {"from": "2023-01-01", "stage": ["Проверка", "Согласование"]},
+    "amount_company": {"amount_min": "1000000", "amount_max": "20000000", "company": 'ТОО "Компания 1"'},
+}
+
+EXCEL_SHEET = "Действующие"
+EXCEL_FILTERS = {
+    "none": {},
+    "region_developer": {"region": ["Алматы", "Астана", "Шымкент"], "developer": ['ТОО "Компания 1"', 'АО "Компания 2"']},
+    "area_period": {"area": {"min": 5000, "max": 50000}, "start_date": "2019-01-01", "end_date": "2026-12-31"},
+}
+
+
+def git_commit() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+def measure(fn: Callable[[], Any], repeat: int) -> tuple[dict, Any]:
+    """Время каждого из repeat запусков и пиковая память отдельного запуска под tracemalloc."""
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+
+    # Память меряем отдельным запуском: tracemalloc заметно замедляет код
+    result = None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "best": min(seconds),
+        "median": statistics.median(seconds),
+        "peak_bytes": int(peak),
+    }, result
+
+def record(results: list, benchmark: str, rows: int, case: str, stats: dict, **extra: Any) -> None:
+    entry = {"benchmark": benchmark, "rows": rows, "case": case, **stats, **extra}
+    results.append(entry)
+    print(f"[BENCH] {benchmark:<32} {rows:>9} {case:<18} best {stats['best']:.4f}s  peak {stats['peak_bytes'] / 2**20:.1f} MiB")
+
+def ensure_file(path: str, generate: Callable[[str, int, int], str], rows: int, seed: int) -> str:
+    if not os.path.exists(path):
+        print(f"[BENCH] генерация {os.path.basename(path)}")
+        start = time.perf_counter()
+        generate(path, rows, seed)
+        print(f"[BENCH] готово за {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def bench_csv(results: list, rows: int, data_dir: str, seed: int, repeat: int) -> None:
+    path = ensure_file(os.path.join(data_dir, f"deals_{rows}_{seed}.csv"), generate_csv, rows, seed)
+
+    stats, raw = measure(lambda: load_csv(path), repeat)
+    record(results, "load_csv", rows, "-", stats, file_bytes=os.path.getsize(path))
+
+    stats, _ = measure(lambda: clean_dataframe(raw.copy()), repeat)
+    record(results, "clean_dataframe", rows, "-", stats)
+    del raw
+
+    # Фильтры и сводка — по таблице в том виде, в каком её хранит кэш
+    df = parse_and_clean_csv(path)
+    for case, filters in CSV_FILTERS.items():
+        stats, filtered = measure(lambda: apply_filters(df, filters), repeat)
+        record(results, "apply_filters", rows, case, stats, rows_out=int(len(filtered)))
+
+        region_col = resolve_summary_region_col(filtered, filters)
+        stats, _ = measure(lambda: compute_summary(filtered, filters, region_col), repeat)
+        record(results, "compute_summary", rows, case, stats, rows_in=int(len(filtered)))
+
+def bench_excel(results: list, rows: int, data_dir: str, seed: int, repeat: int) -> None:
+    path = ensure_file(os.path.join(data_dir, f"objects_{rows}_{seed}.xlsx"), generate_excel, rows, seed)
+    with open(path, "rb") as f:
+        buffer = f.read()
+
+    stats, sheet = measure(lambda: read_excel_sheet(buffer, EXCEL_SHEET), repeat)
+    record(results, "read_excel_sheet", rows, EXCEL_SHEET, stats, rows_out=int(len(sheet)), file_bytes=len(buffer))
+
+    sheet = coerce_excel_sheet(sheet, EXCEL_SHEET)
+    for case, filters in EXCEL_FILTERS.items():
+        stats, filtered = measure(lambda: parse_excel_sheet_with_filters(sheet, EXCEL_SHEET, filters), repeat)
+        record(results, "parse_excel_sheet_with_filters", rows, case, stats, rows_out=int(len(filtered)))
+
+
+def main(argv: list[str] | None = None) -> str:
+    parser = argparse.ArgumentParser(description="Бенчмарки разбора и аналитики")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="число строк через запятую")
+    parser.add_argument("--only", choices=["csv", "excel"], help="только CSV или только Excel")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="где хранить сгенерированные файлы")
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results: list = []
+    for rows in sizes:
+        if args.only in (None, "csv"):
+            bench_csv(results, rows, args.data_dir, args.seed, args.repeat)
+        if args.only in (None, "excel"):
+            bench_excel(results, rows, args.data_dir, args.seed, args.repeat)
+
+    report = {
+        **git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}-{(report['commit'] or 'nogit')[:10]}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[BENCH] результаты: {output}")
+    return output
+
+if __name__ == "__main__":
+    main()
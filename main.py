@@ -1,15 +1,61 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import time
 import traceback
+import uuid
 
 from api.csv_analytics import router as csv_analytics_router
 from api.excel_analytics import router as excel_analytics_router
+from api.monitoring import router as monitoring_router
+from services import metrics
+from services.cache_lifecycle import run_sweeper
+from services.executor import ExecutorRejected, executor
+from services.log import get_logger, request_id
 
-app = FastAPI()
+log = get_logger("http")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Фоновая очистка каталога кэша (TTL и квота)
+    sweeper = asyncio.create_task(run_sweeper())
+    yield
+    sweeper.cancel()
+    with suppress(asyncio.CancelledError):
+        await sweeper
+    executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(csv_analytics_router)
 app.include_router(excel_analytics_router)
+app.include_router(monitoring_router)
+
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    # Время запроса и его этапов; Server-Timing — если включён METRICS_SERVER_TIMING
+    token = request_id.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])
+    start = time.perf_counter()
+    status = 500
+    try:
+        with metrics.collect() as timings:
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=str(status))
+        metrics.HTTP_LATENCY.observe(elapsed, method=request.method, route=route)
+        if route != "/metrics":
+            log.info("http.request", method=request.method, route=route, status=status, ms=round(elapsed * 1000, 1))
+        request_id.reset(token)
+
+    if metrics.SERVER_TIMING:
+        stages = timings.server_timing()
+        response.headers["Server-Timing"] = ", ".join(filter(None, [stages, f"total;dur={elapsed * 1000:.1f}"]))
+    return response
 
 # Разрешаем доступ с фронта
 app.add_middleware(
@@ -20,10 +66,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ExecutorRejected)
+async def executor_rejected_handler(request: Request, exc: ExecutorRejected):
+    log.warning("executor.rejected", path=request.url.path, status=exc.status_code, error=str(exc))
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after), "Access-Control-Allow-Origin": "*"},
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     tb = traceback.format_exc()
-    print("[ERROR]", tb)
+    log.error("http.unhandled", path=request.url.path, error=str(exc), trace=tb)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal Server Error", "trace": tb},
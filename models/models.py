@@ -5,6 +5,25 @@ from pydantic import BaseModel
 class AnalyzeCsvRequest(BaseModel):
     file_id: str
     filters: Dict[str, Any]
+    metrics: Optional[List[str]] = None  # None — все метрики сводки
+    columns: Optional[List[str]] = None  # колонки для column_stats
+
+# Один набор фильтров в пакетном запросе
+class AnalyzeCsvBatchItem(BaseModel):
+    filters: Dict[str, Any]
+    metrics: Optional[List[str]] = None
+    columns: Optional[List[str]] = None
+
+# Пакетный запрос: несколько наборов фильтров к одному файлу
+class AnalyzeCsvBatchRequest(BaseModel):
+    file_id: str
+    items: List[AnalyzeCsvBatchItem]
+
+# Динамика сделок по периодам даты создания
+class TrendCsvRequest(BaseModel):
+    file_id: str
+    filters: Dict[str, Any]
+    bucket: str = "month"  # day | week | month
 
 class ExcelFilterRequest(BaseModel):
     file_id: str
@@ -19,11 +38,58 @@ class AnalyzeExcelRequest(BaseModel):
         Dict[str, float],      # range (area)
         Dict[str, str]         # date_range (period)
     ]]
+    metrics: Optional[List[str]] = None  # None — все метрики сводки
+    columns: Optional[List[str]] = None  # колонки для column_stats
+
+# Анализ всей книги: фильтры применяются к каждому листу
+class AnalyzeWorkbookRequest(BaseModel):
+    file_id: str
+    filters: Dict[str, Union[
+        List[str],
+        Dict[str, float],
+        Dict[str, str]
+    ]]
+    metrics: Optional[List[str]] = None
+    sheets: Optional[List[str]] = None  # None — все разобранные листы книги
+
+# Выгрузка строк CSV, прошедших фильтры
+class ExportCsvRequest(BaseModel):
+    file_id: str
+    filters: Dict[str, Any]
+    columns: Optional[List[str]] = None  # None — все колонки
+    format: str = "csv"                  # csv | ndjson
+    cursor: Optional[str] = None         # X-Next-Cursor предыдущей страницы
+    limit: Optional[int] = None          # None — все строки одной страницей
+
+# Выгрузка строк листа Excel, прошедших фильтры
+class ExportExcelRequest(BaseModel):
+    file_id: str
+    sheet_name: str
+    filters: Dict[str, Union[
+        List[str],
+        Dict[str, float],
+        Dict[str, str]
+    ]]
+    columns: Optional[List[str]] = None
+    format: str = "csv"
+    cursor: Optional[str] = None
+    limit: Optional[int] = None
 
 # Ответ при загрузке файла
 class UploadResponse(BaseModel):
     status: str
     file_id: str
+    # Отчёт о приведении типов по колонкам: {колонка: {kind, values, failed, examples}}
+    conversion: Optional[Dict[str, Any]] = None
+
+# Ответ на обновление CSV дельтой
+class UpsertResponse(BaseModel):
+    status: str
+    file_id: str
+    rows: int
+    inserted: int
+    updated: int
+    conversion: Optional[Dict[str, Any]] = None
 
 # Ответ с доступными фильтрами
 class FiltersResponse(BaseModel):
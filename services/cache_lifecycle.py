@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+
+from services import metrics
+from services.file_cache import (
+    ACCESS_EXT, ALIASES_DIR, CACHE_DIR, TMP_EXT,
+    delete_entry, dir_size, entry_exists, entry_refs, list_aliases
+)
+from services.log import get_logger
+
+# Жизненный цикл каталога кэша: записи старше TTL (по последнему обращению)
+# удаляются, а если кэш больше квоты — вытесняются давно не использованные.
+# Фоновая очистка запускается в lifespan приложения; вручную:
+#   python -m services.cache_lifecycle stats
+#   python -m services.cache_lifecycle sweep
+
+log = get_logger("cache_lifecycle")
+
+# Квота на каталог кэша (байты); 0 — без ограничения
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 20 * 1024 ** 3))
+# Запись без обращений дольше этого срока удаляется; 0 — без TTL
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 30 * 24 * 3600))
+CACHE_SWEEP_INTERVAL_SECONDS = float(os.environ.get("CACHE_SWEEP_INTERVAL_SECONDS", 300))
+# Недавно использованные записи не вытесняем даже сверх квоты: их может
+# дописывать загрузка или читать текущий запрос
+CACHE_EVICT_GRACE_SECONDS = float(os.environ.get("CACHE_EVICT_GRACE_SECONDS", 600))
+# Временные файлы старше этого срока остались от прерванных записей
+TMP_MAX_AGE_SECONDS = 3600
+
+EVICTIONS = metrics.Counter("cache_disk_evictions_total", "Записи, удалённые из каталога кэша", ("reason",))
+_last_usage: dict = {}
+metrics.Gauge("cache_disk_bytes", "Объём каталога кэша на последней проверке, байт", fn=lambda: _last_usage.get("bytes", 0))
+metrics.Gauge("cache_disk_entries", "Число записей в каталоге кэша на последней проверке", fn=lambda: _last_usage.get("entries", 0))
+
+
+def _entry_id(name: str) -> str:
+    return name.split(".", 1)[0]
+
+def _nested_tmp(path: str) -> list[str]:
+    # Листы книги, сегменты обновлений и псевдонимы записываются через временные файлы в своих каталогах
+    try:
+        return [os.path.join(path, name) for name in os.listdir(path) if name.endswith(TMP_EXT)]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+def scan_cache() -> tuple[dict[str, dict], list[str]]:
+    """Записи каталога кэша {file_id: {bytes, last_access}} и временные файлы (в том числе в каталогах листов)."""
+    entries: dict[str, dict] = {}
+    tmp_paths = _nested_tmp(ALIASES_DIR)
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if path == ALIASES_DIR or name.startswith("."):
+            continue
+        if name.endswith(TMP_EXT):
+            tmp_paths.append(path)
+            continue
+        try:
+            stat = os.stat(path)
+            size = dir_size(path) if os.path.isdir(path) else stat.st_size
+        except FileNotFoundError:
+            continue
+        if os.path.isdir(path):
+            tmp_paths.extend(_nested_tmp(path))
+
+        entry = entries.setdefault(_entry_id(name), {"bytes": 0, "last_access": 0.0, "stamp": None})
+        entry["bytes"] += size
+        if name.endswith(ACCESS_EXT):
+            entry["stamp"] = stat.st_mtime
+        else:
+            entry["last_access"] = max(entry["last_access"], stat.st_mtime)
+
+    # Отметка обращения точнее mtime файлов; у старых записей её может не быть
+    for entry in entries.values():
+        stamp = entry.pop("stamp")
+        if stamp is not None:
+            entry["last_access"] = max(entry["last_access"], stamp)
+    return entries, tmp_paths
+
+def cache_usage() -> dict:
+    entries, tmp_paths = scan_cache()
+    now = time.time()
+    accesses = [e["last_access"] for e in entries.values()]
+    usage = {
+        "entries": len(entries),
+        "bytes": sum(e["bytes"] for e in entries.values()),
+        "max_bytes": CACHE_MAX_BYTES,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "tmp_files": len(tmp_paths),
+        "in_use": sum(1 for file_id in entries if entry_refs(file_id)),
+        "aliases": len(list_aliases()),
+        "oldest_access_age_seconds": round(now - min(accesses), 1) if accesses else None,
+        "largest": sorted(
+            ({"file_id": file_id, "bytes": e["bytes"]} for file_id, e in entries.items()),
+            key=lambda e: e["bytes"], reverse=True
+        )[:10],
+    }
+    _last_usage.update(usage)
+    return usage
+
+def _remove_tmp(paths: list[str], now: float) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            if now - os.stat(path).st_mtime < TMP_MAX_AGE_SECONDS:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+def _remove_dangling_aliases() -> int:
+    removed = 0
+    for name, file_id in list_aliases().items():
+        if entry_exists(file_id):
+            continue
+        try:
+            os.remove(os.path.join(ALIASES_DIR, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def sweep_cache(now: float | None = None) -> dict:
+    """Один проход очистки: TTL, затем квота по LRU; возвращает, что было удалено."""
+    now = time.time() if now is None else now
+    entries, tmp_paths = scan_cache()
+    result = {"expired": 0, "evicted": 0, "freed_bytes": 0, "in_use": 0}
+
+    if CACHE_TTL_SECONDS > 0:
+        for file_id, entry in list(entries.items()):
+            if now - entry["last_access"] > CACHE_TTL_SECONDS:
+                # Таблицы записи отображены в память воркеров (SHARED_FRAMES): удаление
+                # не освободило бы место, пока их не отпустят все процессы
+                if entry_refs(file_id):
+                    result["in_use"] += 1
+                    continue
+                result["freed_bytes"] += delete_entry(file_id)
+                result["expired"] += 1
+                EVICTIONS.inc(reason="ttl")
+                del entries[file_id]
+
+    total = sum(e["bytes"] for e in entries.values())
+    if CACHE_MAX_BYTES > 0 and total > CACHE_MAX_BYTES:
+        for file_id, entry in sorted(entries.items(), key=lambda item: item[1]["last_access"]):
+            if total <= CACHE_MAX_BYTES:
+                break
+            if now - entry["last_access"] < CACHE_EVICT_GRACE_SECONDS:
+                log.warning("cache.quota_exceeded", bytes=total, max_bytes=CACHE_MAX_BYTES)
+                break
+            if entry_refs(file_id):
+                result["in_use"] += 1
+                continue
+            freed = delete_entry(file_id)
+            total -= entry["bytes"]
+            result["freed_bytes"] += freed
+            result["evicted"] += 1
+            EVICTIONS.inc(reason="quota")
+
+    result["tmp_removed"] = _remove_tmp(tmp_paths, now)
+    result["aliases_removed"] = _remove_dangling_aliases()
+    result["bytes"] = total
+    _last_usage.update({"bytes": total, "entries": len(entries) - result["evicted"]})
+    if result["expired"] or result["evicted"] or result["tmp_removed"]:
+        log.info("cache.swept", **result)
+    return result
+
+async def run_sweeper(interval: float = CACHE_SWEEP_INTERVAL_SECONDS) -> None:
+    """Фоновая очистка; запускается задачей в lifespan приложения."""
+    while True:
+        try:
+            # Обход каталога — блокирующий ввод-вывод, уводим его из цикла событий
+            await asyncio.to_thread(sweep_cache)
+        except Exception as e:
+            log.exception("cache.sweep_failed", error=str(e))
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Каталог кэша: использование и очистка")
+    parser.add_argument("command", choices=["stats", "sweep"])
+    args = parser.parse_args()
+    report = cache_usage() if args.command == "stats" else sweep_cache()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
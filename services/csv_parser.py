@@ -1,73 +1,171 @@
 import pandas as pd
 from pathlib import Path
+from typing import Callable, Iterator
 
-def load_csv(file_path: str) -> pd.DataFrame:
-    # Сначала попробуем прочитать с параметрами для обработки экранированных кавычек
-    try:
-        df = pd.read_csv(
-            file_path, 
-            sep=";",
-            encoding="utf-8",
-            engine='python',
-            quotechar='"',
-            escapechar='\\',  # Используем обратный слеш для экранирования
-            doublequote=False,  # Не считаем двойные кавычки как одиночные
-            on_bad_lines='warn'
-        )
-    except Exception as e:
-        print(f"Ошибка при чтении CSV с экранированием: {e}")
-        # Если не получилось, попробуем более простой подход
-        df = pd.read_csv(
-            file_path, 
-            sep=";",
-            encoding="utf-8",
-            engine='python',
-            quoting=3,  # QUOTE_NONE - игнорируем кавычки полностью
-            on_bad_lines='warn'
-        )
-    
+from services.log import get_logger
+from services.metrics import record_rows, stage
+from services.schema import CSV_SCHEMA, apply_schema, failed_columns, schema_columns
+
+log = get_logger("csv_parser")
+
+# Сколько строк разбирать за раз: память на разбор ограничена размером чанка
+CSV_CHUNK_ROWS = 200_000
+
+# Основной режим: кавычки экранированы обратным слешем, двойные кавычки не склеиваются
+CSV_READ_OPTIONS = dict(
+    sep=";",
+    encoding="utf-8",
+    quotechar='"',
+    escapechar='\\',
+    doublequote=False,
+    on_bad_lines='warn',
+)
+
+# Запасной режим, если файл не разбирается: кавычки игнорируем полностью
+CSV_FALLBACK_OPTIONS = dict(
+    sep=";",
+    encoding="utf-8",
+    quoting=3,  # QUOTE_NONE
+    on_bad_lines='warn',
+)
+
+def _iter_chunks(file_path: str, options: dict) -> Iterator[pd.DataFrame]:
+    # Все значения читаем строками: типы одинаковы во всех чанках,
+    # а числовые колонки определяются один раз по всему файлу
+    return pd.read_csv(
+        file_path,
+        engine="c",
+        dtype=str,
+        chunksize=CSV_CHUNK_ROWS,
+        **options
+    )
+
+def unescape_chunk(df: pd.DataFrame) -> pd.DataFrame:
     # Очистка названий колонок от лишних пробелов
     df.columns = df.columns.str.strip()
-    
+
     # Очистка строковых данных от экранирования
     for col in df.columns:
-        if df[col].dtype == 'object':  # Только для строковых колонок
-            # Заменяем экранированные кавычки на обычные
-            df[col] = df[col].str.replace(r'\\"', '"', regex=True) if pd.api.types.is_string_dtype(df[col]) else df[col]
-            # Удаляем лишние обратные слеши
-            df[col] = df[col].str.replace(r'\\', '', regex=True) if pd.api.types.is_string_dtype(df[col]) else df[col]
-    
+        if df[col].dtype == 'object':
+            # Заменяем экранированные кавычки на обычные и удаляем лишние обратные слеши
+            df[col] = df[col].str.replace(r'\\"', '"', regex=True).str.replace(r'\\', '', regex=True)
+
     return df
 
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    # Приведение колонок с датами к datetime
-    date_columns = [
-        "Дата создания", "Дата изменения", "Дата начала",
-        "Предполагаемая дата закрытия", "Дата регистрации заявления (субсидирование)"
-    ]
-    for col in date_columns:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], format="%d.%m.%Y %H:%M:%S", errors="coerce")
-            df[col] = df[col].fillna(pd.to_datetime(df[col], format="%d.%m.%Y", errors="coerce"))
-
-    # Приведение числовых колонок к float
-    float_columns = [
-        "Сумма", "Стоимость незавершенного строительства (гарантирование)",
-        "Площадь ЗУ, га (гарантирование)", "Цена реализации 1 кв.м жилья в тыс.тенге/1 м2 (гарантирование)"
-    ]
-    for col in float_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+def infer_numeric_columns(df: pd.DataFrame, skip: list[str]) -> pd.DataFrame:
+    # Оставшиеся строковые колонки приводим к числам, если число — каждое значение,
+    # как это делал бы read_csv при разборе файла целиком
+    for col in df.columns:
+        if col in skip or df[col].dtype != 'object':
+            continue
+
+        values = df[col].dropna()
+        if values.empty:
+            df[col] = df[col].astype(float)
+            continue
+
+        if pd.to_numeric(values.head(100), errors="coerce").isna().any():
+            continue
+
+        numeric = pd.to_numeric(df[col], errors="coerce")
+        if numeric.notna().sum() == len(values):
+            df[col] = numeric
+
+    return df
+
+def read_csv_chunks(
+    file_path: str,
+    transform: Callable[[pd.DataFrame], pd.DataFrame] | None = None,
+    on_fallback: Callable[[], None] | None = None
+) -> list[pd.DataFrame]:
+    """Читает CSV по чанкам, применяя очистку (и transform) к каждому чанку.
+
+    on_fallback вызывается перед повторным чтением в запасном режиме — чтобы
+    сбросить то, что transform успел накопить по первой попытке.
+    """
+    def process(options: dict) -> list[pd.DataFrame]:
+        chunks = []
+        for chunk in _iter_chunks(file_path, options):
+            chunk = unescape_chunk(chunk)
+            chunks.append(transform(chunk) if transform else chunk)
+        return chunks
+
+    # Сначала попробуем прочитать с параметрами для обработки экранированных кавычек
+    try:
+        return process(CSV_READ_OPTIONS)
+    except Exception as e:
+        log.warning("csv.read_escaped_failed", path=str(file_path), error=str(e))
+        if on_fallback:
+            on_fallback()
+        # Если не получилось, попробуем более простой подход
+        return process(CSV_FALLBACK_OPTIONS)
+
+def _concat(chunks: list[pd.DataFrame]) -> pd.DataFrame:
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+def load_csv(file_path: str) -> pd.DataFrame:
+    df = _concat(read_csv_chunks(file_path))
+    return infer_numeric_columns(df, skip=[])
+
+def clean_dataframe(df: pd.DataFrame, report: dict | None = None) -> pd.DataFrame:
+    # Даты и числа — по схеме выгрузки (services/schema.py); report копит
+    # по колонкам число значений, которые не удалось разобрать
+    return apply_schema(df, CSV_SCHEMA, report)
+
+# Строковая колонка становится категориальной, если уникальных значений
+# не больше этой доли от числа строк
+CATEGORY_MAX_RATIO = 0.5
+
+FLAG_VALUES = {"Y": True, "N": False}
+
+def compact_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Сжимает DataFrame в памяти без потери значений.
+
+    Колонки-флаги Y/N -> boolean, строки с небольшим числом уникальных
+    значений -> category, целые -> наименьший целый тип. float64 не трогаем:
+    суммы по float32 накапливают ошибку, и итоги бы разошлись.
+    """
+    for col in df.columns:
+        series = df[col]
+
+        if series.dtype == 'object':
+            values = series.dropna()
+            if values.empty:
+                continue
+            uniques = values.unique()
+            if set(uniques) <= FLAG_VALUES.keys():
+                df[col] = series.map(FLAG_VALUES).astype("boolean")
+            elif len(uniques) <= CATEGORY_MAX_RATIO * len(series):
+                df[col] = series.astype("category")
+
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast="integer")
 
     return df
 
-def parse_and_clean_csv(file_path: str) -> pd.DataFrame:
-    df = load_csv(file_path)
-    print(f"[parser] Загружено строк: {len(df)}")
-    df = clean_dataframe(df)
+def parse_and_clean_csv(file_path: str, report: dict | None = None) -> pd.DataFrame:
+    """Читает и типизирует выгрузку; в report (если передан) — отчёт о приведении колонок."""
+    report = {} if report is None else report
+    with stage("csv_read"):
+        df = _concat(read_csv_chunks(
+            file_path,
+            transform=lambda chunk: clean_dataframe(chunk, report),
+            on_fallback=report.clear
+        ))
+    failed = failed_columns(report)
+    if failed:
+        log.warning("csv.conversion_failed", columns=failed)
+    with stage("csv_infer_types"):
+        df = infer_numeric_columns(df, skip=schema_columns(CSV_SCHEMA))
+    with stage("csv_compact"):
+        df = compact_dataframe(df)
+    record_rows("csv_parsed", len(df))
+    log.info("csv.parsed", rows=len(df), columns=len(df.columns))
     return df
 
 if __name__ == "__main__":
     sample_path = Path(__file__).parent.parent / "uploads" / "sample.csv"
     df = parse_and_clean_csv(sample_path)
-    print(df.head())
\ No newline at end of file
+    print(df.head())
@@ -1,6 +1,15 @@
+import numpy as np
 import pandas as pd
-from typing import List
-from io import BytesIO
+from typing import Any, List
+
+from services.excel_reader import ExcelSource, read_sheet, sheet_names
+from services.file_cache import get_columns, get_dataframe, get_raw_excel_path, store_dataframe
+from services.log import get_logger
+from services.metrics import record_rows, stage
+from services.schema import EXCEL_SCHEMAS, apply_schema, failed_columns
+from usecases.filter_index import FilterIndex, get_filter_index, range_mask
+
+log = get_logger("excel_parser")
 
 EXCLUDED_SHEETS = ["На рассмотрении"]
 
@@ -11,30 +20,128 @@ VALID_SHEETS = [
     "Отозванные"
 ]
 
-def get_valid_excel_sheets(excel: pd.ExcelFile) -> List[str]:
+def get_valid_excel_sheets(source: ExcelSource) -> List[str]:
     return [
-        s for s in excel.sheet_names
+        s for s in sheet_names(source)
         if s in VALID_SHEETS and s not in EXCLUDED_SHEETS
     ]
 
-def read_excel_sheet(buffer: bytes, sheet_name: str) -> pd.DataFrame:
-    header_map = {
-        "Действующие": 6,
-        "Завершенные": 2,
-        "На модерации": 1,
-        "Отозванные": 1
-    }
-    header_row = header_map.get(sheet_name, 0)
+# Номер строки с заголовками на каждом листе
+HEADER_MAP = {
+    "Действующие": 6,
+    "Завершенные": 2,
+    "На модерации": 1,
+    "Отозванные": 1
+}
+
+# Колонки рабочих листов, которые используют фильтры и аналитика
+# (начало заголовка без учёта регистра): регион/область, застройщик,
+# площадь, даты и стоимость. Лист в кэше хранится целиком, а фильтры и
+# сводка читают только эти колонки (get_excel_sheet(columns="used")).
+USED_COLUMN_PREFIXES = [
+    "регион", "область", "застройщик", "площадь", "стоимость",
+    "дата начала строительства", "дата завершения 2",
+]
 
-    excel = pd.ExcelFile(BytesIO(buffer))
-    return pd.read_excel(excel, sheet_name=sheet_name, header=header_row)
+def is_used_column(name: Any) -> bool:
+    normalized = str(name).strip().lower()
+    return any(normalized.startswith(prefix) for prefix in USED_COLUMN_PREFIXES)
 
-def parse_excel_sheet_with_filters(
-    df: pd.DataFrame,
+def read_excel_sheet(source: ExcelSource, sheet_name: str, columns: str = "all") -> pd.DataFrame:
+    """Лист книги; columns="used" — только колонки из USED_COLUMN_PREFIXES, "all" — все."""
+    header_row = HEADER_MAP.get(sheet_name, 0)
+    with stage("excel_read_sheet"):
+        df = read_sheet(source, sheet_name, header_row, is_used_column if columns == "used" else None)
+    record_rows("excel_sheet", len(df))
+    return df
+
+def coerce_excel_sheet(df: pd.DataFrame, sheet_name: str, report: dict | None = None) -> pd.DataFrame:
+    # Даты и числа листа приводятся один раз при загрузке — по схеме листа (services/schema.py)
+    schema = EXCEL_SCHEMAS.get(sheet_name)
+    return apply_schema(df, schema, report) if schema else df
+
+def parse_excel_sheet(source: ExcelSource, sheet_name: str, report: dict | None = None) -> pd.DataFrame:
+    return coerce_excel_sheet(read_excel_sheet(source, sheet_name), sheet_name, report)
+
+def parse_excel_workbook(source: ExcelSource) -> dict[str, pd.DataFrame]:
+    return {sheet: parse_excel_sheet(source, sheet) for sheet in get_valid_excel_sheets(source)}
+
+def build_excel_sheet(file_id: str, sheet_name: str, report: dict | None = None) -> pd.DataFrame:
+    # Один лист из исходного файла: листы книги разбираются независимо и параллельно
+    report = {} if report is None else report
+    df = parse_excel_sheet(get_raw_excel_path(file_id), sheet_name, report)
+    store_dataframe({sheet_name: df}, file_id=file_id)
+    failed = failed_columns(report)
+    if failed:
+        log.warning("excel.conversion_failed", file_id=file_id, sheet=sheet_name, columns=failed)
+    log.info("excel.sheet_parsed", file_id=file_id, sheet=sheet_name, rows=len(df), columns=len(df.columns))
+    return df
+
+def used_columns(columns: List[str], extra: List[str] | None = None) -> List[str]:
+    """Колонки фильтров и сводки (is_used_column) и extra, если они есть на листе."""
+    return list(dict.fromkeys([c for c in columns if is_used_column(c)] + [c for c in extra or [] if c in columns]))
+
+def get_excel_sheet(
+    file_id: str,
     sheet_name: str,
-    filters: dict
+    columns: str = "all",
+    extra: List[str] | None = None
 ) -> pd.DataFrame:
-    df = df.copy()
+    """Возвращает разобранный лист из кэша; исходный файл читается только для пересборки.
+
+    columns="all" — все колонки листа; "used" — только used_columns(extra):
+    они читаются с диска отдельно от остальных и кэшируются в памяти как
+    отдельная таблица — для фильтров и сводки, которым весь лист не нужен.
+    """
+    if columns == "used":
+        names = get_columns(file_id, sheet_name)
+        if names:
+            df = get_dataframe(file_id, sheet_name, columns=used_columns(names, extra), cache_columns=True)
+            if df is not None:
+                return df
+
+    df = get_dataframe(file_id, sheet_name)
+    if df is None:
+        path = get_raw_excel_path(file_id)
+        if sheet_name not in VALID_SHEETS:
+            # Листы вне VALID_SHEETS не кэшируем — читаем напрямую
+            df = read_excel_sheet(path, sheet_name)
+        elif sheet_name not in sheet_names(path):
+            raise ValueError(f"Лист '{sheet_name}' не найден в книге")
+        else:
+            df = build_excel_sheet(file_id, sheet_name)
+    return df[used_columns(list(df.columns), extra)] if columns == "used" else df
+
+def canonical_excel_filters(filters: dict) -> dict:
+    # В отличие от CSV, пустой список здесь значим (developer: [] отсекает все строки),
+    # поэтому только упорядочиваем списки
+    result = {}
+    for key, value in filters.items():
+        if isinstance(value, list):
+            try:
+                value = sorted(set(value))
+            except TypeError:
+                pass
+        result[key] = value
+    return result
+
+def _isin_mask(index: FilterIndex, series: pd.Series, values: list) -> np.ndarray:
+    if index.supports_equality(series):
+        try:
+            return index.equals_mask(series, values)
+        except TypeError:
+            pass
+    return series.isin(values).to_numpy(dtype=bool)
+
+def excel_filter_mask(df: pd.DataFrame, sheet_name: str, filters: dict) -> np.ndarray:
+    """Маска строк листа по фильтрам /analyze_excel.
+
+    Типы колонок приведены при загрузке (coerce_excel_sheet); индексы колонок
+    (значение -> строки, отсортированные площадь и даты) строятся один раз на
+    лист из кэша, поэтому период и площадь — два бинарных поиска.
+    """
+    index = get_filter_index(df)
+    mask = np.ones(len(df), dtype=bool)
 
     # Регион/Область
     region_col = None
@@ -44,11 +151,11 @@ def parse_excel_sheet_with_filters(
         region_col = "Область"
 
     if region_col and filters.get("region"):
-        df = df[df[region_col].isin(filters["region"])]
+        mask &= _isin_mask(index, df[region_col], filters["region"])
 
     # Застройщик
     if "developer" in filters:
-        df = df[df["Застройщик"].isin(filters["developer"])]
+        mask &= _isin_mask(index, df["Застройщик"], filters["developer"])
 
     # Площадь
     area_col = None
@@ -58,11 +165,7 @@ def parse_excel_sheet_with_filters(
         area_col = "Площадь"
 
     if area_col and area_col in df.columns and "area" in filters:
-        area_col_data = pd.to_numeric(df[area_col], errors="coerce")
-        df = df[
-            (area_col_data >= filters["area"]["min"]) &
-            (area_col_data <= filters["area"]["max"])
-        ]
+        mask &= range_mask(index, df[area_col], low=filters["area"]["min"], high=filters["area"]["max"])
 
     # Период
     if sheet_name in ["Действующие", "Завершенные"] and \
@@ -71,15 +174,21 @@ def parse_excel_sheet_with_filters(
         date_start_col = "Дата начала строительства"
         date_end_col = "Дата завершения 2"
 
-        df[date_start_col] = pd.to_datetime(df[date_start_col], errors="coerce")
-        df[date_end_col] = pd.to_datetime(df[date_end_col], errors="coerce")
-
         start = pd.to_datetime(filters["start_date"])
         end = pd.to_datetime(filters["end_date"])
 
-        df = df[
-            (df[date_start_col] >= start) &
-            (df[date_end_col] <= end)
-        ]
+        mask &= range_mask(index, df[date_start_col], low=start)
+        mask &= range_mask(index, df[date_end_col], high=end)
 
-    return df
+    return mask
+
+def parse_excel_sheet_with_filters(
+    df: pd.DataFrame,
+    sheet_name: str,
+    filters: dict
+) -> pd.DataFrame:
+    mask = excel_filter_mask(df, sheet_name, filters)
+    # Выборка материализуется один раз; без фильтров — без копии
+    if mask.all():
+        return df
+    return df[mask]
@@ -0,0 +1,110 @@
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Iterator, List
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Потоковое чтение .xlsx: имена листов берутся из xl/workbook.xml без разбора
+# ячеек, строки листа читаются openpyxl в режиме read_only, и в памяти
+# собираются только нужные колонки.
+
+ExcelSource = str | bytes | BinaryIO
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+@contextmanager
+def _open(source: ExcelSource) -> Iterator[BinaryIO]:
+    # openpyxl судит о формате по расширению пути (кэш хранит книгу как .bin),
+    # поэтому всегда передаём ему открытый файл
+    if isinstance(source, (bytes, bytearray)):
+        yield BytesIO(source)
+    elif isinstance(source, str):
+        with open(source, "rb") as f:
+            yield f
+    else:
+        yield source
+
+def sheet_names(source: ExcelSource) -> List[str]:
+    """Имена листов в порядке книги — из метаданных, не открывая листы."""
+    with _open(source) as f, zipfile.ZipFile(f) as archive:
+        with archive.open("xl/workbook.xml") as workbook:
+            return [
+                element.get("name")
+                for _, element in ET.iterparse(workbook)
+                if element.tag == f"{_MAIN_NS}sheet"
+            ]
+
+def _is_blank(value: Any) -> bool:
+    # Пустой заголовок для read_excel — только пустая ячейка; пробелы — это имя
+    return value is None or value == ""
+
+def _column_names(header: tuple) -> List[Any]:
+    """Имена колонок как у read_excel: пустые — "Unnamed: N", повторы — "X.1", "X.2", ...
+
+    Номер повтора пропускается, если такое имя уже есть среди заголовков;
+    безымянные колонки нумеруются последними.
+    """
+    names = [f"Unnamed: {i}" if _is_blank(value) else value for i, value in enumerate(header)]
+    named = [i for i, value in enumerate(header) if not _is_blank(value)]
+    unnamed = [i for i, value in enumerate(header) if _is_blank(value)]
+    counts: dict[Any, int] = defaultdict(int)
+    for i in named + unnamed:
+        name = base = names[i]
+        count = counts[name]
+        while count > 0:
+            counts[base] = count + 1
+            name = f"{base}.{count}"
+            count = count + 1 if name in names else counts[name]
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+def read_sheet(
+    source: ExcelSource,
+    sheet_name: str,
+    header_row: int = 0,
+    use_column: Callable[[Any], bool] | None = None
+) -> pd.DataFrame:
+    """Читает лист потоково; заголовок — строка header_row (с нуля), как header= у read_excel.
+
+    use_column отбирает колонки по заголовку; остальные значения не сохраняются.
+    Пустые строки в конце листа отбрасываются, как это делает read_excel.
+
+    Значения — как их отдаёт openpyxl: пустая ячейка в строковой колонке — None
+    (у read_excel — NaN), а текст не проходит разбор read_excel ("NA" не
+    становится пропуском, колонка из текстовых чисел остаётся строковой).
+    Числа и даты в колонках схемы листа приводит services/schema.py.
+    """
+    with _open(source) as f:
+        return _read_sheet(f, sheet_name, header_row, use_column)
+
+def _read_sheet(f: BinaryIO, sheet_name: str, header_row: int, use_column: Callable[[Any], bool] | None) -> pd.DataFrame:
+    workbook = load_workbook(f, read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        rows = workbook[sheet_name].iter_rows(min_row=header_row + 1, values_only=True)
+
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        names = _column_names(header)
+        positions = [i for i, name in enumerate(names) if use_column is None or use_column(name)]
+
+        columns: List[list] = [[] for _ in positions]
+        count = filled = 0
+        for row in rows:
+            for values, i in zip(columns, positions):
+                values.append(row[i] if i < len(row) else None)
+            count += 1
+            if any(value is not None for value in row):
+                filled = count
+    finally:
+        workbook.close()
+
+    return pd.DataFrame({names[i]: values[:filled] for values, i in zip(columns, positions)})
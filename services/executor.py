@@ -0,0 +1,167 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from services import metrics
+from services.frame_cache import frame_cache
+
+# Тяжёлая работа (разбор файлов, фильтрация, агрегации) выполняется в пуле
+# процессов, чтобы не блокировать event loop. 0 воркеров — выполнять в потоке
+# текущего процесса (удобно для отладки).
+WORKERS = int(os.environ.get("ANALYTICS_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_IN_FLIGHT = int(os.environ.get("ANALYTICS_MAX_IN_FLIGHT", max(WORKERS, 1)))
+MAX_QUEUE = int(os.environ.get("ANALYTICS_MAX_QUEUE", max(WORKERS, 1) * 4))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("ANALYTICS_JOB_TIMEOUT_SECONDS", 120))
+
+
+class ExecutorRejected(Exception):
+    status_code = 503
+    retry_after = 1
+
+
+class Overloaded(ExecutorRejected):
+    status_code = 429
+
+
+class JobTimeout(ExecutorRejected):
+    status_code = 503
+
+
+class WorkerCrashed(ExecutorRejected):
+    status_code = 503
+
+
+def _run_job(fn: Callable[..., Any], *args: Any) -> tuple[Any, dict]:
+    # Выполняется в процессе пула: замеры этапов возвращаются вместе с результатом
+    with metrics.collect(deferred=True) as timings:
+        result = fn(*args)
+    return result, timings.report(pid=os.getpid(), snapshot=frame_cache.stats())
+
+
+class JobExecutor:
+    """Пул процессов с ограничением числа выполняемых и ожидающих задач.
+
+    Одновременно выполняется не больше max_in_flight задач, ещё max_queue
+    ждут своей очереди; остальные сразу отклоняются (Overloaded). Задача,
+    не уложившаяся в timeout, отклоняется с JobTimeout, но её слот
+    освобождается только когда процесс действительно закончит работу.
+    Если процесс пула упал (OOM, segfault), пул ломается целиком: его
+    задачи отклоняются с WorkerCrashed, а следующая задача создаёт новый пул.
+    """
+
+    def __init__(
+        self,
+        workers: int = WORKERS,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queue: int = MAX_QUEUE,
+        timeout: float = JOB_TIMEOUT_SECONDS
+    ):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._accepted = 0
+        self._running = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.crashed = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor | None:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            # spawn: воркеры не наследуют потоки и блокировки родителя
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _release(self, _future) -> None:
+        self._running -= 1
+        self._slots.release()
+
+    def _drop_pool(self, pool: ProcessPoolExecutor | None) -> None:
+        # Сломанный пул не восстанавливается — сбрасываем, следующий _get_pool создаст новый.
+        # Пул могли уже пересоздать из-за другой задачи — тогда новый не трогаем
+        if pool is not None and self._pool is pool:
+            self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        if self._accepted >= self.max_in_flight + self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Сервер перегружен, повторите запрос позже")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        self._accepted += 1
+        try:
+            with metrics.stage("queue_wait"):
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self.timeout)
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    raise JobTimeout("Задача не дождалась очереди")
+
+            self._running += 1
+            pool = None
+            try:
+                pool = self._get_pool()
+                future = loop.run_in_executor(pool, _run_job, fn, *args)
+            except BaseException as exc:
+                # Задача не принята пулом — слот освобождаем сразу
+                self._release(None)
+                if isinstance(exc, BrokenProcessPool):
+                    self._drop_pool(pool)
+                    self.crashed += 1
+                    raise WorkerCrashed("Процесс обработки завершился аварийно, повторите запрос") from exc
+                raise
+            future.add_done_callback(self._release)
+            try:
+                result, report = await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise JobTimeout("Превышено время выполнения задачи")
+            except BrokenProcessPool as exc:
+                self._drop_pool(pool)
+                self.crashed += 1
+                raise WorkerCrashed("Процесс обработки завершился аварийно, повторите запрос") from exc
+            metrics.replay(report)
+            return result
+        finally:
+            self._accepted -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": max(self._accepted - self._running, 0),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "crashed": self.crashed,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+executor = JobExecutor()
+
+metrics.Gauge("executor_running_jobs", "Выполняемые задачи пула", fn=lambda: executor.stats()["running"])
+metrics.Gauge("executor_queued_jobs", "Задачи, ожидающие слота", fn=lambda: executor.stats()["queued"])
+metrics.Counter("executor_rejected_total", "Задачи, отклонённые из-за перегрузки", fn=lambda: executor.rejected)
+metrics.Counter("executor_timed_out_total", "Задачи, не уложившиеся в timeout", fn=lambda: executor.timed_out)
+metrics.Counter("executor_crashed_total", "Задачи, потерянные из-за падения процесса пула", fn=lambda: executor.crashed)
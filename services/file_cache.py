@@ -1,45 +1,763 @@
+import fcntl
+import hashlib
+import json
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 import uuid
 import os
+import shutil
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+from urllib.parse import quote, unquote
+
+from services.frame_cache import frame_cache
+from services.log import get_logger
+from services.metrics import stage
+from services.result_cache import result_cache
 
 # Кэш теперь внутри проекта
 BASE_DIR = os.path.dirname(__file__)
 CACHE_DIR = os.path.abspath(os.path.join(BASE_DIR, "../cache"))
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-def store_dataframe(df: pd.DataFrame | dict[str, pd.DataFrame]) -> str:
-    file_id = str(uuid.uuid4())
-    path = os.path.join(CACHE_DIR, f"{file_id}.pkl")
+log = get_logger("file_cache")
+
+# Загруженные таблицы храним в Arrow IPC (Feather v2) без сжатия:
+# такие файлы читаются через mmap и позволяют выбирать отдельные колонки.
+# CSV -> {file_id}.feather, набор листов -> {file_id}.sheets/{лист}.feather
+FRAME_EXT = ".feather"
+SHEETS_EXT = ".sheets"
+LEGACY_EXT = ".pkl"
+META_EXT = ".meta.json"
+CUBE_EXT = ".cube.feather"
+RAW_EXCEL_EXT = ".bin"
+TMP_EXT = ".tmp"
+
+# Время последнего обращения к записи — mtime пустого файла {file_id}.access.
+# Сами файлы таблиц не трогаем: их mtime — версия для кэшей в памяти
+ACCESS_EXT = ".access"
+# Чаще, чем раз в столько секунд, отметку обращения не обновляем
+ACCESS_RESOLUTION_SECONDS = 60
+
+# Блокировка записи на время изменения (между процессами пула): {file_id}.lock
+LOCK_EXT = ".lock"
+
+# Общий режим для нескольких воркеров uvicorn: таблицы не копируются в память
+# каждого процесса, а собираются поверх файла, отображённого в память. Числовые
+# колонки, даты и коды категорий остаются страницами файла в кэше ОС — одна
+# копия на все процессы (CACHE_DIR можно держать на tmpfs). Такие колонки
+# только для чтения. Текстовые колонки pandas по-прежнему копирует.
+SHARED_FRAMES = os.environ.get("SHARED_FRAMES", "0") == "1"
+
+# Процессы, держащие таблицы записи в общем режиме: {file_id}.refs/{pid}[.{лист}].
+# Файлы таблиц не меняются на месте (только os.replace), поэтому удаление или
+# замена не ломают уже отображённые таблицы; но место на диске освобождается,
+# лишь когда их отпустят все процессы — поэтому очистка такие записи не трогает
+REFS_EXT = ".refs"
+
+# Обновления CSV (/upsert_csv) не перезаписывают таблицу, а дописываются
+# сегментами: {file_id}.delta/{mtime_ns}-{размер}-{номер}.feather — новые
+# версии изменённых и добавленных строк и их номера в таблице (колонка __row).
+# Имя сегмента начинается с версии основного файла, к которой он относится:
+# после замены основного файла прежние сегменты не читаются. При чтении
+# сегменты накладываются на основной файл срезами, без копирования колонок.
+# Больше DELTA_MAX_SEGMENTS сегментов сливаются в один; когда в них больше
+# DELTA_MAX_FRACTION строк таблицы, они вливаются в основной файл
+DELTA_EXT = ".delta"
+DELTA_ROW = "__row"
+DELTA_MAX_SEGMENTS = int(os.environ.get("DELTA_MAX_SEGMENTS", 16))
+DELTA_MAX_FRACTION = float(os.environ.get("DELTA_MAX_FRACTION", 0.01))
+
+# Одинаковые загрузки находят уже разобранную запись по хэшу содержимого:
+# aliases/{тип}-{sha256} хранит file_id
+ALIASES_DIR = os.path.join(CACHE_DIR, "aliases")
+os.makedirs(ALIASES_DIR, exist_ok=True)
+
+
+def _frame_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{FRAME_EXT}")
+
+def _sheets_dir(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{SHEETS_EXT}")
+
+def _sheet_path(file_id: str, sheet: str) -> str:
+    # Имена листов кириллические и могут содержать "/", поэтому кодируем их
+    return os.path.join(_sheets_dir(file_id), f"{quote(sheet, safe='')}{FRAME_EXT}")
+
+def _legacy_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{LEGACY_EXT}")
+
+def _tmp_path(path: str) -> str:
+    # Временный файл рядом с целевым: os.replace в пределах одной ФС атомарен,
+    # и читатели видят либо старую, либо новую версию целиком
+    return f"{path}.{uuid.uuid4().hex}{TMP_EXT}"
+
+def _version(path: str) -> tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _delta_dir(path: str) -> str:
+    return f"{path[:-len(FRAME_EXT)]}{DELTA_EXT}"
+
+def _segment_paths(path: str, version: tuple[int, int]) -> list[str]:
+    """Сегменты обновлений основного файла этой версии — по порядку записи."""
+    delta_dir = _delta_dir(path)
+    try:
+        names = os.listdir(delta_dir)
+    except FileNotFoundError:
+        return []
+    prefix = f"{version[0]}-{version[1]}-"
+    return [
+        os.path.join(delta_dir, name)
+        for name in sorted(names)
+        if name.startswith(prefix) and name.endswith(FRAME_EXT)
+    ]
+
+def _combined_version(version: tuple[int, int], segments: list[tuple[int, int]]) -> tuple[int, int]:
+    # Без сегментов — версия основного файла, как и раньше
+    return (max([version[0]] + [s[0] for s in segments]), version[1] + sum(s[1] for s in segments))
+
+def _table_version(path: str) -> tuple[int, int]:
+    """Версия таблицы: основной файл вместе с его сегментами обновлений."""
+    while True:
+        version = _version(path)
+        try:
+            segments = [_version(p) for p in _segment_paths(path, version)]
+        except FileNotFoundError:
+            # Сегменты слили параллельно — перечитываем
+            continue
+        if _version(path) == version:
+            return _combined_version(version, segments)
+
+def _read_table(path: str, columns: list[str] | None = None) -> tuple[pa.Table, tuple[int, int]]:
+    """Таблица, отображённая в память, с наложенными сегментами и её версия.
+
+    Версия — именно прочитанных файлов: если основной файл заменили или
+    сегменты слили во время чтения, читаем заново.
+    """
+    while True:
+        version = _version(path)
+        try:
+            table = feather.read_table(path, columns=columns, memory_map=True)
+            paths = _segment_paths(path, version)
+            segments = [
+                feather.read_table(p, columns=None if columns is None else columns + [DELTA_ROW], memory_map=True)
+                for p in paths
+            ]
+            segment_versions = [_version(p) for p in paths]
+        except FileNotFoundError:
+            if not os.path.exists(path):
+                raise
+            continue
+        if _version(path) == version:
+            return _overlay(table, segments), _combined_version(version, segment_versions)
+
+def _latest_rows(segments: list[pa.Table]) -> pa.Table:
+    """Последняя версия каждой строки из сегментов, по возрастанию номера строки."""
+    rows = np.concatenate([s.column(DELTA_ROW).to_numpy() for s in segments])
+    order = np.lexsort((np.arange(len(rows)), rows))
+    last = np.append(rows[order][1:] != rows[order][:-1], True)
+    # Пустой срез последнего сегмента — первым: категории объединённой таблицы
+    # идут в его порядке, как у таблицы, записанной целиком
+    latest = pa.concat_tables([segments[-1].take(pa.array([], pa.int64()))] + segments)
+    return latest.take(pa.array(order[last]))
+
+def _overlay(table: pa.Table, segments: list[pa.Table]) -> pa.Table:
+    if not segments:
+        return table
+    latest = _latest_rows(segments)
+    rows = latest.column(DELTA_ROW).to_numpy()
+    latest = latest.drop_columns([DELTA_ROW])
+
+    # Подряд идущие изменённые строки — один срез сегментов, между ними — срезы основного файла
+    starts = np.flatnonzero(np.diff(rows, prepend=-2) != 1)
+    ends = np.append(starts[1:], len(rows))
+    parts = [latest.slice(0, 0)]
+    position = 0
+    for start, end in zip(starts, ends):
+        row = int(rows[start])
+        if row > position:
+            parts.append(table.slice(position, min(row, table.num_rows) - position))
+        parts.append(latest.slice(start, end - start))
+        position = int(rows[end - 1]) + 1
+    if position < table.num_rows:
+        parts.append(table.slice(position))
+    return pa.concat_tables(parts)
+
+
+def _to_arrow_compatible(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reset_index(drop=True)
+    df.columns = [str(c) for c in df.columns]
+
+    # Колонки со смешанными типами (число и строка в одной колонке Excel)
+    # Arrow не принимает — такие значения приводим к строкам
+    for col in df.columns:
+        if df[col].dtype != "object":
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+def _arrow_table(df: pd.DataFrame) -> pa.Table:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # NaN в дробных колонках храним значениями, а не пропусками Arrow:
+    # колонка без маски пропусков читается в pandas без копирования
+    for i, col in enumerate(df.columns):
+        dtype = df[col].dtype
+        if isinstance(dtype, np.dtype) and dtype.kind == "f":
+            table = table.set_column(i, table.field(i), pa.array(df[col].to_numpy(), from_pandas=False))
+    return table
+
+def _write_table(table: pa.Table, path: str) -> None:
+    # Один пакет строк: колонка — один непрерывный буфер, который можно
+    # отдать в pandas без склейки частей
+    feather.write_feather(table, path, compression="uncompressed", chunksize=max(table.num_rows, 1))
 
-    if isinstance(df, pd.DataFrame) or isinstance(df, dict):
-        pd.to_pickle(df, path)
+def _write_frame(df: pd.DataFrame, path: str) -> None:
+    with stage("frame_write"):
+        _write_table(_arrow_table(_to_arrow_compatible(df)), path)
+
+def _replace_frame(df: pd.DataFrame, path: str) -> None:
+    tmp_path = _tmp_path(path)
+    try:
+        _write_frame(df, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _read_frame(path: str, columns: list[str] | None = None) -> pd.DataFrame:
+    with stage("frame_read"):
+        if columns is not None:
+            available = set(_read_schema_names(path))
+            columns = [c for c in columns if c in available]
+        table, _ = _read_table(path, columns)
+        if SHARED_FRAMES:
+            # По колонке на блок: буферы файла становятся массивами без копирования
+            return table.to_pandas(split_blocks=True)
+        return table.to_pandas()
+
+def _read_schema(path: str) -> pa.Schema:
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema
+
+def _read_schema_names(path: str) -> list[str]:
+    return _read_schema(path).names
+
+
+def store_dataframe(df: pd.DataFrame | dict[str, pd.DataFrame], file_id: str | None = None) -> str:
+    file_id = file_id or str(uuid.uuid4())
+
+    if isinstance(df, pd.DataFrame):
+        _replace_frame(df, _frame_path(file_id))
+        # Сегменты прежней версии уже не читаются — убираем их
+        shutil.rmtree(_delta_dir(_frame_path(file_id)), ignore_errors=True)
+    elif isinstance(df, dict):
+        os.makedirs(_sheets_dir(file_id), exist_ok=True)
+        for sheet, sheet_df in df.items():
+            _replace_frame(sheet_df, _sheet_path(file_id, sheet))
     else:
         raise TypeError("store_dataframe ожидает DataFrame или dict[str, DataFrame]")
 
+    # Записали новую версию — готовые ответы по старой больше не нужны
+    result_cache.invalidate(file_id)
+    touch_entry(file_id, force=True)
     return file_id
 
-def get_dataframe(file_id: str, sheet: str | None = None) -> pd.DataFrame | dict[str, pd.DataFrame] | None:
-    path = os.path.join(CACHE_DIR, f"{file_id}.pkl")
+def _load_cached(key, path: str, columns: list[str] | None, cache_columns: bool = False) -> pd.DataFrame:
+    version = _table_version(path)
+    if columns is None:
+        return frame_cache.get_or_load(key, version, lambda: _attach_frame(key, path))
+
+    if cache_columns:
+        # Проекция для частых запросов — отдельная запись кэша: один и тот же
+        # объект между запросами, поэтому и индексы фильтров по нему живут в кэше
+        projection = (key if isinstance(key, tuple) else (key,)) + (tuple(columns),)
+        return frame_cache.get_or_load(projection, version, lambda: _attach_frame(projection, path, columns))
+
+    # Если таблица уже в памяти — просто берём нужные колонки,
+    # иначе читаем с диска только их, не загружая остальное
+    cached = frame_cache.peek(key, version)
+    if cached is not None:
+        return cached[[c for c in columns if c in cached.columns]]
+    return _read_frame(path, columns)
+
+def _attach_frame(key, path: str, columns: list[str] | None = None) -> pd.DataFrame:
+    df = _read_frame(path, columns)
+    if SHARED_FRAMES:
+        # Снимается, когда таблица уходит из кэша процесса (frame_cache.on_remove)
+        _add_ref(key)
+    return df
+
+def get_dataframe(
+    file_id: str,
+    sheet: str | None = None,
+    columns: list[str] | None = None,
+    cache_columns: bool = False
+) -> pd.DataFrame | dict[str, pd.DataFrame] | None:
+    if os.path.exists(_legacy_path(file_id)):
+        migrate_legacy_pickle(file_id)
+
+    frame_path = _frame_path(file_id)
+    if os.path.exists(frame_path):
+        touch_entry(file_id)
+        return _load_cached(file_id, frame_path, columns, cache_columns)
+
+    sheets_dir = _sheets_dir(file_id)
+    if not os.path.isdir(sheets_dir):
+        # Записи нет (или её вытеснили с диска) — освобождаем и память
+        frame_cache.invalidate_file(file_id)
+        return None
+
+    touch_entry(file_id)
+
+    if sheet:
+        sheet_path = _sheet_path(file_id, sheet)
+        if not os.path.exists(sheet_path):
+            return None
+        return _load_cached((file_id, sheet), sheet_path, columns, cache_columns)
+
+    return {
+        name: _load_cached((file_id, name), _sheet_path(file_id, name), columns)
+        for name in list_sheets(file_id)
+    }
+
+def open_table(
+    file_id: str,
+    sheet: str | None = None,
+    columns: list[str] | None = None
+) -> tuple[pa.Table, tuple[int, int]] | None:
+    """Таблица Arrow, отображённая в память, и её версия (см. get_file_version).
+
+    Для выгрузок: строки читаются с диска по мере обращения, так что память
+    не зависит от размера файла, а уже открытая таблица остаётся целой, даже
+    если файл тем временем заменили. Версия — именно открытого файла: если
+    его заменили во время открытия, открываем заново.
+    """
+    if os.path.exists(_legacy_path(file_id)):
+        migrate_legacy_pickle(file_id)
+
+    path = _sheet_path(file_id, sheet) if sheet else _frame_path(file_id)
+    try:
+        table, version = _read_table(path, columns)
+    except FileNotFoundError:
+        return None
+    touch_entry(file_id)
+    return table, version
+
+def table_rows(table: pa.Table, rows: np.ndarray) -> pd.DataFrame:
+    """Строки открытой таблицы по номерам; без номеров — пустая таблица с типами колонок."""
+    return table.take(pa.array(rows, pa.int64())).to_pandas()
+
+def get_file_version(file_id: str, sheet: str | None = None) -> tuple[int, int] | None:
+    """Версия сохранённой таблицы (mtime, размер — с учётом сегментов); None, если её нет."""
+    path = _sheet_path(file_id, sheet) if sheet else _frame_path(file_id)
+    try:
+        return _table_version(path)
+    except FileNotFoundError:
+        return None
+
+def segment_table(file_id: str, rows: pd.DataFrame) -> pa.Table | None:
+    """Сегмент обновления таблицы file_id: строки rows (индекс — номера строк) в её схеме.
+
+    None — значения не укладываются в типы файла (например, категориям не
+    хватает разрядности кодов): таблицу нужно перезаписать целиком.
+    """
+    schema = _read_schema(_frame_path(file_id))
+    table = _arrow_table(_to_arrow_compatible(rows)).append_column(DELTA_ROW, pa.array(rows.index, pa.int64()))
+    try:
+        return table.cast(schema.append(pa.field(DELTA_ROW, pa.int64())))
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, ValueError):
+        return None
+
+def store_segment(file_id: str, segment: pa.Table) -> None:
+    """Дописывает сегмент (см. segment_table) к таблице; вызывается под entry_lock."""
+    path = _frame_path(file_id)
+    version = _version(path)
+    _write_segment(path, version, _next_segment(_segment_paths(path, version)), segment)
+    paths = _segment_paths(path, version)
+
+    # Записали новую версию — готовые ответы по старой больше не нужны
+    result_cache.invalidate(file_id)
+    touch_entry(file_id, force=True)
+
+    segment_rows = sum(feather.read_table(p, columns=[DELTA_ROW], memory_map=True).num_rows for p in paths)
+    if segment_rows > DELTA_MAX_FRACTION * _num_rows(path):
+        compact_table(file_id)
+    elif len(paths) > DELTA_MAX_SEGMENTS:
+        _merge_segments(path, version, paths)
+
+def _next_segment(paths: list[str]) -> int:
+    # Номер — последняя часть имени; после слияния нумерация продолжается
+    return int(os.path.basename(paths[-1])[:-len(FRAME_EXT)].rsplit("-", 1)[1]) + 1 if paths else 0
+
+def _write_segment(path: str, version: tuple[int, int], number: int, segment: pa.Table) -> None:
+    delta_dir = _delta_dir(path)
+    os.makedirs(delta_dir, exist_ok=True)
+    target = os.path.join(delta_dir, f"{version[0]}-{version[1]}-{number:06d}{FRAME_EXT}")
+    tmp_path = _tmp_path(target)
+    try:
+        with stage("segment_write"):
+            # Словари категорий частей объединяются: в файле один пакет строк
+            _write_table(segment.unify_dictionaries().combine_chunks(), tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _merge_segments(path: str, version: tuple[int, int], paths: list[str]) -> None:
+    # Новый сегмент с последними версиями строк пишется раньше, чем удаляются
+    # прежние: читатель видит либо их, либо его (с тем же содержимым)
+    segments = [feather.read_table(p, memory_map=True) for p in paths]
+    _write_segment(path, version, _next_segment(paths), _latest_rows(segments))
+    for p in paths:
+        os.remove(p)
+
+def _num_rows(path: str) -> int:
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+def compact_table(file_id: str) -> None:
+    """Вливает сегменты обновлений в основной файл таблицы; вызывается под entry_lock."""
+    path = _frame_path(file_id)
+    with stage("compact"):
+        table, _ = _read_table(path)
+        _replace_frame(table.to_pandas(), path)
+    shutil.rmtree(_delta_dir(path), ignore_errors=True)
+    result_cache.invalidate(file_id)
+    log.info("cache.compacted", file_id=file_id, rows=table.num_rows)
+
+def get_columns(file_id: str, sheet: str | None = None) -> list[str]:
+    if os.path.exists(_legacy_path(file_id)):
+        migrate_legacy_pickle(file_id)
+
+    path = _sheet_path(file_id, sheet) if sheet else _frame_path(file_id)
     if not os.path.exists(path):
+        return []
+    return _read_schema_names(path)
+
+def list_sheets(file_id: str) -> list[str]:
+    sheets_dir = _sheets_dir(file_id)
+    if not os.path.isdir(sheets_dir):
+        return []
+    return sorted(
+        unquote(name[:-len(FRAME_EXT)])
+        for name in os.listdir(sheets_dir)
+        if name.endswith(FRAME_EXT)
+    )
+
+def migrate_legacy_pickle(file_id: str) -> bool:
+    """Переводит старую запись {file_id}.pkl в колоночный формат."""
+    path = _legacy_path(file_id)
+    if not os.path.exists(path):
+        return False
+
+    try:
+        data = pd.read_pickle(path)
+    except FileNotFoundError:
+        # Запись уже перевёл параллельный запрос
+        return False
+
+    if isinstance(data, pd.DataFrame):
+        _replace_frame(data, _frame_path(file_id))
+    elif isinstance(data, dict):
+        tmp_dir = _tmp_path(_sheets_dir(file_id))
+        os.makedirs(tmp_dir)
+        for sheet, sheet_df in data.items():
+            _write_frame(sheet_df, os.path.join(tmp_dir, os.path.basename(_sheet_path(file_id, sheet))))
+        try:
+            os.rename(tmp_dir, _sheets_dir(file_id))
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    else:
+        return False
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    log.info("cache.pickle_migrated", file_id=file_id)
+    return True
+
+def migrate_legacy_pickles() -> int:
+    migrated = 0
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(LEGACY_EXT) and migrate_legacy_pickle(name[:-len(LEGACY_EXT)]):
+            migrated += 1
+    return migrated
+
+def _metadata_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{META_EXT}")
+
+def store_metadata(file_id: str, meta: dict) -> None:
+    path = _metadata_path(file_id)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+@lru_cache(maxsize=256)
+def _load_metadata(path: str, version: tuple[int, int]) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def get_metadata(file_id: str) -> dict | None:
+    """Метаданные фильтров файла; разобранный JSON переиспользуется, пока файл не изменился."""
+    path = _metadata_path(file_id)
+    try:
+        version = _version(path)
+    except FileNotFoundError:
         return None
+    touch_entry(file_id)
+    return _load_metadata(path, version)
+
+def _cube_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{CUBE_EXT}")
 
-    data = pd.read_pickle(path)
+def store_cube(file_id: str, cube: pd.DataFrame) -> None:
+    # Пишем во временный файл: читатели видят либо старый, либо новый куб
+    _replace_frame(cube, _cube_path(file_id))
 
-    if sheet and isinstance(data, dict):
-        return data.get(sheet)
+def get_cube(file_id: str) -> pd.DataFrame | None:
+    """Предагрегированный куб CSV-файла; None, если он не построен."""
+    path = _cube_path(file_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        return _load_cached((file_id, CUBE_EXT), path, None)
+    except FileNotFoundError:
+        return None
 
-    return data
+def _raw_excel_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{RAW_EXCEL_EXT}")
 
 def store_raw_excel(content: bytes) -> str:
     file_id = str(uuid.uuid4())
-    path = os.path.join(CACHE_DIR, f"{file_id}.bin")
-    with open(path, "wb") as f:
+    path = _raw_excel_path(file_id)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as f:
         f.write(content)
+    os.replace(tmp_path, path)
+    touch_entry(file_id, force=True)
     return file_id
 
-def get_raw_excel_bytes(file_id: str) -> bytes:
-    path = os.path.join(CACHE_DIR, f"{file_id}.bin")
+def store_raw_excel_file(path: str) -> str:
+    """Переносит уже записанный на диск файл книги в кэш, не читая его в память."""
+    file_id = str(uuid.uuid4())
+    target = _raw_excel_path(file_id)
+    # Загрузка может лежать на другой ФС: сначала копируем рядом, затем атомарно переименовываем
+    tmp_path = _tmp_path(target)
+    shutil.move(path, tmp_path)
+    os.replace(tmp_path, target)
+    touch_entry(file_id, force=True)
+    return file_id
+
+def get_raw_excel_path(file_id: str) -> str:
+    path = _raw_excel_path(file_id)
     if not os.path.exists(path):
         raise FileNotFoundError("Файл не найден")
-    with open(path, "rb") as f:
+    touch_entry(file_id)
+    return path
+
+def get_raw_excel_bytes(file_id: str) -> bytes:
+    with open(get_raw_excel_path(file_id), "rb") as f:
         return f.read()
+
+def get_cache_stats() -> dict:
+    return frame_cache.stats()
+
+
+# Время последней отметки обращения по file_id в этом процессе
+_touched: dict[str, float] = {}
+
+def _access_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{ACCESS_EXT}")
+
+def touch_entry(file_id: str, force: bool = False) -> None:
+    """Отмечает обращение к записи — по этой отметке работают TTL и LRU на диске."""
+    now = time.time()
+    if not force and now - _touched.get(file_id, 0.0) < ACCESS_RESOLUTION_SECONDS:
+        return
+    _touched[file_id] = now
+    path = _access_path(file_id)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        with open(path, "a"):
+            pass
+
+def entry_paths(file_id: str) -> list[str]:
+    """Все пути, из которых может состоять запись file_id."""
+    return [
+        _frame_path(file_id), _delta_dir(_frame_path(file_id)), _sheets_dir(file_id), _legacy_path(file_id),
+        _metadata_path(file_id),
+        _cube_path(file_id), _raw_excel_path(file_id), _access_path(file_id), _lock_path(file_id),
+        _refs_dir(file_id),
+    ]
+
+def _lock_path(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{LOCK_EXT}")
+
+@contextmanager
+def entry_lock(file_id: str) -> Iterator[None]:
+    """Эксклюзивная блокировка записи: параллельные изменения одного файла идут по очереди."""
+    with open(_lock_path(file_id), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _refs_dir(file_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{file_id}{REFS_EXT}")
+
+def _ref_path(key) -> str:
+    # Ключи кэша таблиц: file_id, (file_id, лист), (file_id, CUBE_EXT) и проекции
+    # с кортежем колонок в конце — вместо колонок в имени их хэш
+    file_id, *parts = key if isinstance(key, tuple) else (key,)
+    names = [str(os.getpid())] + [
+        hashlib.sha1("\0".join(part).encode()).hexdigest()[:16] if isinstance(part, tuple) else quote(str(part), safe="")
+        for part in parts
+    ]
+    return os.path.join(_refs_dir(file_id), ".".join(names))
+
+def _add_ref(key) -> None:
+    path = _ref_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a"):
+        pass
+
+def _release_ref(key) -> None:
+    try:
+        os.remove(_ref_path(key))
+    except FileNotFoundError:
+        pass
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def entry_refs(file_id: str) -> list[int]:
+    """Живые процессы, держащие таблицы записи; отметки завершившихся удаляются."""
+    refs_dir = _refs_dir(file_id)
+    try:
+        names = os.listdir(refs_dir)
+    except FileNotFoundError:
+        return []
+
+    pids = set()
+    for name in names:
+        pid = int(name.split(".", 1)[0])
+        if _pid_alive(pid):
+            pids.add(pid)
+            continue
+        try:
+            os.remove(os.path.join(refs_dir, name))
+        except FileNotFoundError:
+            pass
+    if not pids:
+        try:
+            os.rmdir(refs_dir)
+        except OSError:
+            pass
+    return sorted(pids)
+
+if SHARED_FRAMES:
+    frame_cache.on_remove = _release_ref
+
+def entry_exists(file_id: str) -> bool:
+    # Метаданные пишутся последними: без них запись ещё не готова (или уже удаляется)
+    return os.path.exists(_metadata_path(file_id))
+
+def delete_entry(file_id: str) -> int:
+    """Удаляет запись с диска и из кэшей процесса; возвращает число освобождённых байт."""
+    freed = 0
+    # Сначала метаданные: запись перестаёт считаться готовой раньше, чем пропадут таблицы
+    for path in sorted(entry_paths(file_id), key=lambda p: p != _metadata_path(file_id)):
+        try:
+            if os.path.isdir(path):
+                freed += dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                freed += os.stat(path).st_size
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+    frame_cache.invalidate_file(file_id)
+    result_cache.invalidate(file_id)
+    _touched.pop(file_id, None)
+    return freed
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+def _alias_path(kind: str, digest: str) -> str:
+    return os.path.join(ALIASES_DIR, f"{kind}-{digest}")
+
+def register_content(kind: str, digest: str, file_id: str) -> None:
+    """Связывает хэш содержимого загрузки с разобранной записью."""
+    path = _alias_path(kind, digest)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(file_id)
+    os.replace(tmp_path, path)
+
+def find_by_content(kind: str, digest: str) -> str | None:
+    """file_id уже разобранной загрузки с тем же содержимым; None, если её нет."""
+    path = _alias_path(kind, digest)
+    try:
+        with open(path, encoding="utf-8") as f:
+            file_id = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if not entry_exists(file_id):
+        return None
+    touch_entry(file_id, force=True)
+    return file_id
+
+def list_aliases() -> dict[str, str]:
+    """Имя псевдонима -> file_id."""
+    aliases = {}
+    for name in os.listdir(ALIASES_DIR):
+        if name.endswith(TMP_EXT):
+            continue
+        try:
+            with open(os.path.join(ALIASES_DIR, name), encoding="utf-8") as f:
+                aliases[name] = f.read().strip()
+        except FileNotFoundError:
+            continue
+    return aliases
+
+def remove_aliases(file_id: str) -> int:
+    """Убирает псевдонимы содержимого, указывающие на file_id (например, после изменения записи)."""
+    removed = 0
+    for name, target in list_aliases().items():
+        if target == file_id:
+            try:
+                os.remove(os.path.join(ALIASES_DIR, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+if __name__ == "__main__":
+    print(f"Переведено записей: {migrate_legacy_pickles()}")
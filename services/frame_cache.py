@@ -0,0 +1,183 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+
+from services import metrics
+
+# Бюджет памяти под загруженные DataFrame в одном процессе (байты)
+DEFAULT_MAX_BYTES = int(os.environ.get("FRAME_CACHE_MAX_BYTES", 1024 ** 3))
+
+
+def estimate_size(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values())
+    return 0
+
+
+class _Entry:
+    __slots__ = ("value", "version", "size")
+
+    def __init__(self, value: Any, version: Hashable, size: int):
+        self.value = value
+        self.version = version
+        self.size = size
+
+
+class FrameCache:
+    """LRU-кэш загруженных DataFrame с ограничением по суммарному размеру в байтах.
+
+    Запись привязана к версии файла (например, mtime и размер): если файл
+    заменили, следующая загрузка увидит другую версию и перечитает его.
+    Параллельные запросы одного ключа ждут единственную загрузку.
+
+    on_remove вызывается с ключом, когда значение уходит из кэша (вытеснено,
+    сброшено, заменено новой версией или не поместилось в бюджет).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, on_remove: Callable[[Hashable], None] | None = None):
+        self.max_bytes = max_bytes
+        self.on_remove = on_remove
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Блокировка загрузки ключа и число потоков, которые её держат или ждут;
+        # запись удаляется, когда уходит последний — словарь не растёт с числом файлов
+        self._key_locks: dict[Hashable, list] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, version: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self._lookup(key, version)
+        if value is not None:
+            return value
+
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                # Пока ждали блокировку, значение мог загрузить другой поток
+                value = self._lookup(key, version)
+                if value is not None:
+                    return value
+
+                with self._lock:
+                    self.misses += 1
+                value = loader()
+                if value is not None:
+                    self._put(key, version, value)
+                return value
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def peek(self, key: Hashable, version: Hashable) -> Any:
+        """Возвращает значение, только если оно уже загружено, без загрузки."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                return entry.value
+            return None
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+        if entry is not None:
+            self._removed([key])
+
+    def invalidate_file(self, file_id: str) -> None:
+        """Убирает все таблицы файла: саму таблицу, его листы и куб."""
+        with self._lock:
+            keys = [
+                k for k in self._entries
+                if k == file_id or (isinstance(k, tuple) and k and k[0] == file_id)
+            ]
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        self._removed(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _lookup(self, key: Hashable, version: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+            if entry is None:
+                return None
+            # Файл заменили — старая версия больше не нужна
+            del self._entries[key]
+            self._bytes -= entry.size
+        self._removed([key])
+        return None
+
+    def _put(self, key: Hashable, version: Hashable, value: Any) -> None:
+        size = estimate_size(value)
+        removed = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+
+            if size > self.max_bytes:
+                # Объект больше всего бюджета не кэшируем, чтобы не вытеснить всё остальное
+                removed.append(key)
+            else:
+                while self._entries and self._bytes + size > self.max_bytes:
+                    evicted_key, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.size
+                    self.evictions += 1
+                    removed.append(evicted_key)
+
+                self._entries[key] = _Entry(value, version, size)
+                self._bytes += size
+        self._removed(removed)
+
+    def _removed(self, keys: list) -> None:
+        # Вызывается вне блокировки: обработчик может обращаться к диску
+        if self.on_remove is not None:
+            for key in keys:
+                self.on_remove(key)
+
+
+frame_cache = FrameCache()
+
+# Кэш у каждого процесса свой: значения по процессам пула приходят с результатами задач
+for _name, _key, _metric, _help in [
+    ("frame_cache_bytes", "bytes", metrics.Gauge, "Объём таблиц в кэше, байт"),
+    ("frame_cache_entries", "entries", metrics.Gauge, "Число таблиц в кэше"),
+    ("frame_cache_hits_total", "hits", metrics.Counter, "Попадания в кэш таблиц"),
+    ("frame_cache_misses_total", "misses", metrics.Counter, "Промахи кэша таблиц"),
+    ("frame_cache_evictions_total", "evictions", metrics.Counter, "Вытеснения из кэша таблиц"),
+]:
+    _metric(_name, _help, labels=("pid",), fn=lambda key=_key: metrics.per_process(frame_cache.stats(), key))
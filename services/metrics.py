@@ -0,0 +1,227 @@
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+# Метрики в текстовом формате Prometheus. Этапы запроса (чтение таблицы,
+# фильтрация, агрегация, JSON) замеряются через stage(); задачи пула процессов
+# возвращают свои замеры вместе с результатом, и они учитываются в основном
+# процессе — там, где их читает /metrics.
+
+SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROW_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn: Callable[[], float] | None = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._fn = fn
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        if self._fn is not None:
+            # fn возвращает число или {значения меток: число}
+            value = self._fn()
+            if not isinstance(value, dict):
+                yield self.name, "", value
+                return
+            values = list(value.items())
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Счётчики по корзинам, затем сумма и число наблюдений
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket", _format_labels(self.labels, key, le), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, key), series[-2]
+            yield f"{self.name}_count", _format_labels(self.labels, key), series[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter("http_requests_total", "Число HTTP-запросов", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"))
+STAGE_LATENCY = Histogram("analytics_stage_duration_seconds", "Время этапа обработки", ("stage",))
+STAGE_ROWS = Histogram("analytics_stage_rows", "Число строк на этапе обработки", ("stage",), buckets=ROW_BUCKETS)
+
+
+def _rss_bytes() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return _peak_rss_bytes()
+
+def _peak_rss_bytes() -> float:
+    # ru_maxrss в Linux — килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+Gauge("process_resident_memory_bytes", "Текущий RSS процесса", fn=_rss_bytes)
+Gauge("process_peak_resident_memory_bytes", "Максимальный RSS процесса", fn=_peak_rss_bytes)
+
+
+# Последние снимки статистики процессов пула (pid -> значения), см. snapshot в отчёте задачи
+worker_snapshots: dict[int, dict] = {}
+
+
+class Timings:
+    """Замеры этапов одного запроса или одной задачи пула.
+
+    deferred — замеры делаются в процессе пула: в гистограммы их запишет
+    основной процесс, получив отчёт задачи.
+    """
+
+    def __init__(self, deferred: bool = False):
+        self.deferred = deferred
+        self.stages: list[tuple[str, float]] = []
+        self.rows: list[tuple[str, int]] = []
+
+    def report(self, **extra) -> dict:
+        return {"stages": self.stages, "rows": self.rows, **extra}
+
+    def server_timing(self) -> str:
+        totals: dict[str, float] = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+_timings: ContextVar[Timings | None] = ContextVar("timings", default=None)
+
+def record_stage(name: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is None or not timings.deferred:
+        STAGE_LATENCY.observe(seconds, stage=name)
+    if timings is not None:
+        timings.stages.append((name, seconds))
+
+def record_rows(name: str, rows: int) -> None:
+    timings = _timings.get()
+    if timings is None or not timings.deferred:
+        STAGE_ROWS.observe(rows, stage=name)
+    if timings is not None:
+        timings.rows.append((name, rows))
+
+def replay(report: dict) -> None:
+    """Учитывает замеры, вернувшиеся из задачи пула."""
+    for name, seconds in report["stages"]:
+        record_stage(name, seconds)
+    for name, rows in report["rows"]:
+        record_rows(name, rows)
+    if "snapshot" in report:
+        worker_snapshots[report["pid"]] = report["snapshot"]
+
+def per_process(own: dict, key: str) -> dict:
+    """Значение key по процессам: текущий процесс и последние снимки из пула."""
+    values = {(str(pid),): snapshot[key] for pid, snapshot in worker_snapshots.items() if key in snapshot}
+    values[(str(os.getpid()),)] = own[key]
+    return values
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+@contextmanager
+def collect(deferred: bool = False) -> Iterator[Timings]:
+    timings = Timings(deferred)
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from services import metrics
+
+# Готовые ответы /analyze_* по (file_id, версия файла, нормализованные фильтры)
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 1024))
+DEFAULT_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 300))
+
+CACHE_HEADER = "X-Cache"
+
+
+def make_key(endpoint: str, file_id: str, version: Hashable, params: Any) -> tuple:
+    # Параметры уже нормализованы; sort_keys убирает зависимость от порядка ключей
+    return (endpoint, file_id, version, json.dumps(params, sort_keys=True, ensure_ascii=False, default=str))
+
+
+class ResultCache:
+    """LRU-кэш результатов с ограничением по числу записей и времени жизни."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, file_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == file_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+result_cache = ResultCache()
+
+metrics.Gauge("result_cache_entries", "Число готовых ответов в кэше", fn=lambda: result_cache.stats()["entries"])
+metrics.Counter("result_cache_hits_total", "Попадания в кэш ответов", fn=lambda: result_cache.hits)
+metrics.Counter("result_cache_misses_total", "Промахи кэша ответов", fn=lambda: result_cache.misses)
+metrics.Counter("result_cache_evictions_total", "Вытеснения из кэша ответов", fn=lambda: result_cache.evictions)
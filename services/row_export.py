@@ -0,0 +1,128 @@
+import asyncio
+from urllib.parse import quote
+import numpy as np
+import pyarrow as pa
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Awaitable, Callable, List
+
+from services.log import get_logger
+from services.metrics import record_rows
+
+# Выгрузка отфильтрованных строк. Фильтр (в процессе пула) возвращает только
+# номера строк; сами строки берутся из таблицы Arrow, отображённой в память,
+# и отдаются частями по EXPORT_CHUNK_ROWS — память ответа не зависит от
+# числа строк, а первые байты уходят сразу после фильтрации.
+#
+# Пагинация: если limit исчерпан раньше, чем кончились строки, в X-Next-Cursor —
+# курсор следующей страницы: номер строки таблицы, с которой начать, и версия
+# файла, по которой он выдан. Таблица открывается до фильтрации, фильтр в
+# процессе пула проверяет, что считал ту же версию, — номера строк и курсоры
+# всегда относятся к одной версии файла, даже если его тем временем обновили
+# (/upsert_csv). Курсор от прежней версии отклоняется (VersionChanged).
+
+log = get_logger("export")
+
+EXPORT_CHUNK_ROWS = 5_000
+CURSOR_HEADER = "X-Next-Cursor"
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+class VersionChanged(Exception):
+    """Файл изменился: номера строк или курсор относятся к другой его версии."""
+    status_code = 409
+
+
+def encode_cursor(row: int, version: tuple[int, int]) -> str:
+    return f"{row}.{version[0]}.{version[1]}"
+
+def decode_cursor(cursor: str | None) -> tuple[int | None, tuple[int, int] | None]:
+    """Номер строки и версия файла из курсора; (None, None) — с начала."""
+    if cursor is None:
+        return None, None
+    try:
+        row, mtime, size = (int(part) for part in str(cursor).split("."))
+    except ValueError:
+        raise ValueError("Некорректный cursor")
+    return row, (mtime, size)
+
+def check_version(expected: tuple[int, int] | None, actual: tuple[int, int] | None) -> None:
+    if expected is not None and actual != expected:
+        raise VersionChanged("Файл изменился, начните выгрузку заново")
+
+async def open_and_select(
+    open_table: Callable[[], tuple[pa.Table, tuple[int, int]] | None],
+    select: Callable[[tuple[int, int]], Awaitable[Any]],
+    cursor_version: tuple[int, int] | None,
+) -> tuple[pa.Table, tuple[int, int], Any] | None:
+    """Открывает таблицу и отбирает её строки по той же версии файла.
+
+    select(version) фильтрует в процессе пула и бросает VersionChanged, если
+    файл уже другой. Выгрузку с начала повторяем один раз по новой версии;
+    продолжение по курсору — нет: его строки относятся к прежней версии.
+    """
+    for attempt in range(2):
+        opened = open_table()
+        if opened is None:
+            return None
+        table, version = opened
+        check_version(cursor_version, version)
+        try:
+            return table, version, await select(version)
+        except VersionChanged:
+            if cursor_version is not None or attempt:
+                raise
+    return None
+
+def select_rows(mask: np.ndarray, cursor: int | None = None, limit: int | None = None) -> tuple[np.ndarray, int | None]:
+    """Номера строк страницы и курсор следующей (None — страница последняя)."""
+    start = cursor or 0
+    rows = np.flatnonzero(mask[start:]) + start
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        next_cursor = int(rows[limit])
+        rows = rows[:limit]
+    # Номера строк передаются из процесса пула — берём тип поуже
+    return rows.astype(np.int32 if len(mask) < 2 ** 31 else np.int64), next_cursor
+
+def validate_export(fmt: str, columns: List[str] | None, available: List[str], cursor: int | None, limit: int | None) -> None:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Формат выгрузки: {', '.join(EXPORT_FORMATS)}")
+    if cursor is not None and cursor < 0:
+        raise ValueError("cursor не может быть отрицательным")
+    if limit is not None and limit <= 0:
+        raise ValueError("limit должен быть положительным")
+    missing = [col for col in columns or [] if col not in available]
+    if missing:
+        raise ValueError(f"Нет колонок: {', '.join(missing)}")
+
+def encode_chunk(table: pa.Table, rows: np.ndarray, fmt: str, header: bool) -> bytes:
+    df = table.take(pa.array(rows)).to_pandas()
+    if fmt == "csv":
+        # Разделитель как в выгрузках Битрикс; BOM — чтобы Excel узнал UTF-8
+        text = df.to_csv(sep=";", index=False, header=header)
+        return text.encode("utf-8-sig" if header else "utf-8")
+    if df.empty:
+        return b""
+    return df.to_json(orient="records", lines=True, force_ascii=False, date_format="iso").encode("utf-8")
+
+async def stream_rows(table: pa.Table, rows: np.ndarray, fmt: str) -> AsyncIterator[bytes]:
+    # Кодирование части — работа CPU, уводим её из цикла событий
+    for start in range(0, max(len(rows), 1), EXPORT_CHUNK_ROWS):
+        chunk = rows[start:start + EXPORT_CHUNK_ROWS]
+        yield await asyncio.to_thread(encode_chunk, table, chunk, fmt, start == 0)
+
+def export_response(table: pa.Table, rows: np.ndarray, fmt: str, next_cursor: str | None, filename: str) -> StreamingResponse:
+    record_rows("exported", len(rows))
+    log.info("export.start", rows=len(rows), columns=table.num_columns, format=fmt, next_cursor=next_cursor)
+    headers = {
+        # Имя листа кириллицей — заголовки latin-1, поэтому имя по RFC 5987
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(f'{filename}.{fmt}')}",
+        "X-Rows": str(len(rows)),
+    }
+    if next_cursor is not None:
+        headers[CURSOR_HEADER] = str(next_cursor)
+    return StreamingResponse(stream_rows(table, rows, fmt), media_type=EXPORT_FORMATS[fmt], headers=headers)
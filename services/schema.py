@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List
+
+# Схемы колонок по источникам: какие колонки приводятся к датам и числам при
+# загрузке. Разбор идёт по уникальным значениям колонки: в выгрузках CRM даты
+# и суммы сильно повторяются, и каждое значение разбирается один раз.
+#
+# Отчёт о приведении — по колонке: сколько непустых значений было, сколько не
+# удалось разобрать, и несколько примеров таких значений:
+#   {"Сумма": {"kind": "number", "values": 1000, "failed": 2, "examples": ["н/д"]}}
+
+DATE = "date"
+NUMBER = "number"
+
+# Сколько неразобранных значений колонки сохранять в отчёте
+REPORT_EXAMPLES = 5
+
+# Пробелы-разделители разрядов; \s включает и неразрывные пробелы
+_NUMBER_SPACES = r"\s"
+
+CSV_SCHEMA = {
+    "date_formats": ["%d.%m.%Y %H:%M:%S", "%d.%m.%Y"],
+    "columns": {
+        "Дата создания": DATE,
+        "Дата изменения": DATE,
+        "Дата начала": DATE,
+        "Предполагаемая дата закрытия": DATE,
+        "Дата регистрации заявления (субсидирование)": DATE,
+        "Сумма": NUMBER,
+        "Стоимость незавершенного строительства (гарантирование)": NUMBER,
+        "Площадь ЗУ, га (гарантирование)": NUMBER,
+        "Цена реализации 1 кв.м жилья в тыс.тенге/1 м2 (гарантирование)": NUMBER,
+    },
+}
+
+# В Excel даты обычно уже datetime; строки встречаются, если ячейка введена текстом.
+# Такие строки разбираются только по этим форматам (день первым), без угадывания
+# формата pd.to_datetime, как было до схем: "01.02.2023" — 1 февраля (угадывание
+# давало 2 января), а "03/15/2023" или "15 Mar 2023" не разбираются и попадают
+# в отчёт о приведении
+EXCEL_DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S"]
+
+_EXCEL_ACTIVE_COLUMNS = {
+    "Площадь, кв.м по Проекту": NUMBER,
+    "Стоимость": NUMBER,
+    "Дата начала строительства": DATE,
+    "Дата завершения 2": DATE,
+}
+_EXCEL_REVIEW_COLUMNS = {
+    "Площадь": NUMBER,
+    "Стоимость": NUMBER,
+}
+
+EXCEL_SCHEMAS = {
+    "Действующие": {"date_formats": EXCEL_DATE_FORMATS, "columns": _EXCEL_ACTIVE_COLUMNS},
+    "Завершенные": {"date_formats": EXCEL_DATE_FORMATS, "columns": _EXCEL_ACTIVE_COLUMNS},
+    "На модерации": {"date_formats": EXCEL_DATE_FORMATS, "columns": _EXCEL_REVIEW_COLUMNS},
+    "Отозванные": {"date_formats": EXCEL_DATE_FORMATS, "columns": _EXCEL_REVIEW_COLUMNS},
+}
+
+
+def schema_columns(schema: dict) -> List[str]:
+    return list(schema["columns"])
+
+def _is_text(values: pd.Series) -> pd.Series:
+    return values.map(lambda v: isinstance(v, str)).astype(bool)
+
+def _strip_text(values: pd.Series) -> pd.Series:
+    # Строки обрезаем, остальные значения (datetime, числа) оставляем как есть
+    values = values.copy()
+    is_text = _is_text(values)
+    if is_text.any():
+        # .str на пустой выборке без строк (например, одни datetime) не работает
+        values[is_text] = values[is_text].str.strip()
+    return values
+
+def _parse_date_values(values: pd.Series, formats: List[str]) -> pd.Series:
+    result = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    remaining = values.notna()
+    for fmt in formats:
+        if not remaining.any():
+            break
+        result[remaining] = pd.to_datetime(values[remaining], format=fmt, errors="coerce")
+        remaining = remaining & result.isna()
+    return result
+
+def _parse_number_values(values: pd.Series) -> pd.Series:
+    # Локаль выгрузок: "1 234 567,89" и "1,234,567.89". Дробный разделитель —
+    # последний из ',' и '.', если запятая в числе одна; остальные — разряды.
+    # Поэтому "1,234" — это 1.234, а не 1234 (pd.to_numeric до схем давал NaN)
+    values = values.copy()
+    is_text = _is_text(values)
+    text = values[is_text].astype(str).str.replace(_NUMBER_SPACES, "", regex=True)
+    decimal_comma = (text.str.rfind(",") > text.str.rfind(".")) & (text.str.count(",") == 1)
+    text = text.where(~decimal_comma, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    text = text.where(decimal_comma, text.str.replace(",", "", regex=False))
+    values[is_text] = text
+    return pd.to_numeric(values, errors="coerce").astype(float)
+
+def convert_column(series: pd.Series, kind: str, date_formats: List[str]) -> tuple[pd.Series, Dict[str, Any]]:
+    """Приводит колонку к типу kind, разбирая каждое уникальное значение один раз."""
+    if kind == DATE and pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series, {"kind": kind, "values": int(series.notna().sum()), "failed": 0, "examples": []}
+    if kind == NUMBER and pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        series = series.astype(float)
+        return series, {"kind": kind, "values": int(series.notna().sum()), "failed": 0, "examples": []}
+
+    codes, uniques = pd.factorize(series)
+    raw = pd.Series(np.asarray(uniques, dtype=object))
+    values = _strip_text(raw)
+    blank = values.eq("")
+    values = values.mask(blank)
+
+    if kind == DATE:
+        parsed = _parse_date_values(values, date_formats)
+        missing = np.datetime64("NaT", "ns")
+    else:
+        parsed = _parse_number_values(values)
+        missing = np.nan
+
+    # Код -1 (пустое значение) попадает на добавленный в конец пропуск
+    lookup = np.append(parsed.to_numpy(), missing)
+    converted = pd.Series(lookup[codes], index=series.index, name=series.name)
+
+    failed = (parsed.isna() & ~blank).to_numpy()
+    per_value = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    report = {
+        "kind": kind,
+        "values": int(per_value[~blank.to_numpy()].sum()),
+        "failed": int(per_value[failed].sum()),
+        "examples": [str(v) for v in raw[failed].head(REPORT_EXAMPLES)],
+    }
+    return converted, report
+
+def merge_column_reports(total: Dict[str, Any], part: Dict[str, Any]) -> Dict[str, Any]:
+    total["values"] += part["values"]
+    total["failed"] += part["failed"]
+    for example in part["examples"]:
+        if len(total["examples"]) >= REPORT_EXAMPLES:
+            break
+        if example not in total["examples"]:
+            total["examples"].append(example)
+    return total
+
+def apply_schema(df: pd.DataFrame, schema: dict, report: Dict[str, Any] | None = None) -> pd.DataFrame:
+    """Приводит колонки схемы, которые есть в df; report дополняется по каждой колонке.
+
+    Один report можно передавать в несколько вызовов (чанки одного файла) — счётчики складываются.
+    """
+    for col, kind in schema["columns"].items():
+        if col not in df.columns:
+            continue
+        df[col], column_report = convert_column(df[col], kind, schema["date_formats"])
+        if report is not None:
+            if col in report:
+                merge_column_reports(report[col], column_report)
+            else:
+                report[col] = column_report
+    return df
+
+def failed_columns(report: Dict[str, Any]) -> Dict[str, int]:
+    return {col: entry["failed"] for col, entry in report.items() if entry["failed"]}
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.generators import generate_csv
+from services.csv_parser import parse_and_clean_csv
+
+# Быстрые пути (индексы фильтров, куб, дельты) сравниваются с обычным pandas
+# на тех же синтетических выгрузках, что и в бенчмарках.
+
+DEALS_ROWS = 5_000
+
+
+@pytest.fixture(scope="session")
+def deals_csv(tmp_path_factory) -> str:
+    return generate_csv(str(tmp_path_factory.mktemp("data") / "deals.csv"), DEALS_ROWS, seed=7)
+
+@pytest.fixture(scope="session")
+def deals_frame(deals_csv) -> pd.DataFrame:
+    # Таблица в том виде, в каком её хранит кэш; тесты не должны её менять
+    return parse_and_clean_csv(deals_csv)
+
+@pytest.fixture
+def deals(deals_frame) -> pd.DataFrame:
+    return deals_frame.copy()
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch) -> str:
+    # Каталог кэша теста; кэши процесса сбрасываются, чтобы не видеть записи других тестов
+    from services import cache_lifecycle, file_cache
+    from services.frame_cache import frame_cache
+    from services.result_cache import result_cache
+
+    aliases = tmp_path / "aliases"
+    aliases.mkdir()
+    for module in (file_cache, cache_lifecycle):
+        monkeypatch.setattr(module, "CACHE_DIR", str(tmp_path))
+        monkeypatch.setattr(module, "ALIASES_DIR", str(aliases))
+    file_cache._touched.clear()
+    frame_cache.clear()
+    yield str(tmp_path)
+    frame_cache.clear()
+    with result_cache._lock:
+        result_cache._entries.clear()
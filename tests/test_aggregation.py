@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from usecases.aggregation import (
+    Factorized, appearance_counts, group_sums, mean, numeric_values, top_sums, total, value_counts
+)
+from usecases.csv_analyze_deals import _count_flag, compute_summary
+
+# Агрегации по кодам групп сравниваются с прежними выражениями pandas, из
+# которых они получены: на случайных колонках с равными счётчиками и суммами,
+# пропусками и неиспользуемыми категориями ответ в JSON должен совпадать
+# побайтно — с теми же ключами, значениями и порядком.
+#
+# Порядок равных значений у прежних выражений местами не определён: если групп
+# не больше n, Series.nlargest(n) сортирует неустойчиво, как и value_counts()
+# без sort=False. Там эталон — документированное keep="first" (равные — в
+# порядке групп) и порядок появления, который новые функции фиксируют.
+
+SEEDS = range(12)
+
+
+def old_value_counts(series: pd.Series) -> pd.Series:
+    # Прежний _value_counts сводки CSV
+    counts = series.value_counts(sort=False)
+    counts = counts[counts > 0]
+    first_seen = series.dropna().drop_duplicates().tolist()
+    return counts.reindex(first_seen).sort_values(ascending=False, kind="stable")
+
+def nlargest(series: pd.Series, n: int) -> pd.Series:
+    # Series.nlargest(n, keep="first") и при числе групп не больше n
+    return series.nlargest(n) if len(series) > n else series.sort_values(ascending=False, kind="stable")
+
+def old_summary(df: pd.DataFrame, region_col: str | None = None) -> dict:
+    # Прежний compute_summary сводки CSV
+    return {
+        "total_deals": int(len(df)),
+        "total_amount": float(df["Сумма"].sum(skipna=True)) if "Сумма" in df and not df["Сумма"].isna().all() else 0.0,
+        "avg_amount": float(df["Сумма"].mean(skipna=True)) if "Сумма" in df and not df["Сумма"].isna().all() else 0.0,
+        "unique_companies": int(df["Компания"].nunique()) if "Компания" in df else 0,
+        "deals_by_stage": old_value_counts(df["Стадия сделки"]).to_dict() if "Стадия сделки" in df else {},
+        "deals_by_status": old_value_counts(df["Текущий статус"]).to_dict() if "Текущий статус" in df else {},
+        "top_companies_by_sum": nlargest(df.groupby("Компания", observed=True)["Сумма"].sum(), 5).to_dict() if "Компания" in df and "Сумма" in df else {},
+        "top_companies_by_count": nlargest(old_value_counts(df["Компания"]), 5).to_dict() if "Компания" in df else {},
+        "top_regions_by_sum": nlargest(df.groupby(region_col, observed=True)["Сумма"].sum(), 5).to_dict() if region_col in df.columns and "Сумма" in df else {},
+        "top_regions_by_sum_note": {"region_col": region_col} if region_col else None,
+        "repeats": _count_flag(df["Повторная сделка"]) if "Повторная сделка" in df else 0,
+        "recontacts": _count_flag(df["Повторное обращение"]) if "Повторное обращение" in df else 0,
+        "deals_by_funnel": old_value_counts(df["Воронка"]).to_dict() if "Воронка" in df else {},
+    }
+
+def as_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+def random_groups(rng: np.random.Generator, n: int, k: int, dtype: str) -> pd.Series:
+    # Немного значений на много строк — равные счётчики; пропуски и None, и NaN
+    values = np.array([f"Группа {i}" for i in range(k)] + [None, np.nan], dtype=object)
+    series = pd.Series(values[rng.integers(0, k + 2, n)], dtype=object)
+    if dtype == "category":
+        # Категории не по алфавиту и с лишними, которых нет в строках
+        categories = [f"Группа {i}" for i in rng.permutation(k + 2)]
+        series = series.astype(pd.CategoricalDtype(categories))
+    return series
+
+def random_amounts(rng: np.random.Generator, n: int, kind: str) -> pd.Series:
+    # Целые значения в дробной колонке — точно равные суммы групп
+    if kind == "int":
+        return pd.Series(rng.integers(-3, 4, n), dtype=np.int64)
+    values = rng.integers(0, 4, n).astype(np.float64)
+    if kind == "fraction":
+        values = values * 0.1 + rng.random(n) * 1e-3 * (rng.random(n) < 0.5)
+    values[rng.random(n) < 0.2] = np.nan
+    return pd.Series(values)
+
+def random_deals(seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(0, 300))
+    dtype = "category" if seed % 2 else "object"
+    return pd.DataFrame({
+        "Сумма": random_amounts(rng, n, ["whole", "fraction"][seed % 4 // 2]),
+        "Компания": random_groups(rng, n, int(rng.integers(1, 12)), dtype),
+        "Стадия сделки": random_groups(rng, n, 4, dtype),
+        "Текущий статус": random_groups(rng, n, 3, "object"),
+        "Воронка": random_groups(rng, n, 2, "category"),
+        "Регион (гарантирование)": random_groups(rng, n, 7, dtype),
+        "Повторная сделка": pd.Series(rng.choice(["Да", "Нет", None], n), dtype=object),
+    })
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("dtype", ["object", "category"])
+def test_counts_match_value_counts(seed, dtype):
+    rng = np.random.default_rng(seed)
+    series = random_groups(rng, int(rng.integers(0, 400)), int(rng.integers(1, 9)), dtype)
+    column = Factorized(series)
+
+    assert as_json(value_counts(column)) == as_json(old_value_counts(series).to_dict())
+    assert as_json(value_counts(column, 5)) == as_json(nlargest(old_value_counts(series), 5).to_dict())
+    assert column.nunique() == series.nunique()
+    # Счётчики частей — в порядке появления, без сортировки
+    assert as_json(appearance_counts(column)) == as_json(
+        {value: int((series == value).sum()) for value in series.dropna().drop_duplicates()}
+    )
+    if dtype == "object":
+        # Сводка Excel раньше брала value_counts() как есть: те же счётчики по убыванию
+        expected = series.value_counts().to_dict()
+        assert value_counts(column) == expected and list(value_counts(column).values()) == list(expected.values())
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("kind", ["whole", "fraction", "int"])
+@pytest.mark.parametrize("dtype", ["object", "category"])
+def test_sums_match_groupby(seed, kind, dtype):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(0, 400))
+    groups, amounts = random_groups(rng, n, int(rng.integers(1, 9)), dtype), random_amounts(rng, n, kind)
+    column, values = Factorized(groups), numeric_values(amounts)
+    grouped = amounts.groupby(groups, observed=True).sum()
+
+    assert as_json(top_sums(column, values, 5)) == as_json(nlargest(grouped, 5).to_dict())
+    assert as_json(group_sums(column, values)) == as_json(grouped.to_dict())
+    assert as_json(total(values)) == as_json(float(amounts.sum(skipna=True)))
+    if amounts.notna().any():
+        assert as_json(mean(values)) == as_json(float(amounts.mean(skipna=True)))
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_csv_summary_matches_previous_implementation(seed):
+    df = random_deals(seed)
+
+    got = compute_summary(df, {}, "Регион (гарантирование)")
+
+    assert as_json(got) == as_json(old_summary(df, "Регион (гарантирование)"))
+
+def test_generated_deals_summary_matches_previous_implementation(deals):
+    got = compute_summary(deals, {}, "Регион (гарантирование)")
+
+    assert as_json(got) == as_json(old_summary(deals, "Регион (гарантирование)"))
@@ -0,0 +1,149 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.generators import generate_csv
+from main import app
+from services import cache_lifecycle
+from services.cache_lifecycle import TMP_MAX_AGE_SECONDS, scan_cache, sweep_cache
+from services.executor import executor
+from services.file_cache import (
+    entry_exists, entry_paths, find_by_content, register_content, remove_aliases, store_dataframe, store_metadata,
+    touch_entry
+)
+
+# Очистка каталога кэша: TTL и квота по последнему обращению, записи с живыми
+# ссылками процессов не трогаются, временные файлы прерванных записей удаляются.
+
+DAY = 24 * 3600
+
+
+def make_entry(rows: int = 200, sheets: bool = False) -> str:
+    df = pd.DataFrame({"ID": range(rows), "Сумма": [1.5] * rows})
+    file_id = store_dataframe({"Лист": df} if sheets else df)
+    store_metadata(file_id, {"rows": rows})
+    return file_id
+
+def set_last_access(file_id: str, when: float) -> None:
+    touch_entry(file_id, force=True)
+    for path in entry_paths(file_id):
+        if os.path.exists(path):
+            os.utime(path, (when, when))
+
+def hold_ref(cache_dir: str, file_id: str) -> None:
+    # Таблицу записи держит живой процесс (этот) — как при SHARED_FRAMES
+    refs = os.path.join(cache_dir, f"{file_id}.refs")
+    os.makedirs(refs, exist_ok=True)
+    open(os.path.join(refs, str(os.getpid())), "a").close()
+
+def write_tmp(path: str, when: float) -> str:
+    with open(path, "w") as f:
+        f.write("partial")
+    os.utime(path, (when, when))
+    return path
+
+
+def test_ttl_expires_old_entries_but_not_live_ones(cache_dir, monkeypatch):
+    monkeypatch.setattr(cache_lifecycle, "CACHE_TTL_SECONDS", DAY)
+    now = time.time()
+    old, held, fresh = make_entry(), make_entry(sheets=True), make_entry()
+    # Процесс держит таблицу давно: каталог ссылок не новее остальной записи
+    hold_ref(cache_dir, held)
+    set_last_access(old, now - 2 * DAY)
+    set_last_access(held, now - 2 * DAY)
+
+    result = sweep_cache(now)
+
+    assert result["expired"] == 1 and result["in_use"] == 1 and result["freed_bytes"] > 0
+    assert not any(os.path.exists(p) for p in entry_paths(old))
+    assert entry_exists(held) and entry_exists(fresh)
+
+def test_quota_evicts_least_recently_used(cache_dir, monkeypatch):
+    now = time.time()
+    ids = [make_entry() for _ in range(4)]
+    hold_ref(cache_dir, ids[0])
+    for age, file_id in zip([5, 4, 3, 0], ids):
+        set_last_access(file_id, now - age * 3600)
+    sizes, _ = scan_cache()
+    # Места хватает на три записи: самая старая занята процессом, вытесняется следующая
+    monkeypatch.setattr(cache_lifecycle, "CACHE_TTL_SECONDS", 0)
+    monkeypatch.setattr(cache_lifecycle, "CACHE_MAX_BYTES", sum(sizes[i]["bytes"] for i in ids) - 1)
+    monkeypatch.setattr(cache_lifecycle, "CACHE_EVICT_GRACE_SECONDS", 600)
+
+    result = sweep_cache(now)
+
+    assert result["evicted"] == 1 and result["in_use"] == 1
+    assert [entry_exists(i) for i in ids] == [True, False, True, True]
+
+def test_quota_spares_recently_used_entries(cache_dir, monkeypatch):
+    now = time.time()
+    ids = [make_entry() for _ in range(2)]
+    monkeypatch.setattr(cache_lifecycle, "CACHE_TTL_SECONDS", 0)
+    monkeypatch.setattr(cache_lifecycle, "CACHE_MAX_BYTES", 1)
+    monkeypatch.setattr(cache_lifecycle, "CACHE_EVICT_GRACE_SECONDS", 600)
+
+    result = sweep_cache(now)
+
+    assert result["evicted"] == 0 and all(entry_exists(i) for i in ids)
+
+def test_old_tmp_files_removed_everywhere(cache_dir, monkeypatch):
+    monkeypatch.setattr(cache_lifecycle, "CACHE_TTL_SECONDS", 0)
+    monkeypatch.setattr(cache_lifecycle, "CACHE_MAX_BYTES", 0)
+    now = time.time()
+    old = now - 2 * TMP_MAX_AGE_SECONDS
+    file_id = make_entry(sheets=True)
+    sheets_dir = os.path.join(cache_dir, f"{file_id}.sheets")
+    stale = [
+        write_tmp(os.path.join(cache_dir, f"{file_id}.feather.abc.tmp"), old),
+        write_tmp(os.path.join(sheets_dir, "%D0%9B.feather.abc.tmp"), old),
+        write_tmp(os.path.join(cache_dir, "aliases", "csv-00.abc.tmp"), old),
+    ]
+    recent = write_tmp(os.path.join(sheets_dir, "%D0%9B.feather.def.tmp"), now)
+
+    result = sweep_cache(now)
+
+    assert result["tmp_removed"] == 3
+    assert not any(os.path.exists(p) for p in stale)
+    assert os.path.exists(recent) and entry_exists(file_id)
+
+def test_aliases_point_only_to_ready_entries(cache_dir, monkeypatch):
+    monkeypatch.setattr(cache_lifecycle, "CACHE_TTL_SECONDS", 0)
+    file_id = make_entry()
+    register_content("csv", "a" * 64, file_id)
+    register_content("csv", "b" * 64, "удалённая-запись")
+
+    assert find_by_content("csv", "a" * 64) == file_id
+    assert find_by_content("csv", "b" * 64) is None
+    assert find_by_content("excel", "a" * 64) is None
+
+    assert sweep_cache()["aliases_removed"] == 1
+    assert remove_aliases(file_id) == 1
+    assert find_by_content("csv", "a" * 64) is None
+
+
+@pytest.fixture
+def client(cache_dir, monkeypatch):
+    # Задачи выполняются в этом процессе — с каталогом кэша теста
+    async def run(fn, *args):
+        return fn(*args)
+    monkeypatch.setattr(executor, "run", run)
+    return TestClient(app)
+
+def upload(client: TestClient, endpoint: str, path: str, **data):
+    with open(path, "rb") as f:
+        return client.post(endpoint, files={"file": ("deals.csv", f)}, data=data).json()
+
+def test_same_upload_reuses_entry_until_it_changes(client, tmp_path):
+    path = generate_csv(str(tmp_path / "deals.csv"), 300, seed=5)
+    delta = generate_csv(str(tmp_path / "delta.csv"), 10, seed=6)
+
+    first = upload(client, "/upload_csv", path)["file_id"]
+    assert upload(client, "/upload_csv", path)["file_id"] == first
+
+    # После изменения запись уже не соответствует исходному файлу — его загрузка разбирается заново
+    assert "error" not in upload(client, "/upsert_csv", delta, file_id=first)
+    second = upload(client, "/upload_csv", path)["file_id"]
+    assert second != first
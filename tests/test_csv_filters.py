@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from usecases.csv_analyze_deals import filter_mask
+
+# Списки значений фильтруются по индексу колонки, но результат должен
+# совпадать с Series.isin по той же колонке — в том числе для пропусков.
+
+GUARANTEE_REGION = "Регион (гарантирование)"
+
+
+def _first(series: pd.Series):
+    return series.dropna().iloc[0]
+
+@pytest.mark.parametrize("values", [
+    lambda s: [_first(s)],
+    lambda s: [None],
+    lambda s: [np.nan],
+    lambda s: [None, _first(s)],
+    lambda s: [np.nan, _first(s)],
+    lambda s: ["нет такого значения"],
+])
+def test_list_filter_matches_isin(deals, values):
+    series = deals[GUARANTEE_REGION]
+    assert series.isna().any() and isinstance(series.dtype, pd.CategoricalDtype)
+    selected = values(series)
+
+    mask = filter_mask(deals, {"region_col": GUARANTEE_REGION, "region": selected})
+
+    np.testing.assert_array_equal(mask, series.isin(selected).to_numpy())
+
+@pytest.mark.parametrize("dtype", [object, "category"])
+@pytest.mark.parametrize("values", [[None], [np.nan], [None, "a"], [np.nan, "b"], ["a", "b"]])
+def test_missing_values_follow_isin(dtype, values):
+    # У object isin различает None и NaN, у категорий — нет
+    series = pd.Series(["a", None, "b", np.nan, "a"], dtype=dtype)
+    df = pd.DataFrame({"Текущий статус": series})
+
+    mask = filter_mask(df, {"status": values})
+
+    np.testing.assert_array_equal(mask, series.isin(values).to_numpy())
+
+def test_scalar_filter_matches_equality(deals):
+    value = _first(deals["Текущий статус"])
+
+    mask = filter_mask(deals, {"status": value})
+
+    np.testing.assert_array_equal(mask, (deals["Текущий статус"] == value).to_numpy())
@@ -0,0 +1,95 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from services import csv_parser
+from services.csv_parser import load_csv
+
+# Чанковое чтение C-движком (все значения строками, числа — по всему файлу)
+# сравнивается с прежним чтением python-движком целиком.
+
+ESCAPED_OPTIONS = dict(
+    sep=";", encoding="utf-8", engine="python", quotechar='"', escapechar="\\", doublequote=False,
+    on_bad_lines="warn",
+)
+FALLBACK_OPTIONS = dict(sep=";", encoding="utf-8", engine="python", quoting=3, on_bad_lines="warn")
+
+
+def reference_load(path: str, options: dict = ESCAPED_OPTIONS) -> pd.DataFrame:
+    # Прежний load_csv: типы выводит read_csv, очистка — только у строковых колонок
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        df = pd.read_csv(path, **options)
+    df.columns = df.columns.str.strip()
+    for col in df.columns:
+        if df[col].dtype == "object" and pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].str.replace(r'\\"', '"', regex=True).str.replace(r'\\', '', regex=True)
+    return df
+
+def load(path: str) -> pd.DataFrame:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return load_csv(path)
+
+def write(tmp_path, text: str) -> str:
+    path = tmp_path / "deals.csv"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_rows", [csv_parser.CSV_CHUNK_ROWS, 777])
+def test_generated_export_matches_python_engine(deals_csv, monkeypatch, chunk_rows):
+    # Мелкие чанки: типы колонок выводятся по всему файлу, а не по первому чанку
+    monkeypatch.setattr(csv_parser, "CSV_CHUNK_ROWS", chunk_rows)
+    expected = reference_load(deals_csv)
+
+    got = load(deals_csv)
+
+    assert got["Название сделки"].str.contains('"').all()
+    pd.testing.assert_frame_equal(got, expected)
+
+@pytest.mark.parametrize("text", [
+    # Экранированные кавычки и обратные слеши в строках
+    'ID;Название;Сумма\n1;"ООО \\"Ромашка\\"";10.5\n2;"a\\\\b";7\n3;ЖК \\"Север\\";\n',
+    # Строка с лишним полем пропускается с предупреждением
+    'ID;Название;Сумма\n1;a;1\n2;b;2;лишнее\n3;c;3\n',
+    # Числовые колонки тоже проходят очистку: экранирование в числе не мешает выводу типа
+    'ID;Код;Сумма\n1;12\\3;1\n2;"45";2.25\n3;;\n',
+    # Пробелы в заголовках, пустая колонка, точность дробных
+    ' ID ; Название ;Пусто;Сумма\n1; x ;;0.1234567890123456789\n2;y;;12345678901234.567\n',
+])
+def test_edge_cases_match_python_engine(tmp_path, text):
+    path = write(tmp_path, text)
+    pd.testing.assert_frame_equal(load(path), reference_load(path))
+
+@pytest.mark.parametrize("chunk_rows", [csv_parser.CSV_CHUNK_ROWS, 2])
+def test_unclosed_quote_falls_back_to_quote_none(tmp_path, monkeypatch, chunk_rows):
+    monkeypatch.setattr(csv_parser, "CSV_CHUNK_ROWS", chunk_rows)
+    path = write(tmp_path, 'ID;Название;Сумма\n1;"a;1\n2;b;2\n3;c;3\n4;d;4\n5;e;5\n')
+
+    got = load(path)
+
+    # Совпадает с запасным режимом прежнего загрузчика. Сам прежний загрузчик до
+    # него не доходил: python-движок без ошибки поглощал строки до конца файла
+    # (или до лимита длины поля) и терял их — C-движок на незакрытой кавычке падает
+    pd.testing.assert_frame_equal(got, reference_load(path, FALLBACK_OPTIONS))
+    assert reference_load(path).empty
+    assert got["ID"].tolist() == [1, 2, 3, 4, 5]
+
+def test_fallback_resets_transform_state(tmp_path, monkeypatch):
+    # Первый чанк успевает пройти transform до ошибки — on_fallback сбрасывает накопленное
+    monkeypatch.setattr(csv_parser, "CSV_CHUNK_ROWS", 1)
+    path = write(tmp_path, 'ID;Название;Сумма\n1;a;1\n2;"b;2\n3;c;3\n')
+    seen, cleared = [], []
+
+    def reset():
+        cleared.append(len(seen))
+        seen.clear()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        chunks = csv_parser.read_csv_chunks(path, transform=lambda c: seen.append(len(c)) or c, on_fallback=reset)
+
+    assert cleared and cleared[0] > 0
+    assert sum(len(c) for c in chunks) == 3 and sum(seen) == 3
@@ -0,0 +1,250 @@
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.csv_analytics import run_upload_csv, run_upsert_csv
+from services import file_cache
+from services.csv_parser import parse_and_clean_csv
+from services.file_cache import get_cube, get_dataframe, get_file_version, get_metadata, open_table, store_dataframe
+from usecases.csv_upsert import upsert_rows
+from usecases.filter_metadata import build_csv_metadata
+from usecases.olap_cube import build_cube
+
+# Результат upsert_rows сравнивается с построчным применением дельты в pandas:
+# строка с известным ID заменяется на месте, новая — добавляется в конец.
+
+
+def reference_upsert(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    rows = base.astype(object).to_dict("records")
+    position = {row["ID"]: i for i, row in enumerate(rows)}
+    for row in delta.astype(object).to_dict("records"):
+        row = {col: row.get(col) for col in base.columns}
+        if row["ID"] in position:
+            rows[position[row["ID"]]] = row
+        else:
+            position[row["ID"]] = len(rows)
+            rows.append(row)
+    return pd.DataFrame(rows, columns=base.columns)
+
+def assert_rows_equal(got: pd.DataFrame, expected: pd.DataFrame) -> None:
+    assert list(got.columns) == list(expected.columns)
+    assert len(got) == len(expected)
+    for col in got.columns:
+        left, right = got[col].astype(object), expected[col].astype(object)
+        same = (left == right) | (left.isna() & right.isna())
+        assert same.all(), f"{col}: {left[~same].head(3).tolist()} != {right[~same].head(3).tolist()}"
+
+
+def test_upsert_matches_rowwise_reference(deals):
+    delta = deals.iloc[[3, 10, 200]].copy()
+    delta["Сумма"] = [1.5, None, 3e6]
+    new = deals.iloc[[0, 1]].copy()
+    new["ID"] = [deals["ID"].max() + 1, deals["ID"].max() + 2]
+    delta = pd.concat([delta, new], ignore_index=True)
+
+    df, removed, added = upsert_rows(deals, delta)
+
+    assert_rows_equal(df, reference_upsert(deals, delta))
+    assert list(removed.index) == [3, 10, 200]
+    assert_rows_equal(removed.reset_index(drop=True), deals.iloc[[3, 10, 200]].reset_index(drop=True))
+    assert list(added.index) == [3, 10, 200, len(deals), len(deals) + 1]
+    assert_rows_equal(added.reset_index(drop=True), df.iloc[added.index].reset_index(drop=True))
+    # Исходная таблица из кэша не меняется
+    assert deals["Сумма"].iloc[3] != 1.5
+
+def test_duplicate_ids_in_delta_last_wins(deals):
+    delta = deals.iloc[[5, 5, 5]].copy()
+    delta["Сумма"] = [1.0, 2.0, 3.0]
+
+    df, removed, added = upsert_rows(deals, delta)
+
+    assert df["Сумма"].iloc[5] == 3.0
+    assert list(removed.index) == [5] and list(added.index) == [5]
+    assert_rows_equal(df, reference_upsert(deals, delta))
+
+def test_new_category_extends_categories(deals):
+    delta = deals.iloc[[7]].astype({"Регион": object})
+    delta["Регион"] = "Новый регион"
+
+    df, _, _ = upsert_rows(deals, delta)
+
+    assert isinstance(df["Регион"].dtype, pd.CategoricalDtype)
+    assert list(df["Регион"].cat.categories[:-1]) == list(deals["Регион"].cat.categories)
+    assert df["Регион"].iloc[7] == "Новый регион"
+
+def test_missing_value_in_int_column_becomes_float(deals):
+    base = deals.assign(Код=np.arange(len(deals), dtype=np.int64))
+    delta = base.iloc[[1]].astype({"Код": object})
+    delta["Код"] = None
+
+    df, _, _ = upsert_rows(base, delta)
+
+    assert df["Код"].dtype == "float64"
+    assert np.isnan(df["Код"].iloc[1]) and df["Код"].iloc[2] == 2.0
+
+def test_unparseable_values_fall_back_to_object(deals):
+    delta = deals.iloc[[2]].astype({"Сумма": object})
+    delta["Сумма"] = "не число"
+
+    df, _, _ = upsert_rows(deals, delta)
+
+    assert df["Сумма"].dtype == object
+    assert df["Сумма"].iloc[2] == "не число" and df["Сумма"].iloc[3] == deals["Сумма"].iloc[3]
+
+def test_partial_delta_leaves_other_columns_empty(deals):
+    delta = pd.DataFrame({"ID": [deals["ID"].iloc[4]], "Сумма": [42.0]})
+
+    df, _, _ = upsert_rows(deals, delta)
+
+    assert_rows_equal(df, reference_upsert(deals, delta))
+
+@pytest.mark.parametrize("make_delta, message", [
+    (lambda d: d.iloc[[0]].assign(Лишняя=1), "Колонок нет"),
+    (lambda d: d.iloc[[0]].drop(columns=["ID"]), "нет колонки"),
+    (lambda d: d.iloc[[0, 1]].astype({"ID": "float64"}).assign(ID=[1.0, None]), "без 'ID'"),
+])
+def test_invalid_delta(deals, make_delta, message):
+    with pytest.raises(ValueError, match=message):
+        upsert_rows(deals, make_delta(deals))
+
+def test_duplicate_ids_in_base(deals):
+    base = pd.concat([deals, deals.iloc[[0]]], ignore_index=True)
+    with pytest.raises(ValueError, match="повторяются"):
+        upsert_rows(base, deals.iloc[[1]])
+
+
+# /upsert_csv дописывает изменения сегментами: таблица с сегментами, её
+# метаданные и куб должны совпадать с полной перезаписью (upsert_rows) —
+# вместе с типами и порядком категорий, — а основной файл не переписываться.
+
+def read_csv_rows(path: str) -> tuple[list[str], list[list[str]]]:
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter=";", quoting=csv.QUOTE_NONE, escapechar="\\", doublequote=False)
+        return next(reader), list(reader)
+
+def write_csv_rows(path: str, header: list[str], rows: list[list[str]]) -> str:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";", quoting=csv.QUOTE_NONE, escapechar="\\", doublequote=False)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+def make_delta_csv(path: str, source: str, step: int, size: int = 12) -> str:
+    # Замены (с новым регионом и повтором ID) и новые строки; ID остаются в
+    # разрядности колонки — иначе таблица перезаписывается целиком
+    header, rows = read_csv_rows(source)
+    column = {name: i for i, name in enumerate(header)}
+    rng = np.random.default_rng(step)
+    delta = [list(rows[i]) for i in rng.choice(len(rows), size, replace=False)]
+    for i, row in enumerate(delta):
+        row[column["Сумма"]] = f"{1000 * step + i}.5"
+        if i % 4 == 0:
+            row[column["Регион"]] = f"Новый регион {step}"
+        if i % 5 == 0:
+            row[column["ID"]] = str(20_000 + 100 * step + i)
+    delta.append(list(delta[1]))
+    delta[-1][column["Сумма"]] = "7"
+    return write_csv_rows(path, header, delta)
+
+def assert_entry_matches(file_id: str, expected: pd.DataFrame) -> None:
+    pd.testing.assert_frame_equal(get_dataframe(file_id), expected)
+    meta = get_metadata(file_id)
+    reference = build_csv_metadata(expected)
+    assert meta["rows"] == reference["rows"] and meta["filters"] == reference["filters"]
+    pd.testing.assert_frame_equal(get_cube(file_id), build_cube(expected), check_exact=False, rtol=1e-9)
+
+def segment_files(file_id: str) -> list[str]:
+    delta_dir = file_cache._delta_dir(file_cache._frame_path(file_id))
+    return sorted(os.listdir(delta_dir)) if os.path.isdir(delta_dir) else []
+
+@pytest.fixture
+def uploaded(cache_dir, deals_csv) -> str:
+    file_id, _ = run_upload_csv(deals_csv)
+    return file_id
+
+
+def test_segments_match_full_rewrite(uploaded, deals_csv, deals_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_cache, "DELTA_MAX_SEGMENTS", 2)
+    monkeypatch.setattr(file_cache, "DELTA_MAX_FRACTION", 1.0)
+    base_version = file_cache._version(file_cache._frame_path(uploaded))
+    expected = deals_frame
+    versions = [get_file_version(uploaded)]
+
+    for step in range(1, 6):
+        path = make_delta_csv(str(tmp_path / f"delta{step}.csv"), deals_csv, step)
+        result = run_upsert_csv(uploaded, path)
+
+        expected, removed, added = upsert_rows(expected, parse_and_clean_csv(path))
+        assert result["rows"] == len(expected) and result["updated"] == len(removed)
+        assert_entry_matches(uploaded, expected)
+        versions.append(get_file_version(uploaded))
+
+    # Основной файл не переписывался, лишние сегменты слиты
+    assert file_cache._version(file_cache._frame_path(uploaded)) == base_version
+    assert 0 < len(segment_files(uploaded)) <= 3
+    assert len(set(versions)) == len(versions)
+    assert list(expected["Регион"].cat.categories[-5:]) == [f"Новый регион {step}" for step in range(1, 6)]
+
+def test_open_table_overlays_segments(uploaded, deals_csv, deals_frame, tmp_path):
+    path = make_delta_csv(str(tmp_path / "delta.csv"), deals_csv, 1)
+    run_upsert_csv(uploaded, path)
+    expected, _, _ = upsert_rows(deals_frame, parse_and_clean_csv(path))
+
+    table, version = open_table(uploaded)
+    assert version == get_file_version(uploaded)
+    pd.testing.assert_frame_equal(table.to_pandas(), expected)
+    projected, _ = open_table(uploaded, columns=["Регион", "ID"])
+    pd.testing.assert_frame_equal(projected.to_pandas(), expected[["Регион", "ID"]])
+
+def test_compaction_folds_segments_into_table(uploaded, deals_csv, deals_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_cache, "DELTA_MAX_FRACTION", 0.001)
+    base_version = file_cache._version(file_cache._frame_path(uploaded))
+    expected = deals_frame
+
+    small = make_delta_csv(str(tmp_path / "small.csv"), deals_csv, 1, size=2)
+    run_upsert_csv(uploaded, small)
+    expected, _, _ = upsert_rows(expected, parse_and_clean_csv(small))
+    assert len(segment_files(uploaded)) == 1
+
+    large = make_delta_csv(str(tmp_path / "large.csv"), deals_csv, 2)
+    run_upsert_csv(uploaded, large)
+    expected, _, _ = upsert_rows(expected, parse_and_clean_csv(large))
+
+    assert segment_files(uploaded) == []
+    assert file_cache._version(file_cache._frame_path(uploaded)) != base_version
+    assert_entry_matches(uploaded, expected)
+
+def test_retyped_column_rewrites_table(uploaded, deals_csv, deals_frame, tmp_path):
+    run_upsert_csv(uploaded, make_delta_csv(str(tmp_path / "delta.csv"), deals_csv, 1))
+    assert segment_files(uploaded)
+    # Новый ID не помещается в разрядность колонки ID — таблица перезаписывается целиком
+    header, rows = read_csv_rows(deals_csv)
+    row = list(rows[3])
+    row[header.index("ID")] = str(10 ** 10)
+    path = write_csv_rows(str(tmp_path / "wide.csv"), header, [row])
+
+    result = run_upsert_csv(uploaded, path)
+
+    expected, _, _ = upsert_rows(deals_frame, parse_and_clean_csv(str(tmp_path / "delta.csv")))
+    expected, _, _ = upsert_rows(expected, parse_and_clean_csv(path))
+    assert result["inserted"] == 1 and segment_files(uploaded) == []
+    assert get_dataframe(uploaded)["ID"].dtype == np.int64
+    assert_entry_matches(uploaded, expected)
+
+def test_segments_of_replaced_table_are_ignored(uploaded, deals_csv, deals_frame, tmp_path):
+    run_upsert_csv(uploaded, make_delta_csv(str(tmp_path / "delta.csv"), deals_csv, 1))
+    delta_dir = file_cache._delta_dir(file_cache._frame_path(uploaded))
+    stale = {name: open(os.path.join(delta_dir, name), "rb").read() for name in segment_files(uploaded)}
+
+    store_dataframe(deals_frame, file_id=uploaded)
+    # Сегмент прежней версии, оставшийся от прерванной очистки, не накладывается
+    os.makedirs(delta_dir, exist_ok=True)
+    for name, content in stale.items():
+        with open(os.path.join(delta_dir, name), "wb") as f:
+            f.write(content)
+
+    pd.testing.assert_frame_equal(get_dataframe(uploaded), deals_frame)
+    assert get_file_version(uploaded) == file_cache._version(file_cache._frame_path(uploaded))
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from benchmarks.generators import generate_excel
+from services.excel_parser import HEADER_MAP, VALID_SHEETS, is_used_column
+from services.excel_reader import read_sheet, sheet_names
+
+# Потоковый reader сравнивается с pd.read_excel(header=HEADER_MAP[лист]).
+# Пустые ячейки строковых колонок reader отдаёт как None, read_excel — как NaN:
+# для pandas и для Arrow в кэше это один и тот же пропуск, поэтому перед
+# сравнением None в ожидаемом результате приводим к виду reader'а.
+
+
+def reference(path: str, sheet: str, header: int) -> pd.DataFrame:
+    df = pd.read_excel(path, sheet_name=sheet, header=header)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+@pytest.fixture(scope="module")
+def workbook(tmp_path_factory) -> str:
+    return generate_excel(str(tmp_path_factory.mktemp("data") / "objects.xlsx"), 600, seed=11)
+
+@pytest.fixture(scope="module")
+def messy(tmp_path_factory) -> str:
+    # Шапка над заголовком (в том числе пустые строки и ячейка правее заголовка),
+    # повторы и пустые заголовки, пустая строка внутри данных и в конце листа
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Лист"
+    ws.append(["Реестр"])
+    ws.append([])
+    ws.append(["Сформирован", None, None, None, None, None, None, None, None, "справа"])
+    ws.append(["Регион", "Стоимость", None, "Регион", "  ", "Дата", "Регион.1", "Регион", "Unnamed: 2"])
+    ws.append(["А", 1.5, "z", "Б", None, datetime(2023, 1, 2), "q", "w", 1])
+    ws.append([None] * 9)
+    ws.append(["В", "текст", None, None, 7, None, None, None, None, 5])
+    ws.append(["Г", 3])
+    ws.append([])
+    ws.append([None, None])
+    path = tmp_path_factory.mktemp("data") / "messy.xlsx"
+    wb.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("sheet", VALID_SHEETS)
+def test_generated_sheets_match_read_excel(workbook, sheet):
+    header = HEADER_MAP[sheet]
+    pd.testing.assert_frame_equal(read_sheet(workbook, sheet, header), reference(workbook, sheet, header))
+
+@pytest.mark.parametrize("header", [0, 2, 3])
+def test_header_offsets_duplicates_and_blank_rows(messy, header):
+    got = read_sheet(messy, "Лист", header)
+
+    pd.testing.assert_frame_equal(got, reference(messy, "Лист", header))
+
+def test_duplicate_and_blank_header_names(messy):
+    got = read_sheet(messy, "Лист", 3)
+
+    # Занятые имена пропускаются, безымянные нумеруются последними; пробелы — имя колонки
+    assert list(got.columns) == [
+        "Регион", "Стоимость", "Unnamed: 2.1", "Регион.2", "  ", "Дата", "Регион.1", "Регион.3", "Unnamed: 2",
+        "Unnamed: 9",
+    ]
+    # Пустая строка внутри данных сохраняется, пустые строки в конце — нет
+    assert len(got) == 4 and got.iloc[1].isna().all()
+
+def test_projection_keeps_only_selected_columns(workbook):
+    sheet = VALID_SHEETS[0]
+    full = reference(workbook, sheet, HEADER_MAP[sheet])
+
+    got = read_sheet(workbook, sheet, HEADER_MAP[sheet], is_used_column)
+
+    assert list(got.columns) == [c for c in full.columns if is_used_column(c)]
+    pd.testing.assert_frame_equal(got, full[list(got.columns)])
+
+def test_sheet_names_and_missing_sheet(workbook):
+    assert sheet_names(workbook) == pd.ExcelFile(workbook).sheet_names
+    with pytest.raises(ValueError, match="not found"):
+        read_sheet(workbook, "Нет такого листа")
@@ -0,0 +1,59 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.excel_analytics as excel_api
+from benchmarks.generators import generate_excel
+from main import app
+from services.executor import Overloaded
+
+# Загрузка книги: если хотя бы один лист не разобран, в кэше не должно остаться ни книги, ни листов.
+
+FAILING_SHEET = "Завершенные"
+
+
+@pytest.fixture(scope="module")
+def workbook(tmp_path_factory) -> str:
+    return generate_excel(str(tmp_path_factory.mktemp("data") / "objects.xlsx"), 400, seed=3)
+
+def upload(client: TestClient, path: str):
+    with open(path, "rb") as f:
+        return client.post("/list_excel_sheets", files={"file": ("objects.xlsx", f)})
+
+def fake_run(fail: str | None):
+    # Листы разбираются в этом процессе (каталог кэша теста); один из них пул «отклоняет»,
+    # остальные заканчивают позже отказа — их дожидаются до удаления записи
+    async def run(fn, file_id, sheet):
+        if sheet == fail:
+            raise Overloaded("Сервер перегружен, повторите запрос позже")
+        await asyncio.sleep(0.05)
+        return fn(file_id, sheet)
+    return run
+
+
+def test_failed_sheet_removes_raw_workbook(cache_dir, workbook, monkeypatch):
+    client = TestClient(app)
+    monkeypatch.setattr(excel_api.executor, "run", fake_run(FAILING_SHEET))
+
+    response = upload(client, workbook)
+
+    assert response.status_code == 429
+    leftovers = [name for name in os.listdir(cache_dir) if name != "aliases"]
+    assert leftovers == []
+    assert os.listdir(os.path.join(cache_dir, "aliases")) == []
+
+def test_retry_after_failure_creates_one_entry(cache_dir, workbook, monkeypatch):
+    client = TestClient(app)
+    monkeypatch.setattr(excel_api.executor, "run", fake_run(FAILING_SHEET))
+    assert upload(client, workbook).status_code == 429
+
+    monkeypatch.setattr(excel_api.executor, "run", fake_run(None))
+    first = upload(client, workbook).json()
+    second = upload(client, workbook).json()
+
+    assert FAILING_SHEET in first["sheets"]
+    assert second["file_id"] == first["file_id"]
+    raw = [name for name in os.listdir(cache_dir) if name.endswith(".bin")]
+    assert raw == [f"{first['file_id']}.bin"]
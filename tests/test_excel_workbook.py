@@ -0,0 +1,134 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.generators import generate_excel
+from main import app
+from services.excel_parser import excel_filter_mask, get_excel_sheet
+from services.executor import executor
+from usecases.excel_analyze_deals import (
+    compute_summary, finalize_summary, merge_partials, partial_summary, summary_column_map
+)
+
+# Сводка по книге собирается из частичных агрегатов листов. Она должна совпадать
+# со сводкой compute_summary по склеенным отфильтрованным листам (колонки
+# приведены к названиям сводки, лист строки — в __source_sheet), включая порядок
+# ключей: равные счётчики — в порядке появления во всей книге.
+
+
+def concat_sheets(sheets: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    parts = []
+    for sheet, df in sheets.items():
+        renamed = {col: name for name, col in summary_column_map(list(df.columns)).items()}
+        part = df[list(renamed)].rename(columns=renamed)
+        parts.append(part.assign(__source_sheet=pd.Series(sheet, index=part.index, dtype=object)))
+    return pd.concat(parts, ignore_index=True)
+
+def merged_summary(sheets: dict[str, pd.DataFrame], metrics: list | None = None) -> dict:
+    return finalize_summary(merge_partials([partial_summary(df, metrics, sheet) for sheet, df in sheets.items()]), metrics)
+
+def as_json(summary: dict) -> dict:
+    # Как в ответе: ключи-годы становятся строками
+    return json.loads(json.dumps(summary))
+
+def assert_same_summary(got: dict, expected: dict) -> None:
+    # Суммы по листам складываются в другом порядке, чем по склеенной таблице, — сравниваем с точностью до округления
+    assert list(got) == list(expected)
+    for name, value in expected.items():
+        if isinstance(value, dict):
+            assert list(got[name]) == list(value), name
+            assert list(got[name].values()) == pytest.approx(list(value.values()), rel=1e-12), name
+        else:
+            assert got[name] == pytest.approx(value, rel=1e-12), name
+
+
+@pytest.fixture
+def sheets() -> dict[str, pd.DataFrame]:
+    active = pd.DataFrame({
+        "Регион": ["А", "Б", "Б", "В"],
+        "Застройщик": ["Общий", "Первый", "Второй", "Общий"],
+        "Стоимость": [10.0, 15.0, 15.0, np.nan],
+        "Площадь, кв.м по Проекту": [1.0, 2.0, 3.0, 4.0],
+        "Дата начала строительства": pd.to_datetime(["2021-03-01", "2020-01-01", "2020-05-01", None]),
+        "Дата завершения 2": pd.to_datetime(["2023-01-01", None, "2022-01-01", "2024-01-01"]),
+    })
+    moderated = pd.DataFrame({
+        "Область": ["А", "Г", "В"],
+        "Застройщик": ["Общий", "Третий", "Четвёртый"],
+        "Стоимость": [10.0, 12.0, 11.0],
+        "Площадь": [5.0, np.nan, 6.0],
+    })
+    withdrawn = pd.DataFrame({
+        "Область": pd.Series([], dtype=object),
+        "Застройщик": pd.Series([], dtype=object),
+        "Стоимость": pd.Series([], dtype=float),
+        "Площадь": pd.Series([], dtype=float),
+    })
+    return {"Действующие": active, "Отозванные": withdrawn, "На модерации": moderated}
+
+def test_merged_partials_equal_summary_of_concatenated_sheets(sheets):
+    assert_same_summary(merged_summary(sheets), compute_summary(concat_sheets(sheets)))
+
+def test_ties_top_builders_and_avg_across_sheets(sheets):
+    summary = merged_summary(sheets)
+
+    # На первом листе Б встречается чаще А, но во всей книге они равны — первым идёт А
+    assert summary["by_region"] == {"А": 2, "Б": 2, "В": 2, "Г": 1}
+    # «Общий» не лидирует ни на одном листе, а по книге — первый; равные суммы — по имени
+    assert summary["top_builders_by_cost"] == {"Общий": 20.0, "Второй": 15.0, "Первый": 15.0, "Третий": 12.0, "Четвёртый": 11.0}
+    # Пропуск стоимости не входит в среднее, пустой лист не попадает в разбивку
+    assert summary["avg_cost"] == pytest.approx(73.0 / 6)
+    assert summary["by_sheet"] == {"Действующие": 4, "На модерации": 3}
+    assert summary["by_year"] == {2020: 2, 2021: 1}
+
+@pytest.mark.parametrize("metrics", [["avg_cost"], ["by_region", "top_builders_by_cost"], []])
+def test_requested_metrics_only(sheets, metrics):
+    assert_same_summary(merged_summary(sheets, metrics), compute_summary(concat_sheets(sheets), metrics))
+
+def test_all_sheets_empty(sheets):
+    empty = {sheet: df.iloc[:0] for sheet, df in sheets.items()}
+
+    summary = merged_summary(empty)
+
+    assert summary["total_rows"] == 0 and summary["avg_cost"] == 0.0
+    assert summary["by_region"] == {} and summary["top_builders_by_cost"] == {}
+    assert_same_summary(summary, compute_summary(concat_sheets(empty)))
+
+
+@pytest.fixture
+def client(cache_dir, monkeypatch):
+    # Задачи выполняются в этом процессе — с каталогом кэша теста
+    async def run(fn, *args):
+        return fn(*args)
+    monkeypatch.setattr(executor, "run", run)
+    return TestClient(app)
+
+@pytest.fixture
+def file_id(client, tmp_path) -> str:
+    path = generate_excel(str(tmp_path / "objects.xlsx"), 2000, seed=13)
+    with open(path, "rb") as f:
+        return client.post("/list_excel_sheets", files={"file": ("objects.xlsx", f)}).json()["file_id"]
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"region": ["Москва", "Московская область", "Санкт-Петербург"]},
+    {"area": {"min": 5000, "max": 15000}},
+    # Пустой список застройщиков отсекает все строки всех листов
+    {"developer": []},
+])
+def test_workbook_endpoint_matches_concatenated_summary(client, file_id, filters):
+    result = client.post("/analyze_excel_workbook", json={"file_id": file_id, "filters": filters}).json()
+
+    filtered = {}
+    for sheet in result["sheets"]:
+        df = get_excel_sheet(file_id, sheet, columns="used")
+        filtered[sheet] = df[excel_filter_mask(df, sheet, filters)]
+    expected = as_json(compute_summary(concat_sheets(filtered)))
+
+    assert result["rows_filtered"] == sum(len(df) for df in filtered.values())
+    assert_same_summary(result["summary"], expected)
+    for sheet, df in filtered.items():
+        assert_same_summary(result["sheets"][sheet]["summary"], as_json(compute_summary(concat_sheets({sheet: df}))))
@@ -0,0 +1,83 @@
+import asyncio
+import math
+import os
+import time
+
+import pytest
+
+from services.executor import JobExecutor, JobTimeout, Overloaded, WorkerCrashed
+
+# Крошечный пул: допуск задач (429), освобождение слота после таймаута и новый пул после падения процесса.
+# workers=0 — задачи выполняются в потоках: допуск и слоты те же, а тест не ждёт запуска процессов.
+
+
+def test_overloaded_beyond_in_flight_and_queue():
+    async def scenario():
+        executor = JobExecutor(workers=0, max_in_flight=1, max_queue=1, timeout=5)
+        running = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+        queued = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        assert executor.stats()["running"] == 1 and executor.stats()["queued"] == 1
+
+        with pytest.raises(Overloaded) as rejected:
+            await executor.run(time.sleep, 0)
+        assert rejected.value.status_code == 429
+
+        await asyncio.gather(running, queued)
+        return executor
+
+    executor = asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["rejected"] == 1 and stats["running"] == 0 and stats["queued"] == 0
+
+def test_queue_wait_timeout():
+    async def scenario():
+        executor = JobExecutor(workers=0, max_in_flight=1, max_queue=1, timeout=0.1)
+        running = asyncio.ensure_future(executor.run(time.sleep, 0.3))
+        await asyncio.sleep(0.02)
+        with pytest.raises(JobTimeout, match="очереди"):
+            await executor.run(time.sleep, 0)
+        with pytest.raises(JobTimeout):
+            await running
+        return executor
+
+    assert asyncio.run(scenario()).timed_out == 2
+
+def test_slot_released_only_when_timed_out_job_finishes():
+    async def scenario():
+        executor = JobExecutor(workers=0, max_in_flight=1, max_queue=0, timeout=0.1)
+        with pytest.raises(JobTimeout) as timed_out:
+            await executor.run(time.sleep, 0.4)
+        assert timed_out.value.status_code == 503
+
+        # Задача ещё выполняется: слот занят, новая задача ждёт его и тоже не укладывается
+        assert executor.stats()["running"] == 1
+        with pytest.raises(JobTimeout, match="очереди"):
+            await executor.run(math.factorial, 5)
+
+        await asyncio.sleep(0.4)
+        assert executor.stats()["running"] == 0
+        return await executor.run(math.factorial, 5)
+
+    assert asyncio.run(scenario()) == 120
+
+def test_crashed_worker_rebuilds_pool():
+    async def scenario():
+        executor = JobExecutor(workers=1, max_in_flight=1, max_queue=1, timeout=60)
+        try:
+            assert await executor.run(math.factorial, 5) == 120
+            first_pool = executor._pool
+
+            with pytest.raises(WorkerCrashed) as crashed:
+                await executor.run(os._exit, 1)
+            assert crashed.value.status_code == 503
+            assert executor._pool is None and executor.stats()["running"] == 0
+
+            assert await executor.run(math.factorial, 6) == 720
+            assert executor._pool is not first_pool
+            return executor.stats()
+        finally:
+            executor.shutdown()
+
+    stats = asyncio.run(scenario())
+    assert stats["crashed"] == 1 and stats["running"] == 0 and stats["queued"] == 0
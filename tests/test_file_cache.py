@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.file_cache import (
+    _frame_path, _legacy_path, _sheets_dir, get_columns, get_dataframe, get_file_version, list_sheets,
+    migrate_legacy_pickles, open_table, store_dataframe
+)
+
+# Записи кэша хранятся в Feather: таблица читается так же, как была записана,
+# по колонкам и без загрузки файла целиком. Старые записи в pickle переводятся
+# в этот формат при первом обращении.
+
+
+def sample_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "ID": np.arange(6, dtype=np.int64),
+        "Сумма": [1.5, np.nan, 3.25, 0.0, -2.0, 1e12],
+        "Дата создания": pd.to_datetime(["2024-01-01 10:00", None, "2023-12-31 00:00", "2024-02-29 23:59", None, "2022-06-01 00:00"]),
+        "Компания": ["ООО \"А\"", None, "Б", "Б", "", "В"],
+        "Стадия сделки": pd.Categorical(["Новая", "Новая", None, "Сделка", "Новая", "Сделка"]),
+        "Повторная": [True, False, True, True, False, False],
+    })
+
+def assert_same_frame(got: pd.DataFrame, expected: pd.DataFrame) -> None:
+    pd.testing.assert_frame_equal(got, expected.reset_index(drop=True))
+
+
+def test_frame_round_trip_keeps_dtypes(cache_dir):
+    df = sample_frame()
+
+    file_id = store_dataframe(df)
+
+    assert_same_frame(get_dataframe(file_id), df)
+    assert get_columns(file_id) == list(df.columns)
+
+def test_mixed_object_column_stored_as_text(cache_dir):
+    # Число и строка в одной колонке Excel: Arrow их не примет, храним строками
+    df = pd.DataFrame({"Код": [1, "A-2", None, 3.5]}, index=[10, 11, 12, 13])
+
+    got = get_dataframe(store_dataframe(df))
+
+    assert got["Код"].tolist() == ["1", "A-2", None, "3.5"]
+    assert list(got.index) == [0, 1, 2, 3]
+
+def test_sheets_round_trip(cache_dir):
+    sheets = {"Действующие": sample_frame(), "На модерации/2024": sample_frame().iloc[2:]}
+
+    file_id = store_dataframe(sheets)
+
+    assert list_sheets(file_id) == sorted(sheets)
+    for name, df in sheets.items():
+        assert_same_frame(get_dataframe(file_id, name), df)
+    assert get_dataframe(file_id, "Нет такого листа") is None
+    got = get_dataframe(file_id)
+    assert set(got) == set(sheets)
+
+def test_column_projection(cache_dir):
+    df = sample_frame()
+    file_id = store_dataframe(df)
+
+    # Отсутствующие колонки пропускаются, порядок — как в запросе
+    projected = get_dataframe(file_id, columns=["Сумма", "Нет такой", "ID"])
+    assert_same_frame(projected, df[["Сумма", "ID"]])
+
+    # Частая проекция — один и тот же объект, пока файл не изменился
+    cached = get_dataframe(file_id, columns=["Компания"], cache_columns=True)
+    assert get_dataframe(file_id, columns=["Компания"], cache_columns=True) is cached
+    assert_same_frame(cached, df[["Компания"]])
+
+def test_open_table_projection_and_version(cache_dir):
+    df = sample_frame()
+    file_id = store_dataframe({"Лист": df})
+
+    table, version = open_table(file_id, "Лист", columns=["Компания", "Дата создания"])
+
+    assert table.column_names == ["Компания", "Дата создания"]
+    assert_same_frame(table.to_pandas(), df[["Компания", "Дата создания"]])
+    assert version == get_file_version(file_id, "Лист")
+    assert open_table(file_id) is None and open_table("нет-записи") is None
+
+
+def test_legacy_pickle_frame_migrated_on_access(cache_dir):
+    df = sample_frame()
+    df.to_pickle(_legacy_path("legacy"))
+
+    assert_same_frame(get_dataframe("legacy"), df)
+    assert not os.path.exists(_legacy_path("legacy")) and os.path.exists(_frame_path("legacy"))
+
+@pytest.mark.parametrize("access", [
+    lambda file_id: get_dataframe(file_id, "Лист"),
+    lambda file_id: open_table(file_id, "Лист")[0].to_pandas(),
+])
+def test_legacy_pickle_sheets_migrated_on_access(cache_dir, access):
+    sheets = {"Лист": sample_frame(), "Другой": sample_frame().head(2)}
+    pd.to_pickle(sheets, _legacy_path("legacy"))
+
+    assert_same_frame(access("legacy"), sheets["Лист"])
+    assert not os.path.exists(_legacy_path("legacy")) and os.path.isdir(_sheets_dir("legacy"))
+    assert list_sheets("legacy") == ["Другой", "Лист"]
+    # Временный каталог листов переименован, а не оставлен рядом
+    assert [name for name in os.listdir(cache_dir) if name.endswith(".tmp")] == []
+
+def test_migrate_all_legacy_pickles(cache_dir):
+    sample_frame().to_pickle(_legacy_path("a"))
+    pd.to_pickle({"Лист": sample_frame()}, _legacy_path("b"))
+
+    assert migrate_legacy_pickles() == 2
+    assert migrate_legacy_pickles() == 0
+    assert_same_frame(get_dataframe("a"), sample_frame())
+    assert_same_frame(get_dataframe("b", "Лист"), sample_frame())
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from usecases.filter_index import FilterIndex, get_filter_index, range_mask
+
+# Маски по индексу сравниваются с обычными сравнениями pandas по той же колонке.
+
+EQUALITY_COLUMNS = ["Стадия сделки", "Регион", "Ответственный", "Повторная сделка", "ID", "Название сделки"]
+RANGE_COLUMNS = ["Сумма", "Дата создания", "Площадь ЗУ, га (гарантирование)", "ID"]
+
+
+@pytest.fixture
+def gapped(deals) -> pd.DataFrame:
+    # Пропуски в каждой проверяемой колонке: каждая седьмая строка
+    rng = np.random.default_rng(7)
+    deals = deals.copy()
+    rows = rng.choice(len(deals), size=len(deals) // 7, replace=False)
+    for col in ["Сумма", "Дата создания", "Регион", "Название сделки"]:
+        deals.loc[rows, col] = None
+    return deals
+
+
+@pytest.mark.parametrize("col", EQUALITY_COLUMNS)
+def test_equals_mask_matches_isin(deals, col):
+    series = deals[col]
+    assert FilterIndex.supports_equality(series)
+    present = series.dropna().unique().tolist()
+    index = FilterIndex(len(deals))
+
+    for values in [present[:1], present[:3], present[-2:] + ["нет такого значения"], []]:
+        expected = series.isin(values).to_numpy()
+        np.testing.assert_array_equal(index.equals_mask(series, values), expected)
+
+@pytest.mark.parametrize("col", ["Регион", "Название сделки"])
+def test_equals_mask_include_na(gapped, col):
+    series = gapped[col]
+    value = series.dropna().iloc[0]
+    index = FilterIndex(len(gapped))
+
+    expected = (series.eq(value) | series.isna()).to_numpy()
+    np.testing.assert_array_equal(index.equals_mask(series, [value], include_na=True), expected)
+    np.testing.assert_array_equal(index.equals_mask(series, [], include_na=True), series.isna().to_numpy())
+
+@pytest.mark.parametrize("col", RANGE_COLUMNS)
+def test_range_mask_matches_comparison(gapped, col):
+    series = gapped[col]
+    assert FilterIndex.supports_range(series)
+    values = series.dropna().sort_values().to_numpy()
+    index = FilterIndex(len(gapped))
+
+    # Границы и внутри диапазона, и точно на значениях (включительно), и за его краями
+    low, mid, high = values[len(values) // 4], values[len(values) // 2], values[-len(values) // 4]
+    before, after = values[0], values[-1]
+    if isinstance(low, np.datetime64):
+        low, mid, high, before, after = map(pd.Timestamp, (low, mid, high, before, after))
+        before, after = before - pd.Timedelta(days=1), after + pd.Timedelta(days=1)
+    else:
+        before, after = before - 1, after + 1
+
+    for lo, hi in [(low, high), (mid, mid), (low, None), (None, high), (before, after), (after, None), (high, low)]:
+        expected = np.ones(len(series), dtype=bool)
+        if lo is not None:
+            expected &= (series >= lo).to_numpy(dtype=bool)
+        if hi is not None:
+            expected &= (series <= hi).to_numpy(dtype=bool)
+        np.testing.assert_array_equal(range_mask(index, series, lo, hi), expected, err_msg=f"{lo}..{hi}")
+
+def test_sorted_index_skips_missing(gapped):
+    series = gapped["Дата создания"]
+    sorted_index = FilterIndex(len(gapped)).sorted_index(series)
+
+    assert len(sorted_index.order) == series.notna().sum()
+    assert np.all(np.diff(sorted_index.values) >= 0)
+    np.testing.assert_array_equal(
+        series.iloc[sorted_index.order].to_numpy(dtype="datetime64[ns]").view("i8"), sorted_index.values
+    )
+
+def test_unparsed_date_bound_selects_nothing(deals):
+    series = deals["Дата создания"]
+    assert not range_mask(get_filter_index(deals), series, pd.NaT, None).any()
+
+def test_tz_aware_bound_falls_back_to_pandas(deals):
+    series = deals["Дата создания"]
+    with pytest.raises(TypeError):
+        range_mask(get_filter_index(deals), series, pd.Timestamp("2023-01-01", tz="UTC"), None)
+
+def test_index_is_bound_to_frame(deals):
+    index = get_filter_index(deals)
+    assert get_filter_index(deals) is index
+    assert get_filter_index(deals.copy()) is not index
@@ -0,0 +1,80 @@
+import threading
+
+import pandas as pd
+
+from services.frame_cache import FrameCache
+
+
+def _frame(rows: int = 10) -> pd.DataFrame:
+    return pd.DataFrame({"value": range(rows)})
+
+
+def test_key_locks_released_after_load():
+    cache = FrameCache()
+    for i in range(100):
+        cache.get_or_load(f"file-{i}", 1, _frame)
+    cache.get_or_load("missing", 1, lambda: None)
+
+    assert cache._key_locks == {}
+
+
+def test_concurrent_requests_share_one_load():
+    cache = FrameCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return _frame()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("f", 1, loader))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4 and all(r is results[0] for r in results)
+    assert cache._key_locks == {}
+
+
+def test_new_version_reloads_and_notifies():
+    removed = []
+    cache = FrameCache(on_remove=removed.append)
+    first = cache.get_or_load("f", 1, _frame)
+    assert cache.get_or_load("f", 1, _frame) is first
+
+    second = cache.get_or_load("f", 2, _frame)
+    assert second is not first
+    assert removed == ["f"]
+
+    cache.invalidate("f")
+    assert cache.peek("f", 2) is None
+    assert removed == ["f", "f"]
+
+def test_invalidate_file_drops_sheets_and_projections():
+    cache = FrameCache()
+    keys = ["f", ("f", "Лист"), ("f", "Лист", ("a", "b")), "g", ("g", "Лист")]
+    for key in keys:
+        cache.get_or_load(key, 1, _frame)
+
+    cache.invalidate_file("f")
+
+    assert [key for key in keys if cache.peek(key, 1) is not None] == ["g", ("g", "Лист")]
+
+def test_budget_evicts_least_recently_used():
+    size = FrameCache().get_or_load("probe", 1, _frame).memory_usage(index=True, deep=True).sum()
+    cache = FrameCache(max_bytes=int(size * 2.5))
+    for key in "abc":
+        cache.get_or_load(key, 1, _frame)
+        cache.peek("a", 1)
+
+    assert cache.peek("a", 1) is not None and cache.peek("b", 1) is None
+    assert cache.stats()["bytes"] <= cache.max_bytes
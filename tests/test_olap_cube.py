@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from usecases.csv_analyze_deals import apply_filters, compute_summary, resolve_summary_region_col
+from usecases.csv_upsert import upsert_rows
+from usecases.olap_cube import (
+    COMPANY_METRICS, build_cube, can_answer, describe_cube, split_metrics, summary_from_cube, update_cube
+)
+
+# Сводка по кубу должна совпадать со сводкой compute_summary по строкам.
+
+CUBE_FILTERS = [
+    {},
+    {"region": ["Алматы", "Астана"]},
+    {"status": "В работе", "stage": ["Проверка", "Согласование"]},
+    {"from": "2023-01-01", "funnel": ["Основная"]},
+    {"region_col": "Регион", "repeats": True},
+]
+
+
+def assert_same(got, expected, path: str = "") -> None:
+    # Суммы по кубу складываются в другом порядке — дробные числа сравниваем с допуском
+    if isinstance(expected, float):
+        assert math.isclose(got, expected, rel_tol=1e-9, abs_tol=1e-6), path
+    elif isinstance(expected, dict):
+        assert list(got) == list(expected), path
+        for key, value in expected.items():
+            assert_same(got[key], value, f"{path}/{key}")
+    else:
+        assert got == expected, path
+
+def row_summary(df, filters, metrics=None) -> dict:
+    filtered = apply_filters(df, filters)
+    return compute_summary(filtered, filters, resolve_summary_region_col(filtered, filters), metrics)
+
+def cube_then_rows(df, cube, filters) -> dict:
+    # Как /analyze_csv: метрики по кубу, остальные — по строкам, в порядке compute_summary
+    from_cube, rest = split_metrics(describe_cube(cube), list(df.columns), filters, None)
+    merged = {**summary_from_cube(cube, filters, from_cube), **(row_summary(df, filters, rest) if rest else {})}
+    return {name: merged[name] for name in row_summary(df, filters)}
+
+
+@pytest.mark.parametrize("filters", CUBE_FILTERS)
+def test_default_summary_splits_between_cube_and_rows(deals, filters):
+    cube = build_cube(deals)
+    from_cube, rest = split_metrics(describe_cube(cube), list(deals.columns), filters, None)
+
+    assert set(rest) == COMPANY_METRICS and from_cube
+    assert_same(cube_then_rows(deals, cube, filters), row_summary(deals, filters))
+
+@pytest.mark.parametrize("filters", CUBE_FILTERS)
+def test_default_summary_without_companies_comes_from_cube(deals, filters):
+    deals = deals.drop(columns=["Компания"])
+    cube = build_cube(deals)
+
+    assert can_answer(describe_cube(cube), list(deals.columns), filters, None)
+    assert_same(summary_from_cube(cube, filters, None), row_summary(deals, filters))
+
+@pytest.mark.parametrize("filters", [{"to": "2024-01-01"}, {"from": "2023-01-15"}, {"company": "x"}])
+def test_filters_outside_cube_use_rows(deals, filters):
+    cube = build_cube(deals)
+
+    assert split_metrics(describe_cube(cube), list(deals.columns), filters, ["total_deals"]) == ([], ["total_deals"])
+
+@pytest.mark.parametrize("metrics", [["total_deals"], ["avg_amount", "deals_by_stage"], ["top_regions_by_sum_note", "repeats"]])
+@pytest.mark.parametrize("filters", CUBE_FILTERS)
+def test_explicit_metrics_from_cube(deals, filters, metrics):
+    cube = build_cube(deals)
+
+    assert can_answer(describe_cube(cube), list(deals.columns), filters, metrics)
+    assert_same(summary_from_cube(cube, filters, metrics), row_summary(deals, filters, metrics))
+
+
+def upserted(deals):
+    # Замена части строк (в том числе новыми значениями измерений) и вставка новых
+    delta = deals.iloc[::50].copy()
+    delta["Сумма"] = delta["Сумма"] * 2
+    delta["Стадия сделки"] = delta["Стадия сделки"].astype(object)
+    delta.iloc[::3, delta.columns.get_loc("Стадия сделки")] = "Новая стадия"
+    inserted = deals.iloc[:20].copy()
+    inserted["ID"] = deals["ID"].max() + 1 + np.arange(len(inserted))
+    delta = pd.concat([delta, inserted.astype({"Стадия сделки": object})], ignore_index=True)
+    return upsert_rows(deals, delta)
+
+def test_update_cube_matches_rebuild(deals):
+    cube = build_cube(deals)
+    df, removed, added = upserted(deals)
+
+    updated = update_cube(cube, removed, added, lambda columns: df if columns is None else df[columns])
+    rebuilt = build_cube(df)
+    # Иначе update_cube перестроил бы куб целиком и сравнение ничего не проверяло бы
+    assert describe_cube(rebuilt)["dimensions"] == describe_cube(cube)["dimensions"]
+    pd.testing.assert_frame_equal(updated, rebuilt, check_exact=False, rtol=1e-9)
+    for filters in CUBE_FILTERS:
+        assert_same(summary_from_cube(updated, filters, ["total_amount", "deals_by_stage"]),
+                    row_summary(df, filters, ["total_amount", "deals_by_stage"]))
@@ -0,0 +1,37 @@
+import time
+
+from services.result_cache import ResultCache, make_key
+
+# Ответ привязан к версии файла: новая версия — другой ключ, а invalidate убирает все ответы по файлу.
+
+
+def test_key_ignores_param_order_but_not_version():
+    key = make_key("/analyze_csv", "f", (1, 10), {"region": ["А"], "status": "В работе"})
+    assert key == make_key("/analyze_csv", "f", (1, 10), {"status": "В работе", "region": ["А"]})
+    assert key != make_key("/analyze_csv", "f", (2, 10), {"region": ["А"], "status": "В работе"})
+    assert key != make_key("/analyze_csv", "f", (1, 10), {"region": ["Б"], "status": "В работе"})
+
+def test_invalidate_removes_only_that_file():
+    cache = ResultCache()
+    cache.put(make_key("/a", "f", 1, {}), "f1")
+    cache.put(make_key("/b", "f", 1, {"x": 1}), "f2")
+    cache.put(make_key("/a", "g", 1, {}), "g1")
+
+    cache.invalidate("f")
+
+    assert cache.get(make_key("/a", "f", 1, {})) is None
+    assert cache.get(make_key("/b", "f", 1, {"x": 1})) is None
+    assert cache.get(make_key("/a", "g", 1, {})) == "g1"
+
+def test_lru_eviction_and_ttl():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    for name in "abc":
+        cache.put((name,), name)
+    assert cache.get(("a",)) is None and cache.get(("c",)) == "c"
+    assert cache.evictions == 1
+
+    cache = ResultCache(ttl_seconds=0.01)
+    cache.put(("a",), "a")
+    time.sleep(0.02)
+    assert cache.get(("a",)) is None
+    assert cache.stats()["entries"] == 0
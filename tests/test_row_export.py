@@ -0,0 +1,65 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from services.row_export import VersionChanged, decode_cursor, encode_cursor, open_and_select, select_rows
+
+# Постраничная выгрузка по курсору должна отдать ровно np.flatnonzero(mask), без повторов и пропусков.
+
+VERSION = (1_700_000_000_123_456_789, 4096)
+
+
+@pytest.mark.parametrize("limit", [1, 7, 100, 10_000])
+@pytest.mark.parametrize("density", [0.0, 0.05, 0.5, 1.0])
+def test_pages_cover_mask(limit, density):
+    mask = np.random.default_rng(3).random(1000) < density
+    pages, cursor = [], None
+    while True:
+        rows, next_row = select_rows(mask, cursor, limit)
+        assert len(rows) <= limit
+        pages.append(rows)
+        if next_row is None:
+            break
+        cursor, _ = decode_cursor(encode_cursor(next_row, VERSION))
+        assert cursor == next_row
+
+    np.testing.assert_array_equal(np.concatenate(pages), np.flatnonzero(mask))
+
+def test_without_limit_returns_all_rows():
+    mask = np.arange(20) % 3 == 0
+    rows, next_row = select_rows(mask, 4)
+    np.testing.assert_array_equal(rows, np.flatnonzero(mask)[2:])
+    assert next_row is None
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42, VERSION)) == (42, VERSION)
+    assert decode_cursor(None) == (None, None)
+
+@pytest.mark.parametrize("cursor", ["", "42", "42.1", "a.b.c", "1.2.3.4"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="cursor"):
+        decode_cursor(cursor)
+
+
+def run(open_table, select, cursor_version):
+    return asyncio.run(open_and_select(open_table, select, cursor_version))
+
+def test_fresh_export_retries_once_on_new_version():
+    versions = iter([(1, 1), (2, 2)])
+
+    async def select(version):
+        if version == (1, 1):
+            raise VersionChanged("изменился")
+        return "rows"
+
+    assert run(lambda: ("table", next(versions)), select, None) == ("table", (2, 2), "rows")
+
+def test_cursor_export_does_not_retry():
+    async def select(version):
+        raise VersionChanged("изменился")
+
+    with pytest.raises(VersionChanged):
+        run(lambda: ("table", (1, 1)), select, (1, 1))
+    with pytest.raises(VersionChanged):
+        run(lambda: ("table", (2, 2)), select, (1, 1))
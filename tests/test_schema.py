@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.schema import CSV_SCHEMA, DATE, EXCEL_DATE_FORMATS, NUMBER, apply_schema, convert_column, failed_columns
+
+# Разбор по уникальным значениям сравнивается с разбором каждого значения по отдельности.
+
+DATE_FORMATS = CSV_SCHEMA["date_formats"]
+
+DATE_VALUES = [
+    "01.02.2023 10:11:12", " 15.03.2023 ", "15.03.2023", "31.02.2023", "2023-03-15", "", "   ", None,
+    datetime(2023, 4, 1), "15.03.2023",
+]
+NUMBER_VALUES = [
+    "1 234 567,89", "1,234,567.89", "1 234,5", "1234.5", "1,5", "12,345", "-7", " 42 ", "н/д", "", None,
+    3.25, 10, "1 234 567,89",
+]
+
+
+def reference_date(value):
+    if isinstance(value, datetime):
+        return pd.Timestamp(value)
+    if not isinstance(value, str) or not value.strip():
+        return pd.NaT
+    for fmt in DATE_FORMATS:
+        try:
+            return pd.Timestamp(datetime.strptime(value.strip(), fmt))
+        except ValueError:
+            pass
+    return pd.NaT
+
+def reference_number(value):
+    if not isinstance(value, str):
+        return np.nan if value is None else float(value)
+    text = "".join(value.split())
+    if text.rfind(",") > text.rfind(".") and text.count(",") == 1:
+        text = text.replace(".", "").replace(",", ".")
+    else:
+        text = text.replace(",", "")
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def test_dates_match_per_value_parsing():
+    series = pd.Series(DATE_VALUES, dtype=object, name="Дата создания")
+    converted, report = convert_column(series, DATE, DATE_FORMATS)
+
+    expected = pd.Series([reference_date(v) for v in DATE_VALUES], dtype="datetime64[ns]", name="Дата создания")
+    pd.testing.assert_series_equal(converted, expected)
+    # Пустые строки и None — не ошибки разбора; "31.02" и ISO-дата — ошибки
+    assert report["values"] == 7 and report["failed"] == 2
+    assert report["examples"] == ["31.02.2023", "2023-03-15"]
+
+def test_numbers_match_per_value_parsing():
+    series = pd.Series(NUMBER_VALUES, dtype=object, name="Сумма")
+    converted, report = convert_column(series, NUMBER, DATE_FORMATS)
+
+    expected = pd.Series([reference_number(v) for v in NUMBER_VALUES], dtype="float64", name="Сумма")
+    pd.testing.assert_series_equal(converted, expected)
+    # Одна запятая — дробный разделитель, даже если похожа на разряды
+    assert converted.iloc[0] == 1234567.89 and converted.iloc[4] == 1.5 and converted.iloc[5] == 12.345
+    assert report["failed"] == 1 and report["examples"] == ["н/д"]
+
+def test_typed_columns_are_kept():
+    dates = pd.Series(pd.to_datetime(["2023-01-01", None]))
+    assert convert_column(dates, DATE, DATE_FORMATS)[0] is dates
+
+    converted, report = convert_column(pd.Series([1, 2, 3]), NUMBER, DATE_FORMATS)
+    assert converted.dtype == "float64" and report["failed"] == 0
+
+# По одной строке в чанке попадаются чанки без строковых значений (datetime, числа)
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_chunk_reports_add_up(chunk_size):
+    df = pd.DataFrame({"Сумма": NUMBER_VALUES, "Дата создания": DATE_VALUES + DATE_VALUES[:4]})
+    whole = {}
+    expected = apply_schema(df.copy(), CSV_SCHEMA, whole)
+
+    report = {}
+    chunks = [apply_schema(df.iloc[i:i + chunk_size].copy(), CSV_SCHEMA, report) for i in range(0, len(df), chunk_size)]
+
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+    for col in whole:
+        assert report[col]["values"] == whole[col]["values"]
+        assert report[col]["failed"] == whole[col]["failed"]
+    assert failed_columns(report) == {"Сумма": 1, "Дата создания": 3}
+
+
+# Текстовые даты Excel: только день первым, без угадывания формата pd.to_datetime
+@pytest.mark.parametrize("value, expected", [
+    ("01.02.2023", "2023-02-01"),
+    ("1.2.2023", "2023-02-01"),
+    ("01.02.2023 10:30:00", "2023-02-01 10:30:00"),
+    ("2023-03-15", "2023-03-15"),
+    ("2023-03-15 08:00:00", "2023-03-15 08:00:00"),
+    (datetime(2023, 3, 15), "2023-03-15"),
+    ("03/15/2023", None),
+    ("2023/03/15", None),
+    ("15 Mar 2023", None),
+])
+def test_excel_text_dates_are_day_first(value, expected):
+    converted, report = convert_column(pd.Series([value], dtype=object), DATE, EXCEL_DATE_FORMATS)
+
+    if expected is None:
+        assert pd.isna(converted.iloc[0])
+        assert report["failed"] == 1 and report["examples"] == [value]
+    else:
+        assert converted.iloc[0] == pd.Timestamp(expected) and report["failed"] == 0
+
+# Одна запятая без точки — дробный разделитель: "1,234" — 1.234 (pd.to_numeric давал NaN)
+@pytest.mark.parametrize("value, expected", [
+    ("1,234", 1.234),
+    ("1,5", 1.5),
+    ("1 234", 1234.0),
+    ("1\xa0234,5", 1234.5),
+    ("1,234,567", 1234567.0),
+    ("1,234.5", 1234.5),
+    ("1.234,5", 1234.5),
+    ("1.234", 1.234),
+])
+def test_number_separators(value, expected):
+    converted, report = convert_column(pd.Series([value], dtype=object), NUMBER, DATE_FORMATS)
+    assert converted.iloc[0] == expected and report["failed"] == 0
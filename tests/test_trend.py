@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generators import generate_excel
+from services.excel_parser import excel_filter_mask, parse_excel_sheet
+from usecases.olap_cube import build_cube, can_answer, describe_cube
+from usecases.trend import TREND_DATE_COLUMN, compute_trend, trend_from_cube
+
+# Динамика по отсортированному индексу даты и по кубу сравнивается с
+# groupby(pd.Grouper(freq=...)) по отфильтрованным строкам. Grouper подписывает
+# неделю (W-SUN) воскресеньем, которым она заканчивается, — в ответе период
+# подписан понедельником, с которого начинается.
+
+GROUPER_FREQ = {"day": "D", "week": "W-SUN", "month": "MS"}
+
+TREND_FILTERS = [
+    {},
+    {"region": ["Алматы", "Астана"]},
+    {"from": "2023-03-15 12:00"},
+    {"from": "2023-01-01", "status": "В работе"},
+]
+
+
+def pandas_mask(df: pd.DataFrame, filters: dict) -> pd.Series:
+    mask = pd.Series(True, index=df.index)
+    if "region" in filters:
+        mask &= df["Регион"].isin(filters["region"])
+    if "status" in filters:
+        mask &= df["Текущий статус"] == filters["status"]
+    if "from" in filters:
+        mask &= df["Дата создания"] >= pd.Timestamp(filters["from"])
+    return mask
+
+def reference_trend(df: pd.DataFrame, filters: dict, bucket: str) -> dict:
+    filtered = df[pandas_mask(df, filters)]
+    dated = filtered[filtered[TREND_DATE_COLUMN].notna()]
+    grouped = dated.groupby(pd.Grouper(key=TREND_DATE_COLUMN, freq=GROUPER_FREQ[bucket]))
+    counts, sums = grouped.size(), grouped["Сумма"].sum()
+    starts = counts.index - pd.Timedelta(days=6) if bucket == "week" else counts.index
+    return {
+        "bucket": bucket,
+        "date_col": TREND_DATE_COLUMN,
+        "total_deals": len(filtered),
+        "no_date": len(filtered) - len(dated),
+        "points": [
+            {"period": start.date().isoformat(), "deals": int(count), "amount": float(amount)}
+            for start, count, amount in zip(starts, counts, sums)
+        ],
+    }
+
+def assert_same_trend(got: dict, expected: dict) -> None:
+    # Суммы периода складываются в другом порядке, чем в groupby, — сравниваем с допуском
+    assert {k: v for k, v in got.items() if k != "points"} == {k: v for k, v in expected.items() if k != "points"}
+    assert [(p["period"], p["deals"]) for p in got["points"]] == [(p["period"], p["deals"]) for p in expected["points"]]
+    for point, reference in zip(got["points"], expected["points"]):
+        assert math.isclose(point["amount"], reference["amount"], rel_tol=1e-9, abs_tol=1e-6), point["period"]
+
+@pytest.fixture
+def dated_deals(deals) -> pd.DataFrame:
+    # Часть сделок без даты создания, часть без суммы
+    rng = np.random.default_rng(3)
+    deals.loc[rng.random(len(deals)) < 0.03, TREND_DATE_COLUMN] = pd.NaT
+    assert deals[TREND_DATE_COLUMN].isna().any() and deals["Сумма"].isna().any()
+    return deals
+
+
+@pytest.mark.parametrize("bucket", ["day", "week", "month"])
+@pytest.mark.parametrize("filters", TREND_FILTERS)
+def test_trend_matches_grouper(dated_deals, filters, bucket):
+    got = compute_trend(dated_deals, filters, bucket)
+
+    assert_same_trend(got, reference_trend(dated_deals, filters, bucket))
+
+def test_week_starts_on_monday(dated_deals):
+    points = compute_trend(dated_deals, {}, "week")["points"]
+
+    assert {pd.Timestamp(p["period"]).day_name() for p in points} == {"Monday"}
+
+def test_empty_periods_and_empty_selection():
+    df = pd.DataFrame({
+        TREND_DATE_COLUMN: pd.to_datetime(["2024-01-31 23:59", None, "2024-04-01 00:00", "2024-01-01 00:00"]),
+        "Сумма": [1.0, 2.0, np.nan, 4.0],
+        "Регион": ["А", "А", "Б", "А"],
+    })
+
+    trend = compute_trend(df, {}, "month")
+    assert_same_trend(trend, reference_trend(df, {}, "month"))
+    # Февраль и март пусты, но остаются на оси
+    assert [(p["period"], p["deals"], p["amount"]) for p in trend["points"]] == [
+        ("2024-01-01", 2, 5.0), ("2024-02-01", 0, 0.0), ("2024-03-01", 0, 0.0), ("2024-04-01", 1, 0.0),
+    ]
+
+    nothing = compute_trend(df, {"region": ["нет"]}, "day")
+    assert nothing["points"] == [] and nothing["total_deals"] == 0
+    only_undated = compute_trend(df.iloc[[1]], {}, "week")
+    assert only_undated["points"] == [] and only_undated["total_deals"] == only_undated["no_date"] == 1
+
+@pytest.mark.parametrize("filters", [{}, {"region": ["Алматы", "Астана"]}, {"from": "2023-01-01", "status": "В работе"}])
+def test_cube_trend_matches_grouper(dated_deals, filters):
+    cube = build_cube(dated_deals)
+    assert can_answer(describe_cube(cube), list(dated_deals.columns), filters, ["total_deals", "total_amount"])
+
+    got = trend_from_cube(cube, filters)
+
+    assert_same_trend(got, reference_trend(dated_deals, filters, "month"))
+    assert_same_trend(got, compute_trend(dated_deals, filters, "month"))
+
+
+@pytest.fixture(scope="module")
+def active_sheet(tmp_path_factory) -> pd.DataFrame:
+    path = generate_excel(str(tmp_path_factory.mktemp("data") / "objects.xlsx"), 3000, seed=17)
+    return parse_excel_sheet(path, "Действующие")
+
+@pytest.mark.parametrize("period", [
+    ("2019-06-01", "2022-12-31"),
+    ("2020-01-01 00:00:01", "2021-06-30 23:59"),
+    ("2030-01-01", "2031-01-01"),
+])
+def test_excel_period_filter_matches_comparisons(active_sheet, period):
+    start, end = period
+    begin, finish = active_sheet["Дата начала строительства"], active_sheet["Дата завершения 2"]
+    assert begin.isna().any() and finish.isna().any()
+
+    mask = excel_filter_mask(active_sheet, "Действующие", {"start_date": start, "end_date": end})
+
+    low, high = pd.Timestamp(start), pd.Timestamp(end)
+    expected = ((begin >= low) & (finish <= high)).to_numpy()
+    np.testing.assert_array_equal(mask, expected)
+
+def test_excel_period_bounds_are_inclusive(active_sheet):
+    begin, finish = active_sheet["Дата начала строительства"], active_sheet["Дата завершения 2"]
+    row = active_sheet.index[begin.notna() & finish.notna()][0]
+
+    mask = excel_filter_mask(
+        active_sheet, "Действующие", {"start_date": str(begin[row]), "end_date": str(finish[row])}
+    )
+
+    assert mask[row]
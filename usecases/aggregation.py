@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, Iterable, List
+
+# Агрегации поверх факторизованных колонок: колонка один раз превращается
+# в целочисленные коды групп, счётчики считаются через bincount по кодам,
+# суммы — группировкой по тем же кодам, без повторного хеширования строк.
+
+
+class Factorized:
+    """Колонка в виде кодов групп; -1 — пропуск.
+
+    Порядок групп совпадает с порядком, в котором их выдаёт groupby(sort=True):
+    категории категориальной колонки или отсортированные значения.
+
+    Для уже агрегированных строк (куб) weights задаёт число исходных строк
+    в каждой, positions — номер первой из них.
+    """
+
+    def __init__(
+        self,
+        series: pd.Series,
+        weights: np.ndarray | None = None,
+        positions: np.ndarray | None = None
+    ):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            uniques = series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series, sort=True, use_na_sentinel=True)
+
+        self.codes = codes.astype(np.int64, copy=False)
+        self.uniques = uniques.tolist()
+        self.k = len(self.uniques)
+        self._valid = self.codes >= 0
+        self._weights = weights
+        self._positions = np.arange(len(self.codes)) if positions is None else positions
+        self._counts = None
+        self._first_seen = None
+
+    def counts(self) -> np.ndarray:
+        if self._counts is None:
+            weights = None if self._weights is None else self._weights[self._valid]
+            counts = np.bincount(self.codes[self._valid], weights=weights, minlength=self.k)
+            self._counts = counts.astype(np.int64, copy=False)
+        return self._counts
+
+    def first_seen(self) -> np.ndarray:
+        # Номер строки, где группа встретилась впервые — для порядка равных значений
+        if self._first_seen is None:
+            first = np.full(self.k, np.iinfo(np.int64).max, dtype=np.int64)
+            rows = np.flatnonzero(self._valid)
+            np.minimum.at(first, self.codes[rows], self._positions[rows])
+            self._first_seen = first
+        return self._first_seen
+
+    def sums(self, values: np.ndarray) -> np.ndarray:
+        # Суммы по группам считает groupby по готовым кодам: тот же алгоритм
+        # (с компенсацией ошибки округления), что и groupby по исходной колонке
+        groups = pd.Categorical.from_codes(self.codes, categories=pd.RangeIndex(self.k))
+        return pd.Series(values).groupby(groups, observed=False, sort=True).sum().to_numpy()
+
+    def nunique(self) -> int:
+        return int(np.count_nonzero(self.counts()))
+
+
+def _ranked(values: np.ndarray, present: np.ndarray, tiebreak: np.ndarray, limit: int | None) -> np.ndarray:
+    """Номера групп по убыванию values; при равенстве — по возрастанию tiebreak."""
+    candidates = np.flatnonzero(present)
+    if limit is not None and len(candidates) > limit:
+        # Частичная сортировка: оставляем только группы не меньше limit-го значения
+        kth = np.partition(values[candidates], len(candidates) - limit)[len(candidates) - limit]
+        candidates = candidates[values[candidates] >= kth]
+    order = np.lexsort((tiebreak[candidates], -values[candidates]))
+    ranked = candidates[order]
+    return ranked if limit is None else ranked[:limit]
+
+def _python(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+def value_counts(column: Factorized, limit: int | None = None) -> Dict[Any, int]:
+    """Как value_counts().to_dict() (или .nlargest(limit)): равные — в порядке появления."""
+    counts = column.counts()
+    ranked = _ranked(counts, counts > 0, column.first_seen(), limit)
+    return {column.uniques[g]: int(counts[g]) for g in ranked}
+
+def appearance_counts(column: Factorized) -> Dict[Any, int]:
+    """Счётчики непустых групп в порядке первого появления.
+
+    Такие счётчики можно складывать между частями таблицы: после сложения
+    порядок ключей остаётся порядком появления во всей таблице, и сортировка
+    по убыванию (устойчивая) даёт то же, что value_counts по ней целиком.
+    """
+    counts = column.counts()
+    present = np.flatnonzero(counts > 0)
+    ordered = present[np.argsort(column.first_seen()[present], kind="stable")]
+    return {column.uniques[g]: int(counts[g]) for g in ordered}
+
+def top_sums(column: Factorized, values: np.ndarray, limit: int) -> Dict[Any, float]:
+    """Как groupby(column)[values].sum().nlargest(limit).to_dict()."""
+    sums = column.sums(values)
+    ranked = _ranked(sums, column.counts() > 0, np.arange(column.k), limit)
+    return {column.uniques[g]: _python(sums[g]) for g in ranked}
+
+def group_sums(column: Factorized, values: np.ndarray) -> Dict[Any, Any]:
+    """Суммы values по всем непустым группам, в порядке групп."""
+    sums = column.sums(values)
+    return {column.uniques[g]: _python(sums[g]) for g in np.flatnonzero(column.counts() > 0)}
+
+def numeric_values(series: pd.Series) -> np.ndarray:
+    # Целые колонки оставляем целыми: groupby по ним тоже даёт целые суммы
+    if pd.api.types.is_integer_dtype(series.dtype) and not pd.api.types.is_extension_array_dtype(series.dtype):
+        return series.to_numpy()
+    return series.to_numpy(dtype="float64", na_value=np.nan)
+
+def non_null_count(values: np.ndarray) -> int:
+    if values.dtype.kind == "f":
+        return int(len(values) - np.count_nonzero(np.isnan(values)))
+    return len(values)
+
+def total(values: np.ndarray) -> float:
+    """Как float(Series.sum(skipna=True))."""
+    if values.dtype.kind != "f":
+        return float(values.sum(dtype=np.int64))
+    return float(np.where(np.isnan(values), 0.0, values).sum())
+
+def mean(values: np.ndarray) -> float:
+    """Как float(Series.mean(skipna=True))."""
+    count = non_null_count(values)
+    if values.dtype.kind != "f":
+        return float(values.astype(np.float64).sum() / count) if count else float("nan")
+    return float(np.where(np.isnan(values), 0.0, values).sum() / count) if count else float("nan")
+
+
+def validate_columns(columns: List[str] | None, available: List[str]) -> None:
+    missing = [col for col in columns or [] if col not in available]
+    if missing:
+        raise ValueError(f"Нет колонок: {', '.join(missing)}")
+
+def column_stats(series: pd.Series) -> Dict[str, Any]:
+    """Короткая сводка по колонке вместо describe(): только то, что дёшево и читается."""
+    dtype = series.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        non_null = series.dropna()
+        return {
+            "count": int(len(non_null)),
+            "min": non_null.min().isoformat() if len(non_null) else None,
+            "max": non_null.max().isoformat() if len(non_null) else None,
+        }
+
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        values = numeric_values(series)
+        count = non_null_count(values)
+        valid = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+        return {
+            "count": count,
+            "sum": total(values),
+            "mean": mean(values) if count else None,
+            "min": _python(valid.min()) if count else None,
+            "max": _python(valid.max()) if count else None,
+        }
+
+    column = Factorized(series)
+    top = value_counts(column, 1)
+    value, freq = next(iter(top.items()), (None, 0))
+    return {
+        "count": int(column.counts().sum()),
+        "unique": column.nunique(),
+        "top": value.isoformat() if isinstance(value, pd.Timestamp) else _python(value),
+        "freq": freq,
+    }
+
+
+class Lazy:
+    """Значения, которые считаются при первом обращении и запоминаются.
+
+    Каждое определение получает сам Lazy и берёт из него то, от чего зависит:
+    зависимости метрик разрешаются сами, общие промежуточные значения (числа
+    колонки, факторизация) считаются один раз, а то, что не нужно ни одной
+    запрошенной метрике, не считается вовсе.
+    """
+
+    def __init__(self, definitions: Dict[str, Callable[["Lazy"], Any]]):
+        self._definitions = definitions
+        self._values: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._values:
+            self._values[name] = self._definitions[name](self)
+        return self._values[name]
+
+    def evaluate(self, names: Iterable[str]) -> Dict[str, Any]:
+        return {name: self[name] for name in names}
+
+def requested(available: List[str], metrics: List[str] | None) -> List[str]:
+    # Без списка — все метрики; порядок ответа — порядок available
+    return available if metrics is None else [m for m in available if m in metrics]
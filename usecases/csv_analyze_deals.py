@@ -1,7 +1,14 @@
 
+import numpy as np
 import pandas as pd
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+from usecases.aggregation import (
+    Factorized, Lazy, column_stats, mean, non_null_count, numeric_values, requested, top_sums, total,
+    validate_columns, value_counts
+)
+from usecases.filter_index import FilterIndex, get_filter_index, range_mask
 
 def find_column(df: pd.DataFrame, prefix: str) -> str | None:
     for col in df.columns:
@@ -9,72 +16,241 @@ def find_column(df: pd.DataFrame, prefix: str) -> str | None:
             return col
     return None
 
-def apply_filters(df: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFrame:
-    filtered_df = df.copy()
+# Ключ фильтра -> колонка. Колонки региона и типа сделки уточняются по файлу
+FILTER_COLUMN_MAP = {
+    "region": "Регион",
+    "status": "Текущий статус",
+    "stage": "Стадия сделки",
+    "responsible": "Ответственный",
+    "company": "Компания",
+    "amount_min": "Сумма",
+    "amount_max": "Сумма",
+    "repeats": "Повторная сделка",
+    "recontacts": "Повторное обращение",
+    "from": "Дата создания",
+    "to": "Дата завершения",
+    "funnel": "Воронка",
+    "deal_type": "Тип сделки",
+}
+
+FLAG_FILTER_VALUES = {"Y": True, "N": False}
+
+def _as_flag(value: Any) -> Any:
+    # Флаги Y/N хранятся как boolean; фильтр может прийти и как "Y"/"N", и как true/false
+    if isinstance(value, list):
+        return [_as_flag(v) for v in value]
+    return FLAG_FILTER_VALUES.get(value, value) if isinstance(value, str) else value
+
+def _count_flag(series: pd.Series, weights: np.ndarray | None = None) -> int:
+    if weights is not None:
+        # Строки куба: каждая отвечает weights исходным строкам
+        flagged = series == (True if pd.api.types.is_bool_dtype(series.dtype) else "Y")
+        return int(weights[flagged.to_numpy(dtype=bool, na_value=False)].sum())
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return int(series.sum())
+    return int((series == "Y").sum())
+
+def _sort_key(value: Any) -> tuple:
+    return (type(value).__name__, repr(value))
 
-    region_col = filters.get("region_col") or find_column(df, "Регион")
+def canonical_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит фильтры к виду, по которому одинаковые запросы совпадают.
 
-    deal_type_col = next((col for col in df.columns if col.strip() == "Тип сделки"), "Тип сделки")
+    Пустые значения и незнакомые ключи убираются так же, как их пропускает
+    apply_filters; списки сортируются, суммы и даты приводятся к числам и ISO-строкам.
+    """
+    result = {}
+    for key, value in filters.items():
+        if key != "region_col" and key not in FILTER_COLUMN_MAP:
+            continue
+        if value in [None, '', [], {}]:
+            continue
 
-    COLUMN_MAP = {
+        if isinstance(value, list):
+            try:
+                value = sorted(set(value), key=_sort_key)
+            except TypeError:
+                pass
+        elif key in {"amount_min", "amount_max"}:
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+            except TypeError:
+                pass
+        elif key in {"from", "to"}:
+            parsed = pd.to_datetime(value, errors="coerce")
+            if isinstance(parsed, pd.Timestamp) or parsed is pd.NaT:
+                value = "NaT" if parsed is pd.NaT else parsed.isoformat()
+
+        result[key] = value
+    return result
+
+def resolve_column_map(columns: List[str], filters: Dict[str, Any]) -> Dict[str, str]:
+    region_col = filters.get("region_col") or next((c for c in columns if c.strip().startswith("Регион")), None)
+
+    deal_type_col = next((col for col in columns if col.strip() == "Тип сделки"), "Тип сделки")
+
+    return {
+        **FILTER_COLUMN_MAP,
         "region": region_col or "Регион",
-        "status": "Текущий статус",
-        "stage": "Стадия сделки",
-        "responsible": "Ответственный",
-        "company": "Компания",
-        "amount_min": "Сумма",
-        "amount_max": "Сумма",
-        "repeats": "Повторная сделка",
-        "recontacts": "Повторное обращение",
-        "from": "Дата создания",
-        "to": "Дата завершения",
-        "funnel": "Воронка",
         "deal_type": deal_type_col,
     }
 
+def _equals_mask(index: FilterIndex, series: pd.Series, value: Any) -> np.ndarray:
+    if pd.api.types.is_bool_dtype(series.dtype):
+        value = _as_flag(value)
+
+    if index.supports_equality(series):
+        try:
+            if not isinstance(value, list):
+                return index.equals_mask(series, [value])
+            has_na = any(not isinstance(v, (list, dict)) and pd.isna(v) for v in value)
+            if not has_na:
+                return index.equals_mask(series, value)
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Как Series.isin у категорий: None или NaN в списке отбирает все пропуски колонки
+                return index.equals_mask(series, value, include_na=True)
+            # У остальных типов isin различает None и NaN, а индекс хранит их одним
+            # кодом пропуска — такие списки сравнивает pandas
+        except TypeError:
+            # Нехешируемое значение — сравниваем средствами pandas
+            pass
+
+    if isinstance(value, list):
+        return series.isin(value).to_numpy(dtype=bool)
+    return (series == value).to_numpy(dtype=bool)
+
+def _memo_key(column: str, key: str, value: Any) -> tuple:
+    return (column, key, json.dumps(value, sort_keys=True, ensure_ascii=False, default=str))
+
+def filter_mask(
+    df: pd.DataFrame,
+    filters: Dict[str, Any],
+    index: FilterIndex | None = None,
+    memo: Dict[tuple, np.ndarray] | None = None
+) -> np.ndarray:
+    """Вычисляет маску строк по фильтрам, не создавая промежуточных таблиц.
+
+    Каждый фильтр даёт битовую маску из индекса колонки (значение -> строки,
+    либо отсортированная колонка для диапазонов); маски объединяются через AND.
+    memo — общий словарь масок отдельных фильтров для нескольких наборов
+    фильтров к одной таблице: одинаковый фильтр считается один раз.
+    """
+    index = index or get_filter_index(df)
+    column_map = resolve_column_map(df.columns, filters)
+    mask = np.ones(len(df), dtype=bool)
+
     for key, value in filters.items():
         if key == "region_col":
             continue
 
-        column = COLUMN_MAP.get(key)
-        if column not in filtered_df.columns or value in [None, '', [], {}]:
+        column = column_map.get(key)
+        if column not in df.columns or value in [None, '', [], {}]:
             continue
 
+        memo_key = _memo_key(column, key, value) if memo is not None else None
+        if memo is not None and memo_key in memo:
+            mask &= memo[memo_key]
+            continue
+
+        series = df[column]
         if key == "from":
-            filtered_df = filtered_df[filtered_df[column] >= pd.to_datetime(value, errors="coerce")]
+            key_mask = range_mask(index, series, low=pd.to_datetime(value, errors="coerce"))
         elif key == "to":
-            filtered_df = filtered_df[filtered_df[column] <= pd.to_datetime(value, errors="coerce")]
+            key_mask = range_mask(index, series, high=pd.to_datetime(value, errors="coerce"))
         elif key in {"amount_min", "amount_max"}:
             try:
                 val = float(value)
-                if key == "amount_min":
-                    filtered_df = filtered_df[filtered_df[column] >= val]
-                else:
-                    filtered_df = filtered_df[filtered_df[column] <= val]
             except ValueError:
                 continue
-        elif key in {"повторная_сделка", "повторное_обращение"}:
-            filtered_df = filtered_df[filtered_df[column] == ("Y" if value else "N")]
-        elif isinstance(value, list):
-            filtered_df = filtered_df[filtered_df[column].isin(value)]
+            if key == "amount_min":
+                key_mask = range_mask(index, series, low=val)
+            else:
+                key_mask = range_mask(index, series, high=val)
         else:
-            filtered_df = filtered_df[filtered_df[column] == value]
+            key_mask = _equals_mask(index, series, value)
 
-    return filtered_df
+        if memo is not None:
+            memo[memo_key] = key_mask
+        mask &= key_mask
 
-def compute_summary(df: pd.DataFrame, filters: Dict[str, Any], region_col: str | None = None) -> dict:
-    return {
-        "total_deals": int(len(df)),
-        "total_amount": float(df["Сумма"].sum(skipna=True)) if "Сумма" in df and not df["Сумма"].isna().all() else 0.0,
-        "avg_amount": float(df["Сумма"].mean(skipna=True)) if "Сумма" in df and not df["Сумма"].isna().all() else 0.0,
-        "unique_companies": int(df["Компания"].nunique()) if "Компания" in df else 0,
-        "deals_by_stage": df["Стадия сделки"].value_counts().to_dict() if "Стадия сделки" in df else {},
-        "deals_by_status": df["Текущий статус"].value_counts().to_dict() if "Текущий статус" in df else {},
-        "top_companies_by_sum": df.groupby("Компания")["Сумма"].sum().nlargest(5).to_dict() if "Компания" in df and "Сумма" in df else {},
-        "top_companies_by_count": df["Компания"].value_counts().nlargest(5).to_dict() if "Компания" in df else {},
-        "top_regions_by_sum": df.groupby(region_col)["Сумма"].sum().nlargest(5).to_dict() if region_col in df.columns and "Сумма" in df else {},
-        "top_regions_by_sum_note": {"region_col": region_col} if region_col else None,
-        "repeats": int((df["Повторная сделка"] == "Y").sum()) if "Повторная сделка" in df else 0,
-        "recontacts": int((df["Повторное обращение"] == "Y").sum()) if "Повторное обращение" in df else 0,
-        "deals_by_funnel": df["Воронка"].value_counts().to_dict() if "Воронка" in df else {},
+    return mask
+
+def apply_filters(
+    df: pd.DataFrame,
+    filters: Dict[str, Any],
+    memo: Dict[tuple, np.ndarray] | None = None
+) -> pd.DataFrame:
+    mask = filter_mask(df, filters, memo=memo)
+    # Итоговая выборка материализуется один раз; без фильтров — без копии вовсе
+    if mask.all():
+        return df
+    return df[mask]
+
+DEFAULT_SUMMARY_REGION_COL = "Регион (гарантирование)"
+
+# Метрики compute_summary в порядке их следования в ответе
+SUMMARY_METRICS = [
+    "total_deals", "total_amount", "avg_amount", "unique_companies",
+    "deals_by_stage", "deals_by_status", "top_companies_by_sum", "top_companies_by_count",
+    "top_regions_by_sum", "top_regions_by_sum_note", "repeats", "recontacts", "deals_by_funnel",
+]
+
+def validate_metrics(metrics: List[str] | None) -> None:
+    unknown = [m for m in metrics or [] if m not in SUMMARY_METRICS]
+    if unknown:
+        raise ValueError(f"Неизвестные метрики: {', '.join(unknown)}")
+
+def resolve_summary_region_col(df: pd.DataFrame, filters: Dict[str, Any]) -> str | None:
+    # Колонка региона для top_regions_by_sum: из фильтров, если в выборке она заполнена
+    region_col = filters.get("region_col")
+    if not region_col or region_col not in df.columns or df[region_col].isna().all():
+        region_col = DEFAULT_SUMMARY_REGION_COL if DEFAULT_SUMMARY_REGION_COL in df.columns else None
+    return region_col
+
+def compute_summary(
+    df: pd.DataFrame,
+    filters: Dict[str, Any],
+    region_col: str | None = None,
+    metrics: List[str] | None = None,
+    columns: List[str] | None = None
+) -> dict:
+    """Запрошенные метрики сводки (None — все) и column_stats по колонкам columns.
+
+    Метрики и промежуточные значения — узлы Lazy: числа "Сумма" и
+    факторизация каждой колонки считаются один раз и только если нужны
+    хотя бы одной запрошенной метрике.
+    """
+    validate_columns(columns, list(df.columns))
+
+    def column(name: str) -> str:
+        return f"column:{name}"
+
+    definitions = {
+        column(name): (lambda v, name=name: Factorized(df[name]))
+        for name in ["Компания", "Стадия сделки", "Текущий статус", "Воронка", region_col]
+        if name in df.columns
     }
+    definitions.update({
+        "amounts": lambda v: numeric_values(df["Сумма"]) if "Сумма" in df else None,
+        "has_amounts": lambda v: v["amounts"] is not None and non_null_count(v["amounts"]) > 0,
+        "total_deals": lambda v: int(len(df)),
+        "total_amount": lambda v: total(v["amounts"]) if v["has_amounts"] else 0.0,
+        "avg_amount": lambda v: mean(v["amounts"]) if v["has_amounts"] else 0.0,
+        "unique_companies": lambda v: v[column("Компания")].nunique() if "Компания" in df else 0,
+        "deals_by_stage": lambda v: value_counts(v[column("Стадия сделки")]) if "Стадия сделки" in df else {},
+        "deals_by_status": lambda v: value_counts(v[column("Текущий статус")]) if "Текущий статус" in df else {},
+        "top_companies_by_sum": lambda v: top_sums(v[column("Компания")], v["amounts"], 5) if "Компания" in df and v["amounts"] is not None else {},
+        "top_companies_by_count": lambda v: value_counts(v[column("Компания")], 5) if "Компания" in df else {},
+        "top_regions_by_sum": lambda v: top_sums(v[column(region_col)], v["amounts"], 5) if region_col in df.columns and v["amounts"] is not None else {},
+        "top_regions_by_sum_note": lambda v: {"region_col": region_col} if region_col else None,
+        "repeats": lambda v: _count_flag(df["Повторная сделка"]) if "Повторная сделка" in df else 0,
+        "recontacts": lambda v: _count_flag(df["Повторное обращение"]) if "Повторное обращение" in df else 0,
+        "deals_by_funnel": lambda v: value_counts(v[column("Воронка")]) if "Воронка" in df else {},
+    })
+
+    summary = Lazy(definitions).evaluate(requested(SUMMARY_METRICS, metrics))
+    if columns:
+        summary["column_stats"] = {col: column_stats(df[col]) for col in columns}
+    return summary
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Tuple
+
+from services.csv_parser import FLAG_VALUES
+
+# Обновление загруженной выгрузки дельтой: строки с известным ID заменяются
+# на месте (номера строк сохраняются), новые ID добавляются в конец таблицы.
+#
+# Обновление пропорционально дельте (upsert_delta): из таблицы читаются только
+# колонка ID и заменяемые строки, новые версии строк дописываются к файлу
+# сегментом (services.file_cache.store_segment), метаданные фильтров
+# (update_csv_metadata) и куб (update_cube) обновляются по removed и added.
+# Если колонке таблицы нужен более общий тип (например, новый ID не помещается
+# в разрядность колонки), таблица загружается и перезаписывается целиком (upsert_rows).
+
+ID_COLUMN = "ID"
+
+
+def _union_categories(base: pd.Series, delta: pd.Series) -> pd.CategoricalDtype:
+    categories = base.cat.categories
+    new_values = pd.Index(delta.dropna().unique()).difference(categories, sort=False)
+    return pd.CategoricalDtype(categories.append(new_values), ordered=base.cat.ordered)
+
+def _conform(base: pd.Series, delta: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Приводит колонку дельты к типу колонки таблицы (или обе — к общему типу)."""
+    dtype = base.dtype
+    if delta.dtype == dtype:
+        return base, delta
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        values = delta.astype(object)
+        target = _union_categories(base, values)
+        return base.astype(target), values.astype(target)
+
+    values = delta.astype(object) if isinstance(delta.dtype, pd.CategoricalDtype) else delta
+    try:
+        if pd.api.types.is_bool_dtype(dtype):
+            if values.dtype == object:
+                mapped = values.map(FLAG_VALUES)
+                if mapped.isna().ne(values.isna()).any():
+                    raise ValueError("не флаг Y/N")
+                values = mapped
+            return base, values.astype(dtype)
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return base, pd.to_datetime(values, errors="raise").astype(dtype)
+        if pd.api.types.is_integer_dtype(dtype):
+            numeric = pd.to_numeric(values, errors="raise")
+            if pd.api.types.is_integer_dtype(numeric.dtype):
+                target = np.promote_types(dtype, numeric.dtype)
+                return base.astype(target), numeric.astype(target)
+            # Пропуски или дробные значения в целой колонке — переходим на float
+            return base.astype("float64"), numeric.astype("float64")
+        if pd.api.types.is_float_dtype(dtype):
+            return base, pd.to_numeric(values, errors="raise").astype(dtype)
+    except (ValueError, TypeError):
+        pass
+    # Значения дельты не укладываются в тип колонки — обе колонки становятся строковыми
+    return base.astype(object), values.astype(object)
+
+def align_delta(base: pd.DataFrame, delta: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Дельта с колонками и типами таблицы; колонки таблицы меняют тип, только если иначе нельзя."""
+    extra = [col for col in delta.columns if col not in base.columns]
+    if extra:
+        raise ValueError(f"Колонок нет в исходном файле: {', '.join(map(str, extra))}")
+    if ID_COLUMN not in delta.columns:
+        raise ValueError(f"В дельте нет колонки '{ID_COLUMN}'")
+
+    delta = delta.reindex(columns=base.columns)
+    changed = {}
+    for col in base.columns:
+        base_col, delta[col] = _conform(base[col], delta[col])
+        if base_col.dtype != base[col].dtype:
+            changed[col] = base_col
+    if changed:
+        base = base.assign(**changed)
+    return base, delta
+
+def _numbered(ids: pd.Series, delta: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """Новые версии строк с номерами строк в индексе и номера заменяемых строк.
+
+    delta уже приведена к типам таблицы; заменённые строки — первыми, затем
+    вставленные (их номера продолжают таблицу из len(ids) строк).
+    """
+    if delta[ID_COLUMN].isna().any():
+        raise ValueError(f"В дельте есть строки без '{ID_COLUMN}'")
+
+    # Повтор ID внутри дельты — побеждает последняя строка, как при построчном применении
+    delta = delta[~delta[ID_COLUMN].duplicated(keep="last")].reset_index(drop=True)
+    index = pd.Index(ids)
+    if not index.is_unique:
+        raise ValueError(f"В исходном файле повторяются значения '{ID_COLUMN}'")
+
+    positions = index.get_indexer(delta[ID_COLUMN])
+    updated = positions >= 0
+    replaced = positions[updated]
+    rows = np.concatenate([replaced, len(index) + np.arange(int((~updated).sum()))])
+    order = np.concatenate([np.flatnonzero(updated), np.flatnonzero(~updated)])
+    return delta.iloc[order].set_axis(rows), replaced
+
+def apply_rows(base: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    """Копия base, в которой строки с номерами из индекса added заменены, а новые — дописаны."""
+    changed = {col: base[col].astype(added[col].dtype) for col in base.columns if base[col].dtype != added[col].dtype}
+    if changed:
+        base = base.assign(**changed)
+    replaced = added.index < len(base)
+    inserted = added[~replaced]
+    df = pd.concat([base, inserted], ignore_index=True) if len(inserted) else base.copy()
+    if replaced.any():
+        replacement = added[replaced]
+        for i, col in enumerate(df.columns):
+            df.iloc[replacement.index, i] = replacement[col].to_numpy()
+    return df
+
+def upsert_rows(base: pd.DataFrame, delta: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Применяет дельту к таблице по колонке ID.
+
+    Возвращает новую таблицу, прежние версии заменённых строк и новые
+    версии всех изменённых строк (заменённых и вставленных); индекс двух
+    последних — номера строк в новой таблице. Новая таблица — полная копия
+    base: время и память пропорциональны размеру таблицы, поэтому так
+    обновляются, только если колонкам нужен более общий тип (см. upsert_delta).
+    """
+    if ID_COLUMN not in base.columns:
+        raise ValueError(f"В исходном файле нет колонки '{ID_COLUMN}'")
+    base, delta = align_delta(base, delta)
+    added, replaced = _numbered(base[ID_COLUMN], delta)
+    removed = base.iloc[replaced].set_axis(replaced)
+    return apply_rows(base, added), removed, added
+
+def upsert_delta(
+    schema: pd.DataFrame,
+    ids: Callable[[], pd.Series],
+    rows: Callable[[np.ndarray], pd.DataFrame],
+    delta: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame] | None:
+    """Изменения таблицы по дельте без загрузки таблицы: (removed, added), как у upsert_rows.
+
+    schema — пустая таблица с типами колонок; ids() — колонка ID, rows(номера)
+    — строки таблицы. Читаются только они. None — колонкам таблицы нужен
+    более общий тип (расширение категорий не в счёт): её придётся обновить
+    целиком (upsert_rows).
+    """
+    if ID_COLUMN not in schema.columns:
+        raise ValueError(f"В исходном файле нет колонки '{ID_COLUMN}'")
+    aligned, delta = align_delta(schema, delta)
+    if any(
+        aligned[col].dtype != schema[col].dtype and not isinstance(schema[col].dtype, pd.CategoricalDtype)
+        for col in schema.columns
+    ):
+        return None
+    added, replaced = _numbered(ids(), delta)
+    removed = rows(replaced).set_axis(replaced)
+    # Прежние версии — с категориями новых, как у upsert_rows
+    removed = removed.astype({col: added[col].dtype for col in removed.columns if removed[col].dtype != added[col].dtype})
+    return removed, added
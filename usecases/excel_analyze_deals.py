@@ -1,37 +1,183 @@
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+from usecases.aggregation import (
+    Factorized, Lazy, appearance_counts, column_stats, group_sums, non_null_count, numeric_values, requested,
+    total, validate_columns
+)
+from usecases.filter_index import get_filter_index, range_mask
 
 def apply_filters(df: pd.DataFrame, filters: Dict[str, Any]) -> pd.DataFrame:
-    filtered_df = df.copy()
+    # Маски из индексов колонок; даты — бинарным поиском по отсортированной колонке
+    index = get_filter_index(df)
+    mask = np.ones(len(df), dtype=bool)
 
     if "regions" in filters and "регион" in df.columns:
-        filtered_df = filtered_df[filtered_df["регион"].isin(filters["regions"])]
+        mask &= df["регион"].isin(filters["regions"]).to_numpy(dtype=bool)
 
     if "start_date" in filters and "дата начала строительства" in df.columns:
         start = pd.to_datetime(filters["start_date"], errors="coerce")
         if not pd.isna(start):
-            filtered_df = filtered_df[filtered_df["дата начала строительства"] >= start]
+            mask &= range_mask(index, df["дата начала строительства"], low=start)
 
     if "end_date" in filters and "дата завершения 2/дата по апоэ" in df.columns:
         end = pd.to_datetime(filters["end_date"], errors="coerce")
         if not pd.isna(end):
-            filtered_df = filtered_df[filtered_df["дата завершения 2/дата по апоэ"] <= end]
-
-    return filtered_df
-
-def compute_summary(df: pd.DataFrame) -> dict:
-    return {
-        "total_rows": int(len(df)),
-        "total_cost": float(df["стоимость"].sum(skipna=True)) if "стоимость" in df else 0.0,
-        "total_area": float(df["площадь"].sum(skipna=True)) if "площадь" in df else 0.0,
-        "avg_cost": float(df["стоимость"].mean(skipna=True)) if "стоимость" in df else 0.0,
-        "by_region": df["регион"].value_counts().to_dict() if "регион" in df else {},
-        "by_sheet": df["__source_sheet"].value_counts().to_dict() if "__source_sheet" in df else {},
-        "by_year": (
-            df["дата начала строительства"].dt.year.value_counts().to_dict()
-            if "дата начала строительства" in df and not df["дата начала строительства"].isna().all()
-            else {}
-        ),
-        "top_builders_by_cost": df.groupby("застройщик")["стоимость"].sum().nlargest(5).to_dict()
-            if "застройщик" in df and "стоимость" in df else {}
+            mask &= range_mask(index, df["дата завершения 2/дата по апоэ"], high=end)
+
+    return df if mask.all() else df[mask]
+
+# Колонки сводки в нижнем регистре -> варианты их названий на листах книги
+# (в порядке предпочтения): на разных листах одни и те же данные названы по-разному
+SUMMARY_COLUMNS = {
+    "регион": ["Регион", "Область"],
+    "площадь": ["Площадь, кв.м по Проекту", "Площадь"],
+    "стоимость": ["Стоимость"],
+    "застройщик": ["Застройщик"],
+    "дата начала строительства": ["Дата начала строительства"],
+    "дата завершения 2/дата по апоэ": ["Дата завершения 2", "Дата по АПОЭ"],
+    "__source_sheet": [],
+}
+
+SUMMARY_METRICS = [
+    "total_rows", "total_cost", "total_area", "avg_cost",
+    "by_region", "by_sheet", "by_year", "top_builders_by_cost",
+]
+
+# Колонки сводки, которые читает каждая метрика
+METRIC_COLUMNS = {
+    "total_rows": [],
+    "total_cost": ["стоимость"],
+    "total_area": ["площадь"],
+    "avg_cost": ["стоимость"],
+    "by_region": ["регион"],
+    "by_sheet": ["__source_sheet"],
+    "by_year": ["дата начала строительства"],
+    "top_builders_by_cost": ["застройщик", "стоимость"],
+}
+
+def validate_metrics(metrics: List[str] | None) -> None:
+    unknown = [m for m in metrics or [] if m not in SUMMARY_METRICS]
+    if unknown:
+        raise ValueError(f"Неизвестные метрики: {', '.join(unknown)}")
+
+def summary_column_map(columns: List[str]) -> Dict[str, str]:
+    """Колонка сводки -> колонка таблицы; названия сравниваются без учёта регистра и пробелов по краям."""
+    normalized = {str(col).strip().lower(): col for col in columns}
+    result = {}
+    for name, aliases in SUMMARY_COLUMNS.items():
+        for alias in aliases + [name]:
+            if alias.lower() in normalized:
+                result[name] = normalized[alias.lower()]
+                break
+    return result
+
+def summary_source_columns(columns: List[str], metrics: List[str] | None, extra: List[str] | None = None) -> List[str]:
+    """Колонки таблицы, которые нужны запрошенным метрикам и column_stats, — для проекции."""
+    column_map = summary_column_map(columns)
+    needed = [column_map[name] for m in requested(SUMMARY_METRICS, metrics) for name in METRIC_COLUMNS[m] if name in column_map]
+    return list(dict.fromkeys(needed + list(extra or [])))
+
+# Частичные агрегаты, из которых собирается каждая метрика. Они складываются
+# между листами книги (merge_partials), поэтому сводку по книге можно собрать
+# из сводок листов, не склеивая сами листы
+METRIC_PARTS = {
+    "total_rows": ["rows"],
+    "total_cost": ["cost_sum"],
+    "total_area": ["area_sum"],
+    "avg_cost": ["cost_sum", "cost_count"],
+    "by_region": ["region_counts"],
+    "by_sheet": ["sheet_rows"],
+    "by_year": ["year_counts"],
+    "top_builders_by_cost": ["builder_costs"],
+}
+
+def partial_summary(df: pd.DataFrame, metrics: List[str] | None = None, sheet_name: str | None = None) -> Dict[str, Any]:
+    """Частичные агрегаты запрошенных метрик по строкам df (одного листа).
+
+    sheet_name — лист, которому принадлежат все строки; без него разбивка по
+    листам берётся из колонки __source_sheet, если она есть.
+    """
+    column_map = summary_column_map(list(df.columns))
+
+    def has(name: str) -> bool:
+        return name in column_map
+
+    def col(name: str) -> pd.Series:
+        return df[column_map[name]]
+
+    values = Lazy({
+        "costs": lambda v: numeric_values(col("стоимость")) if has("стоимость") else None,
+        "dates": lambda v: col("дата начала строительства") if has("дата начала строительства") else None,
+        "rows": lambda v: int(len(df)),
+        "cost_sum": lambda v: total(v["costs"]) if v["costs"] is not None else 0.0,
+        "cost_count": lambda v: non_null_count(v["costs"]) if v["costs"] is not None else 0,
+        "area_sum": lambda v: total(numeric_values(col("площадь"))) if has("площадь") else 0.0,
+        "region_counts": lambda v: appearance_counts(Factorized(col("регион"))) if has("регион") else {},
+        "sheet_rows": lambda v: ({sheet_name: v["rows"]} if v["rows"] else {}) if sheet_name
+            else appearance_counts(Factorized(col("__source_sheet"))) if has("__source_sheet") else {},
+        "year_counts": lambda v: appearance_counts(Factorized(v["dates"].dt.year.astype("Int64")))
+            if v["dates"] is not None and not v["dates"].isna().all() else {},
+        "builder_costs": lambda v: group_sums(Factorized(col("застройщик")), v["costs"])
+            if has("застройщик") and v["costs"] is not None else {},
+    })
+    parts = dict.fromkeys(part for m in requested(SUMMARY_METRICS, metrics) for part in METRIC_PARTS[m])
+    return values.evaluate(parts)
+
+def merge_partials(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Складывает частичные агрегаты: числа — суммой, счётчики по значениям — по ключам."""
+    merged: Dict[str, Any] = {}
+    for partial in partials:
+        for part, value in partial.items():
+            if isinstance(value, dict):
+                target = merged.setdefault(part, {})
+                for key, count in value.items():
+                    target[key] = target.get(key, 0) + count
+            else:
+                merged[part] = merged.get(part, 0) + value
+    return merged
+
+def _by_count(counts: Dict[Any, Any], limit: int | None = None) -> Dict[Any, Any]:
+    # По убыванию; равные — в порядке появления (счётчики частей хранятся в нём), как в value_counts
+    ranked = sorted(counts.items(), key=lambda item: -item[1])
+    return dict(ranked if limit is None else ranked[:limit])
+
+def _by_sum(sums: Dict[Any, float], limit: int) -> Dict[Any, float]:
+    # Равные суммы — по значению группы, как в top_sums
+    try:
+        ordered = sorted(sums.items())
+    except TypeError:
+        ordered = sorted(sums.items(), key=lambda item: str(item[0]))
+    return dict(sorted(ordered, key=lambda item: -item[1])[:limit])
+
+def finalize_summary(partial: Dict[str, Any], metrics: List[str] | None = None) -> Dict[str, Any]:
+    """Метрики сводки из (сложенных) частичных агрегатов."""
+    finalizers = {
+        "total_rows": lambda: partial["rows"],
+        "total_cost": lambda: float(partial["cost_sum"]),
+        "total_area": lambda: float(partial["area_sum"]),
+        # Среднее по пустой выборке — 0, а не NaN: ответ уходит в JSON
+        "avg_cost": lambda: partial["cost_sum"] / partial["cost_count"] if partial["cost_count"] else 0.0,
+        "by_region": lambda: _by_count(partial["region_counts"]),
+        "by_sheet": lambda: _by_count(partial["sheet_rows"]),
+        "by_year": lambda: _by_count(partial["year_counts"]),
+        "top_builders_by_cost": lambda: _by_sum(partial["builder_costs"], 5),
     }
+    return {name: finalizers[name]() for name in requested(SUMMARY_METRICS, metrics)}
+
+def compute_summary(
+    df: pd.DataFrame,
+    metrics: List[str] | None = None,
+    columns: List[str] | None = None
+) -> dict:
+    """Запрошенные метрики (None — все) и column_stats по колонкам columns.
+
+    Колонки сводки ищутся по summary_column_map, так что таблицу не нужно
+    переименовывать; достаточно колонок из summary_source_columns.
+    """
+    validate_columns(columns, list(df.columns))
+    summary = finalize_summary(partial_summary(df, metrics), metrics)
+    if columns:
+        summary["column_stats"] = {name: column_stats(df[name]) for name in columns}
+    return summary
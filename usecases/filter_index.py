@@ -0,0 +1,164 @@
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+from typing import Any, Iterable
+
+
+class _Postings:
+    """Инвертированный индекс колонки: для каждого значения — номера его строк.
+
+    Строки отсортированы по коду значения, поэтому строки одного значения
+    лежат подряд: order[offsets[code]:offsets[code + 1]]. Код 0 — пропуски.
+    """
+
+    def __init__(self, series: pd.Series, row_dtype: np.dtype):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            uniques = series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+
+        shifted = codes.astype(np.int64) + 1
+        counts = np.bincount(shifted, minlength=len(uniques) + 1)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.order = np.argsort(shifted, kind="stable").astype(row_dtype)
+        self.lookup = {value: code + 1 for code, value in enumerate(uniques.tolist())}
+
+    def rows(self, values: Iterable[Any], include_na: bool = False) -> np.ndarray:
+        codes = [self.lookup[v] for v in values if v in self.lookup]
+        if include_na:
+            codes.append(0)
+        if not codes:
+            return self.order[:0]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in codes])
+
+
+class _SortedIndex:
+    """Перестановка строк по возрастанию значения (без пропусков) для поиска диапазонов."""
+
+    def __init__(self, series: pd.Series, row_dtype: np.dtype):
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            values = series.to_numpy(dtype="datetime64[ns]").view("i8")
+            valid = ~np.isnat(series.to_numpy(dtype="datetime64[ns]"))
+        else:
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+            valid = ~np.isnan(values)
+
+        valid_rows = np.flatnonzero(valid)
+        order = valid_rows[np.argsort(values[valid_rows], kind="stable")]
+        self.order = order.astype(row_dtype)
+        self.values = values[order]
+
+    def rows(self, low: Any = None, high: Any = None) -> np.ndarray:
+        start = 0 if low is None else np.searchsorted(self.values, low, side="left")
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side="right")
+        return self.order[start:stop]
+
+
+class FilterIndex:
+    """Индексы одной таблицы для фильтрации без промежуточных копий.
+
+    Индекс колонки строится при первом обращении и переиспользуется
+    всеми следующими запросами к той же таблице.
+    """
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+        self._row_dtype = np.dtype(np.int32 if n_rows < 2 ** 31 else np.int64)
+        self._postings: dict[str, _Postings] = {}
+        self._sorted: dict[str, _SortedIndex] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supports_equality(series: pd.Series) -> bool:
+        # Для дат и дробных чисел pandas сравнивает со строками и NaN по своим правилам —
+        # такие колонки фильтруем обычным сравнением
+        dtype = series.dtype
+        return (
+            dtype == "object"
+            or isinstance(dtype, pd.CategoricalDtype)
+            or pd.api.types.is_bool_dtype(dtype)
+            or pd.api.types.is_integer_dtype(dtype)
+        )
+
+    @staticmethod
+    def supports_range(series: pd.Series) -> bool:
+        dtype = series.dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return True
+        return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+    def equals_mask(self, series: pd.Series, values: list, include_na: bool = False) -> np.ndarray:
+        postings = self._get(self._postings, series, _Postings)
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[postings.rows(values, include_na)] = True
+        return mask
+
+    def sorted_index(self, series: pd.Series) -> _SortedIndex:
+        """Строки колонки по возрастанию значения (order) и сами значения (values)."""
+        return self._get(self._sorted, series, _SortedIndex)
+
+    def range_mask(self, series: pd.Series, low: Any = None, high: Any = None) -> np.ndarray:
+        index = self.sorted_index(series)
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            low = None if low is None else low.value
+            high = None if high is None else high.value
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[index.rows(low, high)] = True
+        return mask
+
+    def _get(self, store: dict, series: pd.Series, builder):
+        index = store.get(series.name)
+        if index is None:
+            with self._lock:
+                index = store.get(series.name)
+                if index is None:
+                    index = builder(series, self._row_dtype)
+                    store[series.name] = index
+        return index
+
+
+# Индексы привязаны к объекту DataFrame из кэша и удаляются вместе с ним
+_indexes: dict[int, tuple[weakref.ref, FilterIndex]] = {}
+_indexes_lock = threading.Lock()
+
+def get_filter_index(df: pd.DataFrame) -> FilterIndex:
+    key = id(df)
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+
+        index = FilterIndex(len(df))
+        ref = weakref.ref(df, lambda _, key=key: _indexes.pop(key, None))
+        _indexes[key] = (ref, index)
+        return index
+
+
+def _dates_comparable(series: pd.Series, value: pd.Timestamp) -> bool:
+    # Сравнение дат с часовым поясом и без pandas отклоняет — такие случаи оставляем ему
+    return (getattr(series.dtype, "tz", None) is None) == (value.tz is None)
+
+def range_mask(index: FilterIndex, series: pd.Series, low: Any = None, high: Any = None) -> np.ndarray:
+    """Маска low <= series <= high (любая из границ может отсутствовать).
+
+    Окно находится двумя бинарными поисками по отсортированной колонке;
+    колонки, для которых индекса нет, сравниваются средствами pandas.
+    """
+    bounds = [b for b in (low, high) if b is not None]
+    if any(pd.isna(b) for b in bounds):
+        # Нераспознанная дата: сравнение с NaT не проходит ни одна строка
+        return np.zeros(len(series), dtype=bool)
+
+    if index.supports_range(series) and all(
+        not isinstance(b, pd.Timestamp) or _dates_comparable(series, b) for b in bounds
+    ):
+        return index.range_mask(series, low, high)
+
+    mask = np.ones(len(series), dtype=bool)
+    if low is not None:
+        mask &= (series >= low).to_numpy(dtype=bool)
+    if high is not None:
+        mask &= (series <= high).to_numpy(dtype=bool)
+    return mask
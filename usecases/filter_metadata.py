@@ -0,0 +1,218 @@
+import pandas as pd
+from typing import Any, Callable, Dict, List
+
+from usecases.csv_analyze_deals import FILTER_COLUMN_MAP
+
+# Метаданные фильтров строятся один раз при загрузке файла и хранятся рядом с ним.
+# По ним /filters_csv, /regions_csv и /get_excel_filters отвечают, не читая таблицу.
+
+
+def _sorted_values(values: List[Any]) -> List[Any]:
+    try:
+        return sorted(values)
+    except TypeError:
+        # Смешанные типы (число и строка) сравнить нельзя — сортируем по строковому виду
+        return sorted(values, key=str)
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+def describe_column(series: pd.Series) -> Dict[str, Any]:
+    non_null = series.dropna()
+    meta: Dict[str, Any] = {"non_null": int(len(non_null))}
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        meta["kind"] = "date"
+        meta["min"] = non_null.min().isoformat() if len(non_null) else None
+        meta["max"] = non_null.max().isoformat() if len(non_null) else None
+        return meta
+
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        meta["kind"] = "number"
+        meta["min"] = float(non_null.min()) if len(non_null) else None
+        meta["max"] = float(non_null.max()) if len(non_null) else None
+        return meta
+
+    counts = non_null.value_counts(sort=False)
+    counts = counts[counts > 0]
+    values = _sorted_values([_json_value(v) for v in counts.index.tolist()])
+    by_value = {_json_value(k): int(v) for k, v in counts.items()}
+
+    meta["kind"] = "select"
+    meta["values"] = values
+    meta["counts"] = [by_value[v] for v in values]
+    return meta
+
+def csv_filter_columns(columns: List[str]) -> List[str]:
+    result = [col for col in columns if "Регион" in col]
+    result += [col for col in columns if col.strip() == "Тип сделки"]
+    result += [col for col in FILTER_COLUMN_MAP.values() if col in columns]
+    return list(dict.fromkeys(result))
+
+def build_csv_metadata(df: pd.DataFrame) -> Dict[str, Any]:
+    columns = [str(c) for c in df.columns]
+    return {
+        "rows": int(len(df)),
+        "columns": columns,
+        "filters": {col: describe_column(df[col]) for col in csv_filter_columns(columns)},
+    }
+
+def _bound(meta: Dict[str, Any], key: str) -> Any:
+    value = meta[key]
+    if value is None:
+        return None
+    return pd.Timestamp(value) if meta["kind"] == "date" else value
+
+def update_column_meta(
+    meta: Dict[str, Any],
+    series: Callable[[], pd.Series],
+    removed: pd.Series,
+    added: pd.Series
+) -> Dict[str, Any]:
+    """Метаданные колонки после замены строк removed на added.
+
+    Считается только по изменённым строкам; вся колонка (series()) читается,
+    лишь если сменился тип или удалённое значение было границей диапазона.
+    """
+    removed_meta = describe_column(removed)
+    added_meta = describe_column(added)
+    if added_meta["kind"] != meta["kind"] or removed_meta["kind"] != meta["kind"]:
+        return describe_column(series())
+
+    non_null = meta["non_null"] - removed_meta["non_null"] + added_meta["non_null"]
+
+    if meta["kind"] == "select":
+        counts = dict(zip(meta["values"], meta["counts"]))
+        for value, count in zip(removed_meta["values"], removed_meta["counts"]):
+            counts[value] = counts.get(value, 0) - count
+        for value, count in zip(added_meta["values"], added_meta["counts"]):
+            counts[value] = counts.get(value, 0) + count
+        values = _sorted_values([v for v, c in counts.items() if c > 0])
+        return {"non_null": non_null, "kind": "select", "values": values, "counts": [counts[v] for v in values]}
+
+    # Граница ушла вместе с удалённой строкой — новую можно найти только по всей колонке
+    if removed_meta["non_null"] and meta["non_null"] and (
+        _bound(removed_meta, "min") <= _bound(meta, "min") or _bound(removed_meta, "max") >= _bound(meta, "max")
+    ):
+        return describe_column(series())
+
+    result = {"non_null": non_null, "kind": meta["kind"], "min": meta["min"], "max": meta["max"]}
+    if added_meta["non_null"]:
+        if meta["min"] is None or _bound(added_meta, "min") < _bound(meta, "min"):
+            result["min"] = added_meta["min"]
+        if meta["max"] is None or _bound(added_meta, "max") > _bound(meta, "max"):
+            result["max"] = added_meta["max"]
+    return result
+
+def update_csv_metadata(
+    meta: Dict[str, Any],
+    removed: pd.DataFrame,
+    added: pd.DataFrame,
+    load: Callable[[List[str] | None], pd.DataFrame]
+) -> Dict[str, Any]:
+    """Метаданные CSV после обновления строк (см. update_column_meta).
+
+    load(колонки) — колонки таблицы после обновления (None — вся таблица);
+    нужны, только если по изменённым строкам метаданные не пересчитать.
+    """
+    columns = [str(c) for c in added.columns]
+    if columns != meta["columns"]:
+        return build_csv_metadata(load(None))
+
+    filters = {}
+    for col in csv_filter_columns(columns):
+        column = lambda col=col: load([col])[col]
+        if col in meta["filters"]:
+            filters[col] = update_column_meta(meta["filters"][col], column, removed[col], added[col])
+        else:
+            filters[col] = describe_column(column())
+    return {**meta, "rows": int(meta["rows"] - len(removed) + len(added)), "filters": filters}
+
+def csv_filter_values(meta: Dict[str, Any], column: str | None) -> List[Any]:
+    if not column:
+        return []
+    return meta["filters"].get(column, {}).get("values", [])
+
+
+def _excel_region_column(sheet_name: str) -> str | None:
+    if sheet_name in ["Действующие", "Завершенные"]:
+        return "Регион"
+    if sheet_name in ["На модерации", "Отозванные"]:
+        return "Область"
+    return None
+
+def _excel_area_column(sheet_name: str) -> str | None:
+    if sheet_name in ["Действующие", "Завершенные"]:
+        return "Площадь, кв.м по Проекту"
+    if sheet_name in ["На модерации", "Отозванные"]:
+        return "Площадь"
+    return None
+
+def build_excel_filters(sheet_df: pd.DataFrame, sheet_name: str) -> Dict[str, Any]:
+    if sheet_df.empty:
+        return {"error": "Пустой лист"}
+
+    filters = {}
+
+    # Регион или Область
+    region_col = _excel_region_column(sheet_name)
+    if region_col and region_col in sheet_df.columns:
+        raw_values = sheet_df[region_col].dropna().unique().tolist()
+        filters["region"] = {
+            "type": "select",
+            "values": sorted([str(v) for v in raw_values])
+        }
+
+    # Застройщик
+    if "Застройщик" in sheet_df.columns:
+        devs = sheet_df["Застройщик"].dropna().unique().tolist()
+        filters["developer"] = {
+            "type": "select",
+            "values": sorted(devs)
+        }
+
+    # Площадь
+    area_col = _excel_area_column(sheet_name)
+    if area_col and area_col in sheet_df.columns:
+        area_vals = sheet_df[area_col].dropna()
+        if not area_vals.empty:
+            filters["area"] = {
+                "type": "range",
+                "min": float(area_vals.min()),
+                "max": float(area_vals.max())
+            }
+
+    # Период (только для Действующие и Завершённые)
+    if sheet_name in ["Действующие", "Завершенные"]:
+        date_start_col = "Дата начала строительства"
+        date_end_col = "Дата завершения 2"
+
+        if date_start_col in sheet_df.columns and date_end_col in sheet_df.columns:
+            valid_start = sheet_df[date_start_col].dropna()
+            valid_end = sheet_df[date_end_col].dropna()
+
+            if not valid_start.empty and not valid_end.empty:
+                filters["period"] = {
+                    "type": "date_range",
+                    "min": str(valid_start.min().date()),
+                    "max": str(valid_end.max().date())
+                }
+
+    return filters
+
+def build_excel_sheet_metadata(
+    sheet_df: pd.DataFrame,
+    sheet_name: str,
+    conversion: Dict[str, Any] | None = None
+) -> Dict[str, Any]:
+    meta = {"rows": int(len(sheet_df)), "filters": build_excel_filters(sheet_df, sheet_name)}
+    if conversion is not None:
+        meta["conversion"] = conversion
+    return meta
+
+def build_excel_metadata(sheets: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    return {"sheets": {name: build_excel_sheet_metadata(df, name) for name, df in sheets.items()}}
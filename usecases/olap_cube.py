@@ -0,0 +1,267 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, List
+
+from usecases.aggregation import Factorized, numeric_values, requested, top_sums, value_counts
+from usecases.csv_analyze_deals import (
+    FILTER_COLUMN_MAP, SUMMARY_METRICS, _count_flag, filter_mask, resolve_column_map, resolve_summary_region_col
+)
+from usecases.filter_metadata import csv_filter_columns
+
+# Куб: число сделок и сумма "Сумма" по всем сочетаниям колонок-измерений
+# (регион, статус, стадия, ответственный, воронка, тип сделки, флаги повторов)
+# и месяцу создания. Строится один раз при загрузке CSV; запросы, которым
+# хватает этих измерений, считаются по кубу, а не по всем строкам файла.
+
+DATE_DIMENSION = FILTER_COLUMN_MAP["from"]
+
+COUNT = "__count"
+AMOUNT_SUM = "__amount_sum"
+AMOUNT_COUNT = "__amount_count"
+FIRST_ROW = "__first_row"
+MEASURES = [COUNT, AMOUNT_SUM, AMOUNT_COUNT, FIRST_ROW]
+
+# Метрики, которые выражаются через измерения куба (компании в куб не входят)
+CUBE_METRICS = {
+    "total_deals", "total_amount", "avg_amount", "deals_by_stage", "deals_by_status",
+    "top_regions_by_sum", "top_regions_by_sum_note", "repeats", "recontacts", "deals_by_funnel",
+}
+
+# Метрики по компаниям: если колонки "Компания" в файле нет, они пустые и
+# тоже отвечаются без строк; иначе считаются по строкам
+COMPANY_METRICS = {"unique_companies", "top_companies_by_sum", "top_companies_by_count"}
+
+
+def cube_dimensions(df: pd.DataFrame) -> List[str]:
+    columns = [str(c) for c in df.columns]
+    dimensions = set(csv_filter_columns(columns)) - {FILTER_COLUMN_MAP["company"], FILTER_COLUMN_MAP["amount_min"]}
+    dimensions.discard(FILTER_COLUMN_MAP["to"])
+    if DATE_DIMENSION in dimensions and not pd.api.types.is_datetime64_dtype(df[DATE_DIMENSION].dtype):
+        # Месяц выделяем только из дат без часового пояса
+        dimensions.discard(DATE_DIMENSION)
+    # Порядок колонок как в файле: по нему выбирается колонка региона по умолчанию
+    return [col for col in columns if col in dimensions]
+
+def _month_start(series: pd.Series) -> pd.Series:
+    # Дата создания округляется до начала месяца
+    return series.dt.to_period("M").dt.start_time
+
+def build_cube(
+    df: pd.DataFrame,
+    positions: np.ndarray | None = None,
+    dimensions: List[str] | None = None
+) -> pd.DataFrame:
+    """Куб по строкам df; positions — номера строк в файле (по умолчанию 0..len-1)."""
+    dimensions = cube_dimensions(df) if dimensions is None else dimensions
+    keys = df[dimensions].reset_index(drop=True)
+    if DATE_DIMENSION in keys:
+        keys[DATE_DIMENSION] = _month_start(keys[DATE_DIMENSION])
+
+    rows = pd.Series(np.arange(len(df)) if positions is None else positions, index=keys.index)
+    measures = {COUNT: rows, FIRST_ROW: rows}
+    if "Сумма" in df:
+        amounts = pd.Series(numeric_values(df["Сумма"]), index=keys.index)
+        measures[AMOUNT_SUM] = amounts
+        measures[AMOUNT_COUNT] = amounts
+
+    if not dimensions:
+        # Без измерений куб — одна строка с итогами по всему файлу
+        keys["__all"] = 0
+
+    frame = pd.concat([keys, pd.DataFrame({f"{name}_src": s for name, s in measures.items()})], axis=1)
+    grouped = frame.groupby(list(keys.columns), dropna=False, observed=True, sort=False)
+    aggregations = {COUNT: (f"{COUNT}_src", "size"), FIRST_ROW: (f"{FIRST_ROW}_src", "min")}
+    if "Сумма" in df:
+        aggregations[AMOUNT_SUM] = (f"{AMOUNT_SUM}_src", "sum")
+        aggregations[AMOUNT_COUNT] = (f"{AMOUNT_COUNT}_src", "count")
+    cube = grouped.agg(**aggregations).reset_index()
+    return cube.drop(columns=["__all"], errors="ignore").sort_values(FIRST_ROW, ignore_index=True)
+
+def describe_cube(cube: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "rows": int(len(cube)),
+        "dimensions": [c for c in cube.columns if c not in MEASURES],
+        "measures": [c for c in cube.columns if c in MEASURES],
+    }
+
+
+def _first_rows(df: pd.DataFrame, groups: pd.DataFrame, dimensions: List[str]) -> pd.Series:
+    """Первая строка df в каждой из групп groups (по значениям измерений)."""
+    # Кандидаты отбираются по каждому измерению отдельно, месяц считается
+    # только для оставшихся строк; точное сочетание — группировкой кандидатов
+    candidates = np.ones(len(df), dtype=bool)
+    for col in dimensions:
+        if col != DATE_DIMENSION:
+            candidates &= df[col].isin(groups[col].unique()).to_numpy()
+    rows = np.flatnonzero(candidates)
+    keys = df[dimensions].iloc[rows].reset_index(drop=True)
+    if DATE_DIMENSION in keys:
+        keys[DATE_DIMENSION] = _month_start(keys[DATE_DIMENSION])
+    keys[FIRST_ROW] = rows
+
+    # Измерения сравниваем без категориального типа: у куба и df категории могут различаться
+    keys = keys.astype({col: object for col in dimensions})
+    groups = groups[dimensions].astype({col: object for col in dimensions})
+    first = keys.groupby(dimensions, dropna=False, sort=False)[FIRST_ROW].min().reset_index()
+    first = first.astype({col: object for col in dimensions})
+    return groups.merge(first, how="left", on=dimensions)[FIRST_ROW]
+
+def update_cube(
+    cube: pd.DataFrame,
+    removed: pd.DataFrame,
+    added: pd.DataFrame,
+    load: Callable[[List[str] | None], pd.DataFrame]
+) -> pd.DataFrame:
+    """Обновляет куб после замены строк, не пересчитывая его по всему файлу.
+
+    removed — прежние версии изменённых строк, added — новые версии и
+    вставленные строки; их индекс — номера строк в таблице после обновления.
+    Вклад removed вычитается, вклад added добавляется. load(колонки) —
+    колонки таблицы после обновления (None — вся таблица): по ним первую
+    строку группы ищем заново, только если она ушла из группы.
+    """
+    dimensions = [c for c in cube.columns if c not in MEASURES]
+    if dimensions != cube_dimensions(added):
+        # Состав измерений изменился (например, колонка сменила тип) — строим заново
+        return build_cube(load(None))
+
+    old = build_cube(removed, positions=removed.index.to_numpy(), dimensions=dimensions)
+    new = build_cube(added, positions=added.index.to_numpy(), dimensions=dimensions)
+    sums = [m for m in (COUNT, AMOUNT_SUM, AMOUNT_COUNT) if m in cube]
+    old[sums] = -old[sums]
+    # У вычитаемых строк первой строки нет; у добавленных отдельно запоминаем,
+    # чтобы понять, осталась ли прежняя первая строка в группе
+    no_row = np.iinfo(np.int64).max
+    old[FIRST_ROW] = no_row
+    new_first = f"{FIRST_ROW}_new"
+    parts = [cube.assign(**{new_first: no_row}), old.assign(**{new_first: no_row}), new.assign(**{new_first: new[FIRST_ROW]})]
+
+    combined = pd.concat(parts, ignore_index=True)
+    group_keys = dimensions or ["__all"]
+    if not dimensions:
+        combined["__all"] = 0
+    combined = combined.astype({col: object for col in dimensions})
+    aggregations = {m: (m, "sum") for m in sums}
+    aggregations[FIRST_ROW] = (FIRST_ROW, "min")
+    aggregations[new_first] = (new_first, "min")
+    merged = combined.groupby(group_keys, dropna=False, sort=False).agg(**aggregations).reset_index()
+    merged = merged[merged[COUNT] > 0].reset_index(drop=True)
+
+    stale = merged[FIRST_ROW].isin(removed.index) & (merged[new_first] != merged[FIRST_ROW])
+    if stale.any():
+        merged.loc[stale, FIRST_ROW] = _first_rows(load(dimensions), merged[stale], dimensions).to_numpy()
+
+    if AMOUNT_SUM in merged:
+        # Остаток вычитания дробных сумм у групп без сумм обнуляем
+        merged.loc[merged[AMOUNT_COUNT] == 0, AMOUNT_SUM] = 0.0
+
+    merged = merged.drop(columns=[new_first, "__all"], errors="ignore")
+    for col in dimensions:
+        dtype = added[col].dtype if col != DATE_DIMENSION else "datetime64[ns]"
+        merged[col] = merged[col].astype(dtype)
+    merged = merged.astype({m: "int64" for m in (COUNT, AMOUNT_COUNT, FIRST_ROW) if m in merged})
+    return merged[list(cube.columns)].sort_values(FIRST_ROW, ignore_index=True)
+
+
+def _is_month_start(value: Any) -> bool:
+    parsed = pd.to_datetime(value, errors="coerce")
+    return (
+        isinstance(parsed, pd.Timestamp)
+        and parsed is not pd.NaT
+        and parsed.tz is None
+        and parsed == parsed.to_period("M").start_time
+    )
+
+def cube_metrics(columns: List[str]) -> set:
+    return CUBE_METRICS | (COMPANY_METRICS if "Компания" not in columns else set())
+
+def _filters_answerable(cube_meta: Dict[str, Any], columns: List[str], filters: Dict[str, Any]) -> bool:
+    """Отбирают ли фильтры по кубу ровно те же сделки, что и по строкам.
+
+    Фильтр "to" (дата завершения) всегда уводит к расчёту по строкам: месяц
+    завершения как ещё одно измерение размножил бы строки куба почти до
+    числа сделок. "from" — только с началом месяца (месяц создания в кубе).
+    """
+    dimensions = set(cube_meta["dimensions"])
+    column_map = resolve_column_map(columns, filters)
+    for key, value in filters.items():
+        if key == "region_col" or value in [None, '', [], {}]:
+            continue
+        column = column_map.get(key)
+        if column not in columns:
+            # Фильтр по отсутствующей колонке пропускается и при построчном расчёте
+            continue
+        if column not in dimensions:
+            return False
+        if key == "from" and not _is_month_start(value):
+            return False
+
+    region_col = filters.get("region_col")
+    if region_col and region_col in columns and region_col not in dimensions:
+        return False
+    return True
+
+def split_metrics(
+    cube_meta: Dict[str, Any],
+    columns: List[str],
+    filters: Dict[str, Any],
+    metrics: List[str] | None
+) -> tuple[List[str], List[str]]:
+    """Запрошенные метрики (None — все): считаемые по кубу и остальные.
+
+    Сводка по умолчанию у файла с компаниями делится: метрики по компаниям
+    считаются по строкам, остальные — по кубу.
+    """
+    wanted = requested(SUMMARY_METRICS, metrics)
+    if not _filters_answerable(cube_meta, columns, filters):
+        return [], wanted
+    available = cube_metrics(columns)
+    return [m for m in wanted if m in available], [m for m in wanted if m not in available]
+
+def can_answer(cube_meta: Dict[str, Any], columns: List[str], filters: Dict[str, Any], metrics: List[str] | None) -> bool:
+    """Можно ли посчитать сводку по кубу целиком, не читая строки файла."""
+    from_cube, rest = split_metrics(cube_meta, columns, filters, metrics)
+    return bool(from_cube) and not rest
+
+def summary_from_cube(cube: pd.DataFrame, filters: Dict[str, Any], metrics: List[str] | None) -> dict:
+    """Сводка compute_summary по строкам куба, прошедшим фильтры.
+
+    metrics — считаемые по кубу метрики из split_metrics.
+
+    Фильтры применяются к кубу тем же filter_mask: значения измерений в нём
+    те же, что в файле, а дата создания округлена до месяца, поэтому фильтр
+    "from" с началом месяца отбирает ровно те же сделки.
+    """
+    mask = filter_mask(cube, filters)
+    cube = cube[mask] if not mask.all() else cube
+    weights = cube[COUNT].to_numpy()
+    positions = cube[FIRST_ROW].to_numpy()
+    has_amounts = AMOUNT_SUM in cube
+    amount_sums = cube[AMOUNT_SUM].to_numpy() if has_amounts else None
+    amount_count = int(cube[AMOUNT_COUNT].sum()) if has_amounts else 0
+    region_col = resolve_summary_region_col(cube, filters)
+
+    def column(name: str) -> Factorized:
+        return Factorized(cube[name], weights=weights, positions=positions)
+
+    def amount_total() -> float:
+        return float(amount_sums.sum()) if amount_count else 0.0
+
+    calculators = {
+        "total_deals": lambda: int(weights.sum()),
+        "total_amount": amount_total,
+        "avg_amount": lambda: amount_total() / amount_count if amount_count else 0.0,
+        "deals_by_stage": lambda: value_counts(column("Стадия сделки")) if "Стадия сделки" in cube else {},
+        "deals_by_status": lambda: value_counts(column("Текущий статус")) if "Текущий статус" in cube else {},
+        "top_regions_by_sum": lambda: top_sums(column(region_col), amount_sums, 5) if region_col in cube.columns and has_amounts else {},
+        "top_regions_by_sum_note": lambda: {"region_col": region_col} if region_col else None,
+        "repeats": lambda: _count_flag(cube["Повторная сделка"], weights) if "Повторная сделка" in cube else 0,
+        "recontacts": lambda: _count_flag(cube["Повторное обращение"], weights) if "Повторное обращение" in cube else 0,
+        "deals_by_funnel": lambda: value_counts(column("Воронка")) if "Воронка" in cube else {},
+        # Только для файлов без колонки "Компания" (см. cube_metrics)
+        "unique_companies": lambda: 0,
+        "top_companies_by_sum": lambda: {},
+        "top_companies_by_count": lambda: {},
+    }
+    # Порядок метрик — как в compute_summary
+    return {name: calculators[name]() for name in requested(SUMMARY_METRICS, metrics)}
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List
+
+from usecases.aggregation import numeric_values
+from usecases.csv_analyze_deals import filter_mask
+from usecases.filter_index import get_filter_index
+from usecases.olap_cube import AMOUNT_SUM, COUNT, DATE_DIMENSION
+
+# Динамика сделок: число сделок и сумма "Сумма" по дням, неделям или месяцам
+# даты создания. Строки берутся в порядке отсортированного индекса даты (он же
+# отвечает на фильтры from/to), границы периодов находятся бинарным поиском —
+# таблица не сортируется и не группируется заново для каждого графика.
+# Помесячную динамику с фильтрами по измерениям куба считаем по кубу.
+
+TREND_DATE_COLUMN = DATE_DIMENSION
+
+# Частоты периодов pandas; неделя начинается с понедельника
+TREND_BUCKETS = {"day": "D", "week": "W-SUN", "month": "M"}
+
+
+def validate_bucket(bucket: str) -> None:
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"Период: {', '.join(TREND_BUCKETS)}")
+
+def _bucket_edges(first: pd.Timestamp, last: pd.Timestamp, bucket: str) -> pd.DatetimeIndex:
+    """Начала периодов от периода first до периода last и начало следующего за ним."""
+    freq = TREND_BUCKETS[bucket]
+    periods = pd.period_range(first.to_period(freq), last.to_period(freq) + 1, freq=freq)
+    return pd.DatetimeIndex(periods.start_time)
+
+def _trend(bucket: str, starts: pd.DatetimeIndex, counts: np.ndarray, sums: np.ndarray, no_date: int) -> Dict[str, Any]:
+    # Пустые периоды внутри диапазона остаются в ответе с нулями — ось графика непрерывна
+    points: List[Dict[str, Any]] = [
+        {"period": start.date().isoformat(), "deals": int(count), "amount": float(amount)}
+        for start, count, amount in zip(starts, counts, sums)
+    ]
+    return {
+        "bucket": bucket,
+        "date_col": TREND_DATE_COLUMN,
+        "total_deals": int(counts.sum()) + no_date,
+        "no_date": no_date,
+        "points": points,
+    }
+
+def compute_trend(df: pd.DataFrame, filters: Dict[str, Any], bucket: str) -> Dict[str, Any]:
+    if TREND_DATE_COLUMN not in df or not pd.api.types.is_datetime64_dtype(df[TREND_DATE_COLUMN].dtype):
+        raise ValueError(f"Нет колонки дат '{TREND_DATE_COLUMN}'")
+
+    mask = filter_mask(df, filters)
+    dates_index = get_filter_index(df).sorted_index(df[TREND_DATE_COLUMN])
+    selected = mask[dates_index.order]
+    rows = dates_index.order[selected]
+    dates = dates_index.values[selected]
+    no_date = int(np.count_nonzero(mask)) - len(rows)
+    if not len(rows):
+        return _trend(bucket, pd.DatetimeIndex([]), np.zeros(0, dtype=np.int64), np.zeros(0), no_date)
+
+    if "Сумма" in df:
+        amounts = numeric_values(df["Сумма"])[rows].astype(np.float64)
+        amounts[np.isnan(amounts)] = 0.0
+    else:
+        amounts = np.zeros(len(rows))
+
+    edges = _bucket_edges(pd.Timestamp(dates[0]), pd.Timestamp(dates[-1]), bucket)
+    # Даты отсортированы: строки периода лежат подряд между двумя границами
+    bounds = np.searchsorted(dates, edges.to_numpy(dtype="datetime64[ns]").view("i8"), side="left")
+    counts = np.diff(bounds)
+    sums = np.add.reduceat(amounts, np.minimum(bounds[:-1], len(amounts) - 1))
+    sums[counts == 0] = 0.0
+    return _trend(bucket, edges[:-1], counts, sums, no_date)
+
+def trend_from_cube(cube: pd.DataFrame, filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Помесячная динамика по кубу: месяц создания — одно из его измерений."""
+    mask = filter_mask(cube, filters)
+    cube = cube[mask] if not mask.all() else cube
+    dated = cube[DATE_DIMENSION].notna()
+    no_date = int(cube.loc[~dated, COUNT].sum())
+    cube = cube[dated]
+    if cube.empty:
+        return _trend("month", pd.DatetimeIndex([]), np.zeros(0, dtype=np.int64), np.zeros(0), no_date)
+
+    measures = [COUNT] + ([AMOUNT_SUM] if AMOUNT_SUM in cube else [])
+    by_month = cube.groupby(DATE_DIMENSION)[measures].sum()
+    starts = _bucket_edges(by_month.index.min(), by_month.index.max(), "month")[:-1]
+    by_month = by_month.reindex(starts, fill_value=0)
+    sums = by_month[AMOUNT_SUM].to_numpy(dtype=np.float64) if AMOUNT_SUM in by_month else np.zeros(len(by_month))
+    return _trend("month", starts, by_month[COUNT].to_numpy(), sums, no_date)